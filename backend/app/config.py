@@ -0,0 +1,114 @@
+"""
+Runtime configuration for AI-Swap backend, read from environment variables
+"""
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer environment variable, falling back to default"""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float environment variable, falling back to default"""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+# File storage
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+RESULTS_DIR = os.getenv("RESULTS_DIR", "results")
+TEMPLATES_DIR = os.getenv("TEMPLATES_DIR", "templates")
+MAX_FILE_SIZE = _env_int("MAX_FILE_SIZE", 10 * 1024 * 1024)
+RESULTS_ACCEL_REDIRECT = os.getenv("RESULTS_ACCEL_REDIRECT", "")  # e.g. "/_results/" to let nginx send result files
+
+# Storage backend for uploads, results and template images
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")  # "local" (the directories above) or "s3"
+S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "")  # e.g. http://minio:9000; empty = AWS
+AWS_REGION = os.getenv("AWS_REGION", "")
+S3_MAX_CONNECTIONS = _env_int("S3_MAX_CONNECTIONS", 32)  # pooled connections per worker
+S3_MULTIPART_THRESHOLD = _env_int("S3_MULTIPART_THRESHOLD", 8 * 1024 * 1024)
+S3_MULTIPART_CHUNKSIZE = _env_int("S3_MULTIPART_CHUNKSIZE", 8 * 1024 * 1024)
+STORAGE_CACHE_DIR = os.getenv("STORAGE_CACHE_DIR", "storage_cache")  # local copies of hot S3 objects
+STORAGE_CACHE_BYTES = _env_int("STORAGE_CACHE_BYTES", 512 * 1024 * 1024)
+STORAGE_ATIME_RESOLUTION = _env_int("STORAGE_ATIME_RESOLUTION", 3600)  # seconds; reads refresh atime at most this often
+
+# Retention of uploads and results (the janitor deletes by last access)
+JANITOR_ENABLED = _env_int("JANITOR_ENABLED", 1)  # periodic sweeps inside the API workers
+JANITOR_INTERVAL = _env_int("JANITOR_INTERVAL", 3600)  # seconds between sweeps, shared by all workers on a host
+JANITOR_LOCK_FILE = os.getenv("JANITOR_LOCK_FILE", os.path.join(UPLOAD_DIR, ".janitor.lock"))
+JANITOR_TEMP_AGE = _env_int("JANITOR_TEMP_AGE", 3600)  # partial writes older than this are removed
+JANITOR_LOW_WATERMARK = _env_float("JANITOR_LOW_WATERMARK", 0.9)  # quota eviction stops at this fraction
+JANITOR_RECONCILE_INTERVAL = _env_int("JANITOR_RECONCILE_INTERVAL", 24 * 3600)  # full walks; other sweeps read the index
+UPLOAD_TTL = _env_int("UPLOAD_TTL", 7 * 24 * 3600)  # delete uploads unused this long; 0 = keep forever
+RESULT_TTL = _env_int("RESULT_TTL", 7 * 24 * 3600)
+UPLOAD_MAX_BYTES = _env_int("UPLOAD_MAX_BYTES", 0)  # evict least recently used uploads above this; 0 = no quota
+RESULT_MAX_BYTES = _env_int("RESULT_MAX_BYTES", 0)
+
+# Sessions and the stored-object index (SQLite, shared by all workers on a host)
+SESSION_INDEX_PATH = os.getenv("SESSION_INDEX_PATH", "sessions.db")
+SESSION_COOKIE = os.getenv("SESSION_COOKIE", "ai_swap_session")  # also accepted as the X-Session-Id header
+SESSION_TTL = _env_int("SESSION_TTL", 30 * 24 * 3600)  # idle sessions are dropped from the index; 0 = keep
+
+# Result encoding (the Accept header may pick webp or avif per request)
+RESULT_FORMAT = os.getenv("RESULT_FORMAT", "jpeg")  # default when Accept names no image type
+RESULT_JPEG_QUALITY = _env_int("RESULT_JPEG_QUALITY", 90)
+RESULT_WEBP_QUALITY = _env_int("RESULT_WEBP_QUALITY", 80)
+RESULT_AVIF_QUALITY = _env_int("RESULT_AVIF_QUALITY", 60)  # used only if OpenCV was built with AVIF
+
+# Compute executor (image work is kept off the event loop)
+COMPUTE_EXECUTOR = os.getenv("COMPUTE_EXECUTOR", "thread")  # "thread" or "process"
+COMPUTE_MAX_WORKERS = _env_int("COMPUTE_MAX_WORKERS", min(4, os.cpu_count() or 1))
+COMPUTE_MAX_QUEUE = _env_int("COMPUTE_MAX_QUEUE", 16)
+COMPUTE_RETRY_AFTER = _env_int("COMPUTE_RETRY_AFTER", 2)
+BATCH_BUSY_WAIT = _env_float("BATCH_BUSY_WAIT", 30)  # seconds a batch target waits for compute capacity before failing with 503
+
+# Background swap jobs
+JOB_STORE = os.getenv("JOB_STORE", "sqlite")  # "memory", "sqlite" or "redis"
+JOB_SQLITE_PATH = os.getenv("JOB_SQLITE_PATH", "jobs.db")
+JOB_REDIS_URL = os.getenv("JOB_REDIS_URL", "redis://localhost:6379/0")
+JOB_TTL = _env_int("JOB_TTL", 3600)  # seconds a finished job stays queryable
+JOB_STALE_TIMEOUT = _env_int("JOB_STALE_TIMEOUT", 900)  # unfinished jobs with no update for this long are failed
+JOB_MAX_PENDING = _env_int("JOB_MAX_PENDING", 256)
+JOB_POLL_INTERVAL = _env_float("JOB_POLL_INTERVAL", 0.5)
+
+# Face detection
+DETECTION_CACHE_SIZE = _env_int("DETECTION_CACHE_SIZE", 256)  # cached uploads per worker
+SOURCE_CACHE_BYTES = _env_int("SOURCE_CACHE_BYTES", 128 * 1024 * 1024)  # decoded uploads per worker; 0 disables
+DETECTION_MAX_EDGE = _env_int("DETECTION_MAX_EDGE", 640)  # 0 runs the cascade at full resolution
+DETECTION_CHAIN = os.getenv("DETECTION_CHAIN", "")  # backends tried in order: skin, haar, yunet, ssd; empty = haar, plus yunet if its model exists
+DETECTION_MIN_CONFIDENCE = _env_float("DETECTION_MIN_CONFIDENCE", 0.6)  # below this, fall through to the next detector; Haar scores are a heuristic, not a probability
+DETECTION_YUNET_MODEL = os.getenv("DETECTION_YUNET_MODEL", "models/face_detection_yunet_2023mar.onnx")
+DETECTION_SSD_MODEL = os.getenv("DETECTION_SSD_MODEL", "models/res10_300x300_ssd_iter_140000.caffemodel")
+DETECTION_SSD_CONFIG = os.getenv("DETECTION_SSD_CONFIG", "models/deploy.prototxt")
+DETECTION_MAX_FACES = _env_int("DETECTION_MAX_FACES", 16)  # faces kept per upload, best ranked first
+LANDMARK_MODEL = os.getenv("LANDMARK_MODEL", "box")  # "box" (from the face box) or "lbf" (68 points)
+LANDMARK_LBF_MODEL = os.getenv("LANDMARK_LBF_MODEL", "models/lbfmodel.yaml")
+
+# Template images
+TEMPLATE_CACHE_BYTES = _env_int("TEMPLATE_CACHE_BYTES", 64 * 1024 * 1024)
+TEMPLATE_PRELOAD = _env_int("TEMPLATE_PRELOAD", 1)  # decode all templates at startup
+TEMPLATE_PACK = _env_int("TEMPLATE_PACK", 0)  # serve templates from a shared memory-mapped pack
+TEMPLATE_PACK_DIR = os.getenv("TEMPLATE_PACK_DIR", os.path.join(TEMPLATES_DIR, ".pack"))
+
+# Request profiler (off unless PROFILER_ENABLED=1)
+PROFILER_ENABLED = _env_int("PROFILER_ENABLED", 0)
+PROFILER_SAMPLE_RATE = _env_float("PROFILER_SAMPLE_RATE", 0.01)  # fraction of requests profiled
+PROFILER_SLOW_MS = _env_float("PROFILER_SLOW_MS", 0)  # also keep any request slower than this; 0 = off
+PROFILER_INTERVAL_MS = _env_float("PROFILER_INTERVAL_MS", 5)
+PROFILER_DIR = os.getenv("PROFILER_DIR", "profiles")
+PROFILER_MAX_FILES = _env_int("PROFILER_MAX_FILES", 100)  # oldest profiles are deleted beyond this
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # required as X-Admin-Token on admin routes; unset disables them
@@ -1,15 +1,31 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import Cookie, Depends, FastAPI, Header, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
 import os
 import json
+import asyncio
+import hmac
+from email.utils import formatdate
 from pathlib import Path
+from typing import List, Literal, Optional
 
 # Import services
-from app.services.face_service import FaceService
-from app.services.template_service import TemplateService
-from app.models.schemas import UploadResponse, SwapRequest, SwapResponse
+from app.services.face_service import FaceSelectionError, FaceService, UploadNotFoundError
+from app.services.template_service import TemplateService, CachedPayload
+from app.services.job_service import JobService
+from app.services.janitor import create_janitor
+from app.services.session_index import (
+    SessionAssetRecord, get_session_index, is_session_id, new_session_id, result_asset, upload_asset
+)
+from app.services.upload_ingest import UploadIngestor, UploadRejectedError
+from app.utils import encoding, metrics, profiler, result_files
+from app.models.schemas import (
+    AnalyticsData, UploadResponse, DetectedFace, SwapRequest, SwapResponse, BatchSwapRequest, ProcessingStatus, JobSubmitResponse,
+    SessionResponse
+)
+from app.utils.executor import ComputeBusyError, get_compute_executor
+from app import config
 
 app = FastAPI(
     title="AI-Swap API",
@@ -32,6 +48,45 @@ app.mount("/static", StaticFiles(directory="frontend/static"), name="static")
 # Initialize services
 face_service = FaceService()
 template_service = TemplateService()
+job_service = JobService()
+upload_ingestor = UploadIngestor(face_service.uploads_dir, max_size=config.MAX_FILE_SIZE)
+result_etags = result_files.ContentHashCache()
+storage_janitor = create_janitor(face_service.storage)
+session_index = get_session_index()
+metrics.register_runtime_gauges(
+    face_service.executor, job_service, face_service.template_cache, face_service.detector,
+    face_service.source_cache
+)
+profiler.install(app, face_service.executor)
+
+@app.exception_handler(ComputeBusyError)
+async def compute_busy_handler(request: Request, exc: ComputeBusyError):
+    """Apply backpressure when the compute executor is saturated"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.on_event("startup")
+async def preload_templates():
+    """Decode templates before the first swap needs them"""
+    if config.TEMPLATE_PRELOAD:
+        await template_service.preload_templates()
+
+@app.on_event("startup")
+async def start_janitor():
+    """Sweep expired and over-quota uploads and results in the background"""
+    if config.JANITOR_ENABLED:
+        storage_janitor.start()
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    """Stop background jobs, the janitor and compute executor workers"""
+    await storage_janitor.stop()
+    await job_service.shutdown()
+    session_index.close()
+    get_compute_executor().shutdown(wait=False)
 
 @app.get("/")
 async def root():
@@ -46,7 +101,8 @@ async def root():
             "docs": "/docs",
             "professions": "/professions",
             "upload": "/upload",
-            "swap": "/swap-face"
+            "swap": "/swap-face",
+            "sessions": "/sessions/{session_id}"
         }
     }
 
@@ -64,82 +120,413 @@ async def test():
     """Simple test endpoint"""
     return {"message": "API is working!", "test": "success"}
 
+def cached_json_response(request: Request, payload: CachedPayload) -> Response:
+    """Serve a pre-serialized JSON body, answering revalidation with 304"""
+    headers = {
+        "ETag": payload.etag,
+        "Last-Modified": payload.last_modified,
+        "Cache-Control": "public, no-cache"
+    }
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if result_files.etag_matches(if_none_match, payload.etag):
+            return Response(status_code=304, headers=headers)
+    elif request.headers.get("if-modified-since") == payload.last_modified:
+        return Response(status_code=304, headers=headers)
+    
+    return Response(content=payload.body, media_type="application/json", headers=headers)
+
+async def get_session_id(
+    x_session_id: Optional[str] = Header(None),
+    session_cookie: Optional[str] = Cookie(None, alias=config.SESSION_COOKIE)
+) -> Optional[str]:
+    """Get the client's session from the X-Session-Id header or session cookie"""
+    if x_session_id is not None:
+        if not is_session_id(x_session_id):
+            raise HTTPException(status_code=400, detail="Invalid session ID")
+        return x_session_id
+    # A malformed cookie is ignored; uploads then start a new session
+    return session_cookie if is_session_id(session_cookie) else None
+
+async def record_session(session_id: Optional[str], assets: List[SessionAssetRecord]):
+    """Add uploads/results to a session; bookkeeping never fails the request"""
+    if session_id is None or not assets:
+        return
+    try:
+        await session_index.arecord_assets(session_id, assets)
+    except Exception as e:
+        print(f"Error recording session assets: {str(e)}")
+
+async def require_admin(x_admin_token: str = Header("")):
+    """Check the admin token; admin routes are refused when none is configured"""
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin routes are disabled (ADMIN_TOKEN is not set)")
+    if not hmac.compare_digest(x_admin_token.encode(), config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+async def require_template(profession: str, angle: str):
+    """Reject a profession/angle pair that is not in the template metadata"""
+    if not await template_service.has_template(profession, angle):
+        raise HTTPException(status_code=400, detail=f"Unknown template: {profession}/{angle}")
+
 @app.get("/professions")
-async def get_professions():
+async def get_professions(request: Request):
     """Get available professions"""
     try:
-        professions = template_service.get_available_professions()
-        return {"professions": professions}
+        payload = await template_service.get_professions_payload()
+        return cached_json_response(request, payload)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/templates/{profession}")
-async def get_templates(profession: str):
+async def get_templates(profession: str, request: Request):
     """Get templates for a specific profession"""
-    try:
-        templates = template_service.get_templates_for_profession(profession)
-        return {"profession": profession, "templates": templates}
-    except Exception as e:
+    payload = await template_service.get_templates_payload(profession)
+    if payload is None:
         raise HTTPException(status_code=404, detail=f"Profession {profession} not found")
+    return cached_json_response(request, payload)
+
+@app.post("/templates/reload", dependencies=[Depends(require_admin)])
+async def reload_templates():
+    """Reload template metadata and drop decoded templates"""
+    professions = await template_service.reload()
+    return {"message": "Templates reloaded", "professions": professions}
 
-@app.post("/upload", response_model=UploadResponse)
-async def upload_image(file: UploadFile = File(...)):
-    """Upload user image for face swapping"""
+@app.post(
+    "/upload",
+    response_model=UploadResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                        "required": ["file"]
+                    }
+                }
+            }
+        }
+    }
+)
+async def upload_image(request: Request, response: Response, session_id: Optional[str] = Depends(get_session_id)):
+    """Upload user image for face swapping
+    
+    The body is streamed to disk; unsupported formats, out-of-range
+    dimensions and oversized files are rejected before it is fully read.
+    The upload is recorded in the caller's session (X-Session-Id header or
+    session cookie); without one a new session is started and returned.
+    """
     try:
-        # Validate file type
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
-        
-        # Validate file size (10MB max)
-        if file.size > 10 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File size must be less than 10MB")
+        upload = await upload_ingestor.ingest(request)
+    except UploadRejectedError as e:
+        metrics.UPLOADS.labels(outcome="rejected").inc()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    try:
+        result = await face_service.process_ingested_upload(upload)
         
-        # Save uploaded file
-        upload_path = face_service.save_uploaded_image(file)
+        session_id = session_id or new_session_id()
+        await record_session(session_id, [upload_asset(result["image_id"], result["file_path"], upload.filename)])
+        response.headers["X-Session-Id"] = session_id
+        response.set_cookie(
+            config.SESSION_COOKIE, session_id, max_age=config.SESSION_TTL or None, httponly=True, samesite="lax"
+        )
         
         return UploadResponse(
             message="Image uploaded successfully",
-            file_path=upload_path,
-            file_name=file.filename
+            file_path=result["file_path"],
+            file_name=upload.filename or os.path.basename(result["file_path"]),
+            image_id=result["image_id"],
+            face_detected=result["face_detected"],
+            confidence=result["confidence"],
+            landmarks=result["landmarks"].to_schema() if result["landmarks"] is not None else None,
+            faces=[
+                DetectedFace(index=index, face_box=face["face_box"], confidence=face["confidence"])
+                for index, face in enumerate(result["faces"])
+            ],
+            session_id=session_id
         )
+    except ComputeBusyError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        upload.discard()
 
 @app.post("/swap-face", response_model=SwapResponse)
-async def swap_face(request: SwapRequest):
-    """Perform face swapping with uploaded image and template"""
+async def swap_face(
+    request: SwapRequest,
+    response: Response,
+    async_mode: bool = Query(False, alias="async"),
+    inline: bool = Query(False),
+    accept: Optional[str] = Header(None),
+    session_id: Optional[str] = Depends(get_session_id)
+):
+    """Perform face swapping with uploaded image and template
+    
+    The result format (JPEG, WebP, or AVIF where available) is negotiated
+    from the Accept header. With ?inline=1 the encoded image is returned as
+    the response body instead of being stored under /results.
+    With ?async=1 the swap runs as a background job and a job ID is returned
+    immediately; poll /jobs/{job_id} or stream /jobs/{job_id}/events.
+    Stored results are recorded in the caller's session, if it sent one.
+    """
     try:
         # Validate input
         if not request.image_path or not request.profession:
             raise HTTPException(status_code=400, detail="Image path and profession are required")
+        if inline and (async_mode or request.face_index == "all"):
+            raise HTTPException(status_code=400, detail="inline returns one image; it cannot be combined with async or face_index=all")
         
-        # Perform face swapping
-        result_path = face_service.perform_face_swap(
-            request.image_path,
+        angle = request.angle or "front"
+        await require_template(request.profession, angle)
+        image_id = face_service.resolve_image_id(request.image_path)
+        output_format = encoding.negotiate(accept)
+        
+        if async_mode:
+            async def run_swap(progress):
+                result = await face_service.swap_face(
+                    image_id, request.profession, angle,
+                    color=request.color, accessories=request.accessories,
+                    blend_mode=request.blend_mode or "feather", face_index=request.face_index,
+                    progress=progress, output_format=output_format.name
+                )
+                await record_session(session_id, [result_asset(entry) for entry in result["results"]])
+                return result["result_url"]
+            
+            job_id = await job_service.submit(run_swap, retry_after=get_compute_executor().retry_after)
+            return JSONResponse(
+                status_code=202,
+                content=JobSubmitResponse(
+                    job_id=job_id,
+                    status="pending",
+                    status_url=f"/jobs/{job_id}",
+                    events_url=f"/jobs/{job_id}/events"
+                ).model_dump()
+            )
+        
+        # Perform face swapping on the compute executor
+        result = await face_service.swap_face(
+            image_id,
             request.profession,
-            request.angle or "front"
+            angle,
+            color=request.color,
+            accessories=request.accessories,
+            blend_mode=request.blend_mode or "feather",
+            face_index=request.face_index,
+            output_format=output_format.name,
+            inline=inline
         )
         
+        if inline:
+            return Response(
+                content=result["content"],
+                media_type=output_format.media_type,
+                headers={
+                    "Vary": "Accept",
+                    "X-Result-Id": result["result_id"],
+                    "X-Face-Index": str(result["face_index"])
+                }
+            )
+        
+        await record_session(session_id, [result_asset(entry) for entry in result["results"]])
+        response.headers["Vary"] = "Accept"
         return SwapResponse(
             message="Face swap completed successfully",
-            result_path=result_path,
+            result_path=result["result_url"],
             profession=request.profession,
-            angle=request.angle or "front"
+            angle=angle,
+            face_index=result["face_index"],
+            result_paths=[entry["result_url"] for entry in result["results"]] if request.face_index == "all" else None,
+            format=output_format.name
         )
+    except (HTTPException, ComputeBusyError):
+        raise
+    except UploadNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except FaceSelectionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/results/{filename}")
-async def get_result(filename: str):
-    """Get a specific result image"""
+@app.post("/swap-face/batch")
+async def swap_face_batch(
+    request: BatchSwapRequest,
+    accept: Optional[str] = Header(None),
+    session_id: Optional[str] = Depends(get_session_id)
+):
+    """Swap one uploaded image into many templates
+    
+    Results are streamed as NDJSON, one line per target in completion order:
+    {"index", "profession", "angle", "status", "result_url", "result_id", "format"[, "error", "status_code"]}
+    Failed targets carry the status /swap-face would have returned, e.g.
+    400 for a face_index that names no detected face, or 503 (with
+    "retry_after") when no compute capacity freed up within BATCH_BUSY_WAIT.
+    Every result uses the format negotiated from the Accept header, and
+    completed results are recorded in the caller's session, if it sent one.
+    """
+    for target in request.targets:
+        await require_template(target.profession, target.angle or "front")
+    
+    image_id = face_service.resolve_image_id(request.image_path)
+    if not await face_service.storage.aexists(face_service.upload_key(image_id)):
+        raise HTTPException(status_code=404, detail="Original image not found")
+    
+    output_format = encoding.negotiate(accept)
+    
+    async def stream_results():
+        targets = [target.model_dump() for target in request.targets]
+        async for entry in face_service.swap_face_batch(image_id, targets, output_format.name):
+            if entry["status"] == "completed":
+                await record_session(session_id, [result_asset(entry)])
+            yield json.dumps(entry) + "\n"
+    
+    return StreamingResponse(
+        stream_results(),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no", "Vary": "Accept"}
+    )
+
+@app.get("/jobs/{job_id}", response_model=ProcessingStatus)
+async def get_job(job_id: str):
+    """Get the status of a background swap job"""
+    status = await job_service.get_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str):
+    """Stream job progress as server-sent events until it finishes"""
+    if await job_service.get_status(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return StreamingResponse(
+        job_service.stream_events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/sessions/{session_id}", response_model=SessionResponse)
+async def get_session(
+    session_id: str,
+    kind: Optional[Literal["upload", "result"]] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[int] = Query(None, ge=1)
+):
+    """List a session's uploads and results, newest first
+    
+    Pages are read straight from the session index; pass the returned
+    next_cursor as ?cursor= for the next page. Assets the janitor has
+    deleted drop out of the listing.
+    """
+    if not is_session_id(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    session = await session_index.aget_session(session_id, kind, limit, cursor)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    session["uploads"] = [asset["url"] for asset in session["assets"] if asset["kind"] == "upload"]
+    session["results"] = [asset["url"] for asset in session["assets"] if asset["kind"] == "result"]
+    return SessionResponse(**session)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics for this worker (stage timings, counters, queue depth)"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/analytics", response_model=AnalyticsData)
+async def get_analytics():
+    """Upload and swap totals, popular professions and success rate for this worker"""
+    return AnalyticsData(**metrics.analytics())
+
+@app.get("/metrics/dedupe")
+async def get_dedupe_metrics():
+    """Get upload and swap deduplication counters and hit rates"""
+    return metrics.dedupe_stats()
+
+@app.get("/metrics/detectors")
+async def get_detector_metrics():
+    """Get per-backend face detector latency and hit-rate counters"""
+    return face_service.detector.stats()
+
+def get_request_profiler() -> profiler.SamplingProfiler:
+    """Get the request profiler, or 404 when profiling is disabled"""
+    request_profiler = profiler.get_profiler()
+    if request_profiler is None:
+        raise HTTPException(status_code=404, detail="Profiler is disabled")
+    return request_profiler
+
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles(request_profiler: profiler.SamplingProfiler = Depends(get_request_profiler)):
+    """List stored request profiles, newest first"""
+    return {"profiles": request_profiler.list_profiles()}
+
+@app.get("/admin/profiles/{name}", dependencies=[Depends(require_admin)])
+async def download_profile(name: str, request_profiler: profiler.SamplingProfiler = Depends(get_request_profiler)):
+    """Download one profile as collapsed stacks"""
+    path = request_profiler.profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=name)
+
+@app.api_route("/results/{filename}", methods=["GET", "HEAD"])
+async def get_result(filename: str, request: Request):
+    """Serve a result image
+    
+    Results never change once written, so they carry a strong content ETag
+    and immutable caching. Single byte ranges are honoured. With
+    RESULTS_ACCEL_REDIRECT set (local storage only), nginx sends the file
+    instead of the worker. Results in S3 are served from the node-local cache.
+    """
+    if not result_files.is_result_name(filename):
+        raise HTTPException(status_code=404, detail="Result not found")
+    
     try:
-        result_path = f"results/{filename}"
-        if not os.path.exists(result_path):
-            raise HTTPException(status_code=404, detail="Result not found")
-        
-        return {"result_path": result_path}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        result_path = await face_service.storage.alocal_path(f"results/{filename}")
+        stat_result = await asyncio.to_thread(os.stat, result_path)
+        etag = await asyncio.to_thread(result_etags.etag, result_path, stat_result)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Result not found")
+    
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": result_files.IMMUTABLE,
+        "Accept-Ranges": "bytes"
+    }
+    if result_files.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    media_type = result_files.media_type(filename)
+    if config.RESULTS_ACCEL_REDIRECT and face_service.storage.is_local:
+        # nginx serves the body (and any Range) from its internal location
+        relative_path = os.path.relpath(result_path, config.RESULTS_DIR).replace(os.sep, "/")
+        headers["X-Accel-Redirect"] = config.RESULTS_ACCEL_REDIRECT.rstrip("/") + "/" + relative_path
+        return Response(headers=headers, media_type=media_type)
+    
+    # A Range only applies if If-Range (when sent) still names this version
+    byte_range = None
+    if request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = result_files.parse_range(request.headers.get("range"), stat_result.st_size)
+        except result_files.RangeNotSatisfiable:
+            return Response(
+                status_code=416,
+                headers={**headers, "Content-Range": f"bytes */{stat_result.st_size}"}
+            )
+    
+    return result_files.RangeFileResponse(
+        result_path,
+        stat_result=stat_result,
+        byte_range=byte_range,
+        headers=headers,
+        media_type=media_type,
+        method=request.method
+    )
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,12 +1,37 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal, Union
 from datetime import datetime
 
+class LandmarkPoint(BaseModel):
+    """One facial landmark in image pixels"""
+    name: str
+    x: float
+    y: float
+    z: float = 0.0
+    visibility: float = 1.0
+
+class FaceLandmarks(BaseModel):
+    """Landmarks of one face in a fixed model layout"""
+    layout: str = Field(..., description="Point layout (basic7 or ibug68)")
+    points: List[LandmarkPoint]
+
+class DetectedFace(BaseModel):
+    """One detected face, in rank order (index 0 is the primary face)"""
+    index: int
+    face_box: List[int] = Field(..., description="Face box as [x, y, width, height]")
+    confidence: float
+
 class UploadResponse(BaseModel):
     """Response model for image upload"""
     message: str
     file_path: str
     file_name: str
+    image_id: Optional[str] = None
+    face_detected: Optional[bool] = None
+    confidence: Optional[float] = None
+    landmarks: Optional[FaceLandmarks] = None
+    faces: Optional[List[DetectedFace]] = None
+    session_id: Optional[str] = Field(default=None, description="Session the upload was recorded in")
     uploaded_at: datetime = Field(default_factory=datetime.now)
 
 class SwapRequest(BaseModel):
@@ -16,6 +41,22 @@ class SwapRequest(BaseModel):
     angle: Optional[str] = Field(default="front", description="Target angle (front, side, three_quarter, back)")
     color: Optional[str] = Field(default=None, description="Target color scheme")
     accessories: Optional[List[str]] = Field(default=None, description="Target accessories")
+    blend_mode: Optional[Literal["feather", "seamless", "multiband"]] = Field(default="feather", description="Blending method")
+    face_index: Union[int, Literal["all"]] = Field(default=0, description="Ranked face to swap, or \"all\" for one result per face")
+
+class SwapTarget(BaseModel):
+    """One profession/angle variant in a batch swap"""
+    profession: str = Field(..., description="Target profession for face swap")
+    angle: Optional[str] = Field(default="front", description="Target angle (front, side, three_quarter, back)")
+    color: Optional[str] = Field(default=None, description="Target color scheme")
+    accessories: Optional[List[str]] = Field(default=None, description="Target accessories")
+    blend_mode: Optional[Literal["feather", "seamless", "multiband"]] = Field(default="feather", description="Blending method")
+    face_index: int = Field(default=0, ge=0, description="Ranked face to swap")
+
+class BatchSwapRequest(BaseModel):
+    """Request model for swapping one image into many templates"""
+    image_path: str = Field(..., description="Path to uploaded image")
+    targets: List[SwapTarget] = Field(..., min_length=1, max_length=48, description="Variants to generate")
 
 class SwapResponse(BaseModel):
     """Response model for face swapping"""
@@ -23,6 +64,9 @@ class SwapResponse(BaseModel):
     result_path: str
     profession: str
     angle: str
+    face_index: int = 0
+    result_paths: Optional[List[str]] = Field(default=None, description="One result per face when face_index is \"all\"")
+    format: str = Field(default="jpeg", description="Result encoding, negotiated from the Accept header")
     processed_at: datetime = Field(default_factory=datetime.now)
 
 class ProfessionInfo(BaseModel):
@@ -72,12 +116,20 @@ class FileUploadResponse(BaseModel):
 
 class ProcessingStatus(BaseModel):
     """Processing status response"""
+    job_id: Optional[str] = None
     status: str  # "pending", "processing", "completed", "failed"
     progress: Optional[int] = None  # 0-100
     message: Optional[str] = None
     result_path: Optional[str] = None
     error: Optional[str] = None
 
+class JobSubmitResponse(BaseModel):
+    """Response model for an accepted background job"""
+    job_id: str
+    status: str
+    status_url: str
+    events_url: str
+
 class UserSession(BaseModel):
     """User session model"""
     session_id: str
@@ -87,6 +139,27 @@ class UserSession(BaseModel):
     uploads: List[str] = Field(default_factory=list)
     results: List[str] = Field(default_factory=list)
 
+class SessionAsset(BaseModel):
+    """An upload or swap result recorded in a session"""
+    kind: Literal["upload", "result"]
+    asset_id: str = Field(..., description="Image ID of an upload, or result ID")
+    url: str = Field(..., description="Upload file_path, or result URL")
+    created_at: datetime
+    profession: Optional[str] = None
+    angle: Optional[str] = None
+    face_index: Optional[int] = None
+    format: Optional[str] = None
+    file_name: Optional[str] = None
+
+class SessionResponse(UserSession):
+    """A session with one page of its assets, newest first
+
+    uploads and results repeat the page's upload paths and result URLs.
+    """
+    assets: List[SessionAsset] = Field(default_factory=list)
+    total_assets: int = 0
+    next_cursor: Optional[int] = Field(default=None, description="Pass as ?cursor= to get the next page")
+
 class AnalyticsData(BaseModel):
     """Analytics data model"""
     total_uploads: int
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .landmarks import Landmarks
+from .storage import Storage
+
+
+class DetectionCache:
+    """Cache of face detection results keyed by image content hash
+
+    Detection runs once per upload. Results live in an in-memory LRU keyed by
+    the SHA-256 of the upload bytes, with a JSON sidecar stored next to the
+    upload (``uploads/{image_id}.faces.json``) so other workers, nodes and
+    restarts can reuse them without re-running the detector. Landmarks are
+    kept as ``Landmarks`` arrays in memory and only turned into lists in the
+    sidecar.
+    """
+
+    SIDECAR_SUFFIX = ".faces.json"
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._aliases: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_hash(data: bytes) -> str:
+        """Hash image bytes into a cache key"""
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, image_id: str) -> Optional[Dict[str, Any]]:
+        """Get the cached detection for an upload, if any"""
+        with self._lock:
+            content_hash = self._aliases.get(image_id)
+            detection = self._entries.get(content_hash) if content_hash else None
+            if detection is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(content_hash)
+            self._aliases.move_to_end(image_id)
+            self.hits += 1
+            return detection
+
+    def put(self, image_id: str, detection: Dict[str, Any]):
+        """Cache a detection for an upload, evicting the least recently used"""
+        content_hash = detection["content_hash"]
+        with self._lock:
+            self._entries[content_hash] = detection
+            self._entries.move_to_end(content_hash)
+            self._aliases[image_id] = content_hash
+            self._aliases.move_to_end(image_id)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            while len(self._aliases) > self.max_entries * 4:
+                self._aliases.popitem(last=False)
+
+    @classmethod
+    def sidecar_key(cls, upload_key: str) -> str:
+        """Get the sidecar storage key for an upload key"""
+        return os.path.splitext(upload_key)[0] + cls.SIDECAR_SUFFIX
+
+    @classmethod
+    def read_sidecar(cls, storage: Storage, upload_key: str) -> Optional[Dict[str, Any]]:
+        """Load a detection sidecar written at upload time"""
+        try:
+            detection = json.loads(storage.read(cls.sidecar_key(upload_key)))
+            if "content_hash" not in detection:
+                return None
+            detection["landmarks"] = Landmarks.from_json(detection.get("landmarks"))
+            for face in detection.get("faces") or []:
+                face["landmarks"] = Landmarks.from_json(face.get("landmarks"))
+            return detection
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @staticmethod
+    def _sidecar_form(detection: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy a detection with its landmarks in JSON form"""
+        landmarks = detection.get("landmarks")
+        return dict(detection, landmarks=landmarks.to_json() if landmarks is not None else None)
+
+    @classmethod
+    def write_sidecar(cls, storage: Storage, upload_key: str, detection: Dict[str, Any]):
+        """Persist a detection next to its upload"""
+        data = cls._sidecar_form(detection)
+        if "faces" in detection:
+            data["faces"] = [cls._sidecar_form(face) for face in detection["faces"]]
+        try:
+            storage.write(cls.sidecar_key(upload_key), json.dumps(data).encode("utf-8"))
+        except Exception as e:
+            print(f"Error writing detection sidecar: {str(e)}")
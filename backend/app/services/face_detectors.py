@@ -0,0 +1,421 @@
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .. import config
+
+
+class FaceCandidate(NamedTuple):
+    """A detected face box (x, y, w, h) in full-resolution pixels"""
+    box: Tuple[int, int, int, int]
+    confidence: float
+    detector: str
+
+
+class FaceDetector(ABC):
+    """Base class for face detector backends
+
+    Backends return every face they find with a confidence in [0, 1].
+    Calls, hits and latency are counted per backend so a detection chain can
+    be tuned on real traffic.
+    """
+
+    name = "detector"
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.hits = 0
+        self.total_ms = 0.0
+
+    @abstractmethod
+    def _detect(self, image: np.ndarray, gray: np.ndarray) -> List[FaceCandidate]:
+        """Find faces in a BGR image (gray is the same image in grayscale)"""
+
+    def detect(self, image: np.ndarray, gray: np.ndarray) -> List[FaceCandidate]:
+        """Find faces, best first, and record latency and hit counters"""
+        start_time = time.perf_counter()
+        faces = sorted(self._detect(image, gray), key=lambda face: face.confidence, reverse=True)
+        elapsed = (time.perf_counter() - start_time) * 1000
+        with self._stats_lock:
+            self.calls += 1
+            self.hits += 1 if faces else 0
+            self.total_ms += elapsed
+        return faces
+
+    def take_counters(self) -> Tuple[int, int, float]:
+        """Get (calls, hits, total_ms) since the last take and reset them"""
+        with self._stats_lock:
+            counters = (self.calls, self.hits, self.total_ms)
+            self.calls, self.hits, self.total_ms = 0, 0, 0.0
+        return counters
+
+    def add_counters(self, counters: Tuple[int, int, float]):
+        """Add counters taken from another process's instance of this backend"""
+        calls, hits, total_ms = counters
+        with self._stats_lock:
+            self.calls += calls
+            self.hits += hits
+            self.total_ms += total_ms
+
+    def stats(self) -> Dict[str, Any]:
+        """Get this backend's counters"""
+        with self._stats_lock:
+            calls, hits, total_ms = self.calls, self.hits, self.total_ms
+        return {
+            "calls": calls,
+            "hits": hits,
+            "hit_rate": hits / calls if calls else 0.0,
+            "mean_ms": total_ms / calls if calls else 0.0,
+        }
+
+
+def _downscale(image: np.ndarray, max_edge: int) -> Tuple[np.ndarray, float]:
+    """Shrink an image so its longest edge is at most max_edge"""
+    if not max_edge:
+        return image, 1.0
+    scale = max_edge / max(image.shape[:2])
+    if scale >= 1.0:
+        return image, 1.0
+    small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return small, scale
+
+
+class HaarDetector(FaceDetector):
+    """OpenCV Haar cascade, scored by its final stage weight
+
+    The cascade has no calibrated score. Its confidence is a heuristic: the
+    sigmoid of the ``levelWeights`` that ``detectMultiScale3`` reports for
+    the last stage. That puts it in [0, 1] and keeps strong hits above weak
+    ones, but it is not a probability and is not comparable with CNN scores.
+    Tune ``DETECTION_MIN_CONFIDENCE`` against real uploads before relying on
+    it to fall through to a slower detector.
+
+    With ``max_edge`` set, the cascade runs on a copy downscaled to that
+    edge length and each coarse hit is refined inside a region of interest,
+    so detection cost stays roughly constant for large uploads.
+    """
+
+    name = "haar"
+
+    def __init__(self, cascade_path: Optional[str] = None, max_edge: int = 640):
+        super().__init__()
+        self.cascade_path = cascade_path or cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        self.max_edge = max_edge
+        # detectMultiScale is not thread-safe on a shared instance, so use one per thread
+        self._local = threading.local()
+        if self._cascade().empty():
+            raise Exception(f"Could not load Haar cascade: {self.cascade_path}")
+
+    def _cascade(self) -> cv2.CascadeClassifier:
+        """Get this thread's cascade instance"""
+        cascade = getattr(self._local, "cascade", None)
+        if cascade is None:
+            cascade = cv2.CascadeClassifier(self.cascade_path)
+            self._local.cascade = cascade
+        return cascade
+
+    def _run_cascade(self, gray: np.ndarray, min_size: int) -> List[Tuple[Tuple[int, int, int, int], float]]:
+        """Run the cascade, mapping each hit's stage weight to a heuristic confidence"""
+        boxes, _, weights = self._cascade().detectMultiScale3(
+            gray,
+            scaleFactor=1.1,
+            minNeighbors=5,
+            minSize=(min_size, min_size),
+            outputRejectLevels=True
+        )
+        return [
+            (tuple(int(v) for v in box), 1.0 / (1.0 + math.exp(-float(weight))))
+            for box, weight in zip(boxes, np.ravel(weights))
+        ]
+
+    def _detect(self, image: np.ndarray, gray: np.ndarray) -> List[FaceCandidate]:
+        """Coarse detection on a downscaled copy, refined in a region of interest"""
+        small, scale = _downscale(gray, self.max_edge)
+        if scale == 1.0:
+            return [FaceCandidate(box, conf, self.name) for box, conf in self._run_cascade(gray, 30)]
+
+        faces = []
+        height, width = gray.shape[:2]
+        for coarse_box, coarse_conf in self._run_cascade(small, 24):
+            # Map the coarse hit back to full resolution
+            x, y, w, h = [v / scale for v in coarse_box]
+
+            # Refine inside the coarse box plus margin, again at bounded size
+            margin = 0.25 * max(w, h)
+            x0, y0 = int(max(0, x - margin)), int(max(0, y - margin))
+            x1, y1 = int(min(width, x + w + margin)), int(min(height, y + h + margin))
+            roi, roi_scale = _downscale(gray[y0:y1, x0:x1], self.max_edge)
+
+            refined = self._run_cascade(roi, max(24, int(0.5 * w * roi_scale)))
+            if not refined:
+                faces.append(FaceCandidate((int(x), int(y), int(w), int(h)), coarse_conf, self.name))
+                continue
+
+            # Keep the largest refined hit, mapped back to full resolution
+            (rx, ry, rw, rh), conf = max(refined, key=lambda hit: hit[0][2] * hit[0][3])
+            faces.append(FaceCandidate(
+                (int(x0 + rx / roi_scale), int(y0 + ry / roi_scale), int(rw / roi_scale), int(rh / roi_scale)),
+                conf,
+                self.name
+            ))
+        return faces
+
+
+class YuNetDetector(FaceDetector):
+    """OpenCV FaceDetectorYN (YuNet) CNN detector loaded from a local ONNX file"""
+
+    name = "yunet"
+
+    def __init__(self, model_path: str, max_edge: int = 640, score_threshold: float = 0.5):
+        super().__init__()
+        if not hasattr(cv2, "FaceDetectorYN"):
+            raise Exception("cv2.FaceDetectorYN requires OpenCV 4.5.4 or newer")
+        if not os.path.exists(model_path):
+            raise Exception(f"YuNet model not found: {model_path}")
+        self.model_path = model_path
+        self.max_edge = max_edge
+        self.score_threshold = score_threshold
+        # The detector keeps per-call state (input size), so use one per thread
+        self._local = threading.local()
+
+    def _detector(self):
+        """Get this thread's detector instance"""
+        detector = getattr(self._local, "detector", None)
+        if detector is None:
+            detector = cv2.FaceDetectorYN.create(self.model_path, "", (320, 320), self.score_threshold)
+            self._local.detector = detector
+        return detector
+
+    def _detect(self, image: np.ndarray, gray: np.ndarray) -> List[FaceCandidate]:
+        """Run the CNN on a copy downscaled to max_edge"""
+        small, scale = _downscale(image, self.max_edge)
+        detector = self._detector()
+        detector.setInputSize((small.shape[1], small.shape[0]))
+        _, rows = detector.detect(small)
+        if rows is None:
+            return []
+        return [
+            FaceCandidate(
+                tuple(int(v / scale) for v in row[:4]),
+                float(row[-1]),
+                self.name
+            )
+            for row in rows
+        ]
+
+
+class SSDDetector(FaceDetector):
+    """OpenCV dnn ResNet-10 SSD face detector loaded from local model files"""
+
+    name = "ssd"
+
+    def __init__(self, model_path: str, config_path: str = "", score_threshold: float = 0.5):
+        super().__init__()
+        if not os.path.exists(model_path):
+            raise Exception(f"SSD model not found: {model_path}")
+        self.model_path = model_path
+        self.config_path = config_path
+        self.score_threshold = score_threshold
+        # cv2.dnn.Net is not safe to share between threads
+        self._local = threading.local()
+
+    def _net(self):
+        """Get this thread's network instance"""
+        net = getattr(self._local, "net", None)
+        if net is None:
+            net = cv2.dnn.readNet(self.model_path, self.config_path)
+            self._local.net = net
+        return net
+
+    def _detect(self, image: np.ndarray, gray: np.ndarray) -> List[FaceCandidate]:
+        """Run the network on a 300x300 blob"""
+        height, width = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1.0, (300, 300), (104.0, 177.0, 123.0))
+        net = self._net()
+        net.setInput(blob)
+        rows = net.forward().reshape(-1, 7)
+
+        faces = []
+        for _, _, score, x0, y0, x1, y1 in rows:
+            if score < self.score_threshold:
+                continue
+            x0, x1 = int(max(0.0, x0) * width), int(min(1.0, x1) * width)
+            y0, y1 = int(max(0.0, y0) * height), int(min(1.0, y1) * height)
+            if x1 > x0 and y1 > y0:
+                faces.append(FaceCandidate((x0, y0, x1 - x0, y1 - y0), float(score), self.name))
+        return faces
+
+
+class SkinPrefilter(FaceDetector):
+    """Cheap gate that rejects images with too little skin-toned area
+
+    Runs on a 128px thumbnail in YCrCb. It never produces faces, only a
+    decision, so it belongs at the front of a chain. Near-grayscale images
+    carry no colour signal and are always let through.
+    """
+
+    name = "skin"
+
+    def __init__(self, min_fraction: float = 0.01):
+        super().__init__()
+        self.min_fraction = min_fraction
+
+    def accepts(self, image: np.ndarray) -> bool:
+        """Check whether the image could plausibly contain a face"""
+        start_time = time.perf_counter()
+        small, _ = _downscale(image, 128)
+        ycrcb = cv2.cvtColor(small, cv2.COLOR_BGR2YCrCb)
+        chroma = ycrcb[..., 1:].astype(np.int16) - 128
+        if np.abs(chroma).mean() < 2.0:
+            accepted = True
+        else:
+            skin = cv2.inRange(ycrcb, (0, 133, 77), (255, 173, 127))
+            accepted = cv2.countNonZero(skin) >= self.min_fraction * skin.size
+
+        elapsed = (time.perf_counter() - start_time) * 1000
+        with self._stats_lock:
+            self.calls += 1
+            self.hits += 1 if accepted else 0
+            self.total_ms += elapsed
+        return accepted
+
+    def _detect(self, image: np.ndarray, gray: np.ndarray) -> List[FaceCandidate]:
+        """Prefilters do not locate faces"""
+        return []
+
+
+class DetectorChain:
+    """Run detectors in order until one is confident enough
+
+    Prefilters (``SkinPrefilter``) can end the chain early with no face.
+    Each later detector only runs when every earlier one missed or scored
+    below ``min_confidence``; the best face seen overall is returned.
+    """
+
+    def __init__(self, detectors: List[FaceDetector], min_confidence: float = 0.6):
+        self.detectors = detectors
+        self.min_confidence = min_confidence
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.prefiltered = 0
+
+    @property
+    def name(self) -> str:
+        """Chain description, e.g. 'skin,haar,yunet'"""
+        return ",".join(detector.name for detector in self.detectors)
+
+    def detect(self, image: np.ndarray, gray: Optional[np.ndarray] = None) -> List[FaceCandidate]:
+        """Get the faces from the first confident detector, best first"""
+        if gray is None:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        with self._stats_lock:
+            self.calls += 1
+
+        best: List[FaceCandidate] = []
+        for detector in self.detectors:
+            if isinstance(detector, SkinPrefilter):
+                if not detector.accepts(image):
+                    with self._stats_lock:
+                        self.prefiltered += 1
+                    return best
+                continue
+
+            faces = detector.detect(image, gray)
+            if faces and (not best or faces[0].confidence > best[0].confidence):
+                best = faces
+            if best and best[0].confidence >= self.min_confidence:
+                break
+        return best
+
+    def take_counters(self) -> Dict[str, Any]:
+        """Get chain and per-backend counters since the last take and reset them
+
+        Pool processes run their own chain; with the process executor each
+        call's counters are taken there and added to the parent's chain.
+        """
+        with self._stats_lock:
+            calls, prefiltered = self.calls, self.prefiltered
+            self.calls, self.prefiltered = 0, 0
+        return {
+            "calls": calls,
+            "prefiltered": prefiltered,
+            "backends": {detector.name: detector.take_counters() for detector in self.detectors},
+        }
+
+    def add_counters(self, counters: Dict[str, Any]):
+        """Add counters taken from another process's chain"""
+        with self._stats_lock:
+            self.calls += counters["calls"]
+            self.prefiltered += counters["prefiltered"]
+        for detector in self.detectors:
+            backend = counters["backends"].get(detector.name)
+            if backend is not None:
+                detector.add_counters(backend)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get chain and per-backend counters"""
+        with self._stats_lock:
+            calls, prefiltered = self.calls, self.prefiltered
+        return {
+            "chain": self.name,
+            "min_confidence": self.min_confidence,
+            "calls": calls,
+            "prefiltered": prefiltered,
+            "backends": {detector.name: detector.stats() for detector in self.detectors},
+        }
+
+
+def create_detector(name: str) -> FaceDetector:
+    """Create one detector backend by name"""
+    if name == "haar":
+        return HaarDetector(max_edge=config.DETECTION_MAX_EDGE)
+    if name == "yunet":
+        return YuNetDetector(config.DETECTION_YUNET_MODEL, max_edge=config.DETECTION_MAX_EDGE or 640)
+    if name == "ssd":
+        return SSDDetector(config.DETECTION_SSD_MODEL, config.DETECTION_SSD_CONFIG)
+    if name == "skin":
+        return SkinPrefilter()
+    raise ValueError(f"Unknown face detector: {name}")
+
+
+def default_chain_spec() -> str:
+    """Haar alone, or Haar backed by YuNet when its model file is present"""
+    if os.path.exists(config.DETECTION_YUNET_MODEL):
+        return "haar,yunet"
+    return "haar"
+
+
+def create_detector_chain(spec: Optional[str] = None) -> DetectorChain:
+    """Build the chain selected by DETECTION_CHAIN, skipping unavailable backends"""
+    spec = spec or config.DETECTION_CHAIN or default_chain_spec()
+    detectors = []
+    for name in [part.strip() for part in spec.split(",") if part.strip()]:
+        try:
+            detectors.append(create_detector(name))
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"Face detector '{name}' unavailable: {str(e)}")
+
+    if not any(not isinstance(detector, SkinPrefilter) for detector in detectors):
+        # Always keep a working detector at the end of the chain
+        detectors.append(HaarDetector(max_edge=config.DETECTION_MAX_EDGE))
+    return DetectorChain(detectors, min_confidence=config.DETECTION_MIN_CONFIDENCE)
+
+
+_detector_chain: Optional[DetectorChain] = None
+
+
+def get_detector_chain() -> DetectorChain:
+    """Get the process-wide detector chain"""
+    global _detector_chain
+    if _detector_chain is None:
+        _detector_chain = create_detector_chain()
+    return _detector_chain
@@ -1,187 +1,641 @@
 import cv2
 import numpy as np
-from PIL import Image
-import io
 import uuid
 import os
-from typing import Dict, List, Any, Optional
+import json
+import asyncio
+import hashlib
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Any, Optional, Union
 import time
-from ..models.schemas import ProcessingResult, FaceLandmarks
+from .. import config
+from ..utils.encoding import OutputFormat, encode_image, get_format
+from ..utils.executor import ComputeBusyError, ComputeExecutor, get_compute_executor
+from ..utils.image_utils import ImageUtils
+from ..utils.metrics import OPERATION_SECONDS, UPLOADS, record_dedupe, record_swap, stage_timer
+from .detection_cache import DetectionCache
+from .face_detectors import DetectorChain, FaceCandidate, get_detector_chain
+from .landmarks import ALIGNMENT_NAMES, Landmarks, basic_landmarks, get_landmarker, similarity_transforms
+from .source_cache import SourceCache, get_source_cache
+from .storage import Storage, get_storage
+from .template_cache import TemplateCache, get_template_cache
+from .upload_ingest import IngestedUpload
+
+
+class UploadNotFoundError(FileNotFoundError):
+    """Raised when a swap names an upload that is not in storage"""
+
+
+class FaceSelectionError(ValueError):
+    """Raised when a face_index does not name a detected face"""
+
 
 class FaceService:
-    def __init__(self):
+    # Bump when the swap pipeline changes output, so memoized results are not reused
+    PIPELINE_VERSION = 6
+
+    def __init__(
+        self,
+        executor: Optional[ComputeExecutor] = None,
+        template_cache: Optional[TemplateCache] = None,
+        storage: Optional[Storage] = None,
+        detector: Optional[DetectorChain] = None,
+        source_cache: Optional[SourceCache] = None
+    ):
         """Initialize face detection and processing services"""
-        # Load OpenCV's pre-trained face detection model
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        # Face detector backends, tried in DETECTION_CHAIN order
+        self.detector = detector or get_detector_chain()
+        
+        # Landmarks are (N, 3) float32 arrays in a fixed model layout
+        self.landmarker = get_landmarker()
+        
+        # All image work runs on the compute executor, never on the event loop
+        self.executor = executor or get_compute_executor()
+        
+        # Face detections are computed once per upload and reused by every swap
+        self.detection_cache = DetectionCache(max_entries=config.DETECTION_CACHE_SIZE)
+        
+        # Uploads are decoded once and the array reused by detection and every swap
+        self.source_cache = source_cache or get_source_cache()
+        
+        # Decoded templates are shared with TemplateService
+        self.template_cache = template_cache or get_template_cache()
         
-        # Create uploads directory if it doesn't exist
-        self.uploads_dir = "uploads"
-        self.results_dir = "results"
-        os.makedirs(self.uploads_dir, exist_ok=True)
-        os.makedirs(self.results_dir, exist_ok=True)
+        # Uploads and results live in shared storage; uploads_dir stages incoming files
+        # (created by the ingestor on first use, so importing the app writes nothing)
+        self.storage = storage or get_storage()
+        self.uploads_dir = config.UPLOAD_DIR
+        
+        # Uploads and results are content-addressed; identical work is done once
+        self._inflight: Dict[str, asyncio.Event] = {}
+        
+        # Template face landmarks keyed by (profession, angle, template version)
+        self._template_faces: Dict[tuple, Landmarks] = {}
+
+    def __getstate__(self):
+        """Drop process-local handles when shipped to a process pool worker"""
+        state = self.__dict__.copy()
+        state["detector"] = None
+        state["landmarker"] = None
+        state["executor"] = None
+        state["detection_cache"] = None
+        state["template_cache"] = None
+        state["source_cache"] = None
+        state["storage"] = None
+        state["_inflight"] = None
+        return state
+
+    def __setstate__(self, state):
+        """Reattach process-local handles in a process pool worker"""
+        self.__dict__.update(state)
+        self.detector = get_detector_chain()
+        self.landmarker = get_landmarker()
+        self.template_cache = get_template_cache()
+        self.source_cache = get_source_cache()
+        self.storage = get_storage()
+
+    @staticmethod
+    def image_id_for_hash(content_hash: str) -> str:
+        """Derive the upload ID from the SHA-256 of its bytes"""
+        return content_hash[:32]
 
-    async def process_upload(self, file) -> Dict[str, Any]:
-        """Process uploaded image and extract face information"""
+    async def _find_existing_upload(self, image_id: str, upload_key: str) -> Optional[Dict[str, Any]]:
+        """Return the stored detection if this exact upload was seen before"""
+        detection = None
+        if await self.storage.aexists(upload_key):
+            detection = self.detection_cache.get(image_id)
+            if detection is None:
+                detection = await asyncio.to_thread(DetectionCache.read_sidecar, self.storage, upload_key)
+        
+        record_dedupe("upload", detection is not None)
+        return detection
+
+    async def process_ingested_upload(self, upload: IngestedUpload) -> Dict[str, Any]:
+        """Store a streamed upload and extract face information"""
         start_time = time.time()
         
         try:
-            # Read image from uploaded file
-            image_data = await file.read()
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Convert PIL image to OpenCV format
-            cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-            
-            # Generate unique image ID
-            image_id = str(uuid.uuid4())
-            
-            # Save original image
-            image_path = os.path.join(self.uploads_dir, f"{image_id}.jpg")
-            image.save(image_path)
+            # Image ID is derived from the content, so re-uploads are free
+            image_id = self.image_id_for_hash(upload.content_hash)
+            upload_key = self.upload_key(image_id)
             
-            # Detect face and extract landmarks
-            face_detected, landmarks, confidence = self._detect_face_and_landmarks(cv_image)
+            detection = await self._find_existing_upload(image_id, upload_key)
+            UPLOADS.labels(outcome="new" if detection is None else "duplicate").inc()
+            if detection is None:
+                # Decode, store and detect on the compute executor
+                detection = await self._run(
+                    self._process_ingested_sync, upload.temp_path, upload_key,
+                    upload.format, upload.content_hash
+                )
+            self.detection_cache.put(image_id, detection)
             
             processing_time = time.time() - start_time
+            OPERATION_SECONDS.labels(operation="upload").observe(processing_time)
             
             return {
                 "image_id": image_id,
-                "face_detected": face_detected,
-                "landmarks": landmarks,
-                "confidence": confidence,
+                "file_path": upload_key,
+                "face_detected": detection["face_detected"],
+                "landmarks": detection["landmarks"],
+                "confidence": detection["confidence"],
+                "faces": self.detection_faces(detection),
+                "detection_time": detection.get("detection_time_ms", 0.0) / 1000,
                 "processing_time": processing_time
             }
             
+        except ComputeBusyError:
+            raise
         except Exception as e:
+            UPLOADS.labels(outcome="failed").inc()
             raise Exception(f"Error processing upload: {str(e)}")
 
-    def _detect_face_and_landmarks(self, image) -> tuple[bool, Optional[List[Dict]], float]:
+    def _process_ingested_sync(self, temp_path: str, upload_key: str, image_format: str, content_hash: str) -> Dict[str, Any]:
+        """Decode a streamed upload, move it into place and detect its face (runs on the executor)"""
+        # OpenCV decodes straight to BGR, with no PIL round trip
+        with stage_timer("decode"):
+            cv_image = cv2.imread(temp_path, cv2.IMREAD_COLOR)
+        if cv_image is None:
+            raise Exception("Image could not be decoded")
+        
+        # JPEG bytes are kept as uploaded; other formats are stored as JPEG
+        if image_format == "JPEG":
+            self.storage.put_file(upload_key, temp_path)
+        else:
+            ok, encoded = cv2.imencode(".jpg", cv_image)
+            if not ok:
+                raise Exception("Image could not be saved")
+            self.storage.write(upload_key, encoded.data)
+            os.remove(temp_path)
+        
+        # Swaps of this upload reuse the decoded array instead of decoding it again
+        cv_image = self.source_cache.put(upload_key, cv_image)
+        
+        # Detect face and extract landmarks, keeping a sidecar for later swaps
+        detection = self._detect_face(cv_image)
+        detection["content_hash"] = content_hash
+        DetectionCache.write_sidecar(self.storage, upload_key, detection)
+        
+        return detection
+
+    def _detect_face_and_landmarks(self, image) -> tuple[bool, Optional[Landmarks], float]:
         """Detect face and extract landmarks using OpenCV"""
+        detection = self._detect_face(image)
+        return detection["face_detected"], detection["landmarks"], detection["confidence"]
+
+    def _detect_face(self, image) -> Dict[str, Any]:
+        """Detect faces, timed as the "detect" pipeline stage"""
+        with stage_timer("detect"):
+            return self._run_detection(image)
+
+    def _run_detection(self, image) -> Dict[str, Any]:
+        """Detect and rank all faces, returning the primary face plus the ranked list
+        
+        The top-level face_box/landmarks/confidence describe the best ranked
+        face; "faces" holds every kept face in rank order.
+        """
+        start_time = time.perf_counter()
+        no_face = {
+            "face_detected": False, "face_box": None, "landmarks": None, "confidence": 0.0,
+            "face_count": 0, "faces": []
+        }
         try:
             # Convert to grayscale for face detection
             gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
             
-            # Detect faces
-            faces = self.face_cascade.detectMultiScale(
-                gray, 
-                scaleFactor=1.1, 
-                minNeighbors=5, 
-                minSize=(30, 30)
-            )
-            
-            if len(faces) == 0:
-                return False, None, 0.0
+            # Detect faces and rank them
+            faces = self._rank_faces(self.detector.detect(image, gray))[:config.DETECTION_MAX_FACES]
             
-            # Get the first detected face
-            (x, y, w, h) = faces[0]
-            confidence = 0.8  # OpenCV doesn't provide confidence, so we estimate
+            if not faces:
+                no_face["detection_time_ms"] = (time.perf_counter() - start_time) * 1000
+                return no_face
             
-            # Extract basic landmarks (simplified version)
-            landmarks = self._extract_basic_landmarks(x, y, w, h, image.shape)
+            # Fit landmarks for every face in one call
+            landmarks = self.landmarker.fit_many(gray, [face.box for face in faces])
+            ranked = [
+                {
+                    "face_box": list(face.box),
+                    "landmarks": face_landmarks,
+                    "confidence": round(face.confidence, 4),
+                    "detector": face.detector
+                }
+                for face, face_landmarks in zip(faces, landmarks)
+            ]
             
-            return True, landmarks, confidence
+            return {
+                "face_detected": True,
+                **ranked[0],
+                "face_count": len(ranked),
+                "faces": ranked,
+                "detection_time_ms": (time.perf_counter() - start_time) * 1000
+            }
             
         except Exception as e:
             print(f"Error in face detection: {str(e)}")
-            return False, None, 0.0
-
-    def _extract_basic_landmarks(self, x, y, w, h, image_shape) -> List[Dict[str, Any]]:
-        """Extract basic facial landmarks from detected face rectangle"""
-        height, width = image_shape[:2]
-        
-        # Calculate basic face points
-        center_x = x + w // 2
-        center_y = y + h // 2
-        
-        landmarks = [
-            {
-                "name": "nose",
-                "x": center_x,
-                "y": center_y,
-                "z": 0.0,
-                "visibility": 1.0
-            },
-            {
-                "name": "left_eye",
-                "x": center_x - w // 4,
-                "y": center_y - h // 4,
-                "z": 0.0,
-                "visibility": 1.0
-            },
-            {
-                "name": "right_eye",
-                "x": center_x + w // 4,
-                "y": center_y - h // 4,
-                "z": 0.0,
-                "visibility": 1.0
-            },
-            {
-                "name": "left_ear",
-                "x": x,
-                "y": center_y,
-                "z": 0.0,
-                "visibility": 1.0
-            },
-            {
-                "name": "right_ear",
-                "x": x + w,
-                "y": center_y,
-                "z": 0.0,
-                "visibility": 1.0
-            },
-            {
-                "name": "mouth",
-                "x": center_x,
-                "y": center_y + h // 3,
-                "z": 0.0,
-                "visibility": 1.0
-            },
-            {
-                "name": "chin",
-                "x": center_x,
-                "y": y + h,
-                "z": 0.0,
-                "visibility": 1.0
-            }
-        ]
-        
-        return landmarks
+            return no_face
+
+    @staticmethod
+    def _rank_faces(faces: List[FaceCandidate]) -> List[FaceCandidate]:
+        """Order faces confident-first, then by size weighted by confidence"""
+        return sorted(
+            faces,
+            key=lambda face: (
+                face.confidence >= config.DETECTION_MIN_CONFIDENCE,
+                face.box[2] * face.box[3] * face.confidence
+            ),
+            reverse=True
+        )
+
+    @staticmethod
+    def detection_faces(detection: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Get the ranked faces of a detection (older detections hold only one)"""
+        if not detection.get("face_detected"):
+            return []
+        return detection.get("faces") or [detection]
+
+    def _select_faces(self, detection: Dict[str, Any], face_index: Union[int, str]) -> List[int]:
+        """Resolve a face index or "all" against a detection"""
+        count = len(self.detection_faces(detection))
+        if face_index == "all":
+            return list(range(count)) or [0]
+        if not isinstance(face_index, int) or face_index < 0:
+            raise FaceSelectionError(f"Invalid face index: {face_index}")
+        if face_index >= max(1, count):
+            raise FaceSelectionError(f"Face index {face_index} out of range ({count} faces detected)")
+        return [face_index]
+
+    @staticmethod
+    def resolve_image_id(image_path: str) -> str:
+        """Get the image ID from an upload path, URL or bare ID"""
+        return os.path.splitext(os.path.basename(image_path))[0]
+
+    def _result_key(
+        self,
+        image_id: str,
+        profession: str,
+        angle: str,
+        color: Optional[str],
+        accessories: Optional[List[str]],
+        blend_mode: str = "feather",
+        face_index: int = 0
+    ) -> str:
+        """Key a swap result by its upload, template version and request parameters"""
+        params = {
+            "pipeline": self.PIPELINE_VERSION,
+            "image_id": image_id,
+            "template": self.template_cache.version(profession, angle),
+            "profession": profession,
+            "angle": angle,
+            "color": color,
+            "accessories": sorted(accessories or []),
+            "blend_mode": blend_mode,
+            "face_index": face_index
+        }
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def upload_key(image_id: str) -> str:
+        """Get the storage key of an upload"""
+        return f"uploads/{image_id}.jpg"
+
+    @staticmethod
+    def result_file_key(result_id: str, output_format: str = "jpeg") -> str:
+        """Get the storage key of a swap result in one output format"""
+        return f"results/{result_id}{get_format(output_format).extension}"
 
-    async def swap_face(self, image_id: str, profession: str, angle: str = "front") -> Dict[str, Any]:
-        """Perform face swapping with selected profession template"""
+    def _result_info(
+        self,
+        result_id: str,
+        profession: str,
+        angle: str,
+        face_index: int = 0,
+        output_format: str = "jpeg"
+    ) -> Dict[str, Any]:
+        """Describe a swap result"""
+        return {
+            "result_url": f"/results/{result_id}{get_format(output_format).extension}",
+            "result_id": result_id,
+            "profession": profession,
+            "angle": angle,
+            "face_index": face_index,
+            "format": output_format
+        }
+
+    async def _await_existing_result(self, result_key: str) -> bool:
+        """Wait out an identical swap in flight; True if the result already exists"""
+        while True:
+            if await self.storage.aexists(result_key):
+                record_dedupe("swap", True)
+                return True
+            inflight = self._inflight.get(result_key)
+            if inflight is None:
+                record_dedupe("swap", False)
+                return False
+            await inflight.wait()
+
+    async def swap_face(
+        self,
+        image_id: str,
+        profession: str,
+        angle: str = "front",
+        color: Optional[str] = None,
+        accessories: Optional[List[str]] = None,
+        blend_mode: str = "feather",
+        face_index: Union[int, str] = 0,
+        progress: Optional[Callable[[int, str], Awaitable[None]]] = None,
+        output_format: str = "jpeg",
+        inline: bool = False
+    ) -> Dict[str, Any]:
+        """Perform face swapping with selected profession template
+        
+        face_index picks one ranked face, or "all" swaps every detected face
+        in one pass; each face gets its own result, listed under "results".
+        With inline=True new results are not written to results/; each entry
+        carries its encoded bytes under "content" instead.
+        """
+        start_time = time.perf_counter()
         try:
             # Load original image
-            original_path = os.path.join(self.uploads_dir, f"{image_id}.jpg")
-            if not os.path.exists(original_path):
-                raise Exception("Original image not found")
+            upload_key = self.upload_key(image_id)
+            if not await self.storage.aexists(upload_key):
+                raise UploadNotFoundError("Original image not found")
             
-            original_image = cv2.imread(original_path)
+            detection = self.detection_cache.get(image_id)
+            if detection is None:
+                detection = await asyncio.to_thread(DetectionCache.read_sidecar, self.storage, upload_key)
+            if detection is None:
+                # Legacy upload without a sidecar: detect once up front
+                _, detection = await self._run(self._load_source_sync, upload_key)
+            self.detection_cache.put(image_id, detection)
             
-            # Load template image (placeholder - in real implementation, load from template service)
-            template_image = self._load_template(profession, angle)
+            # Identical requests map to the same result files, one per face
+            results = []
+            missing: Dict[int, tuple[str, str]] = {}
+            for index in self._select_faces(detection, face_index):
+                result_id = self._result_key(
+                    image_id, profession, angle, color, accessories, blend_mode, index
+                )
+                result_key = self.result_file_key(result_id, output_format)
+                results.append(self._result_info(result_id, profession, angle, index, output_format))
+                if not await self._await_existing_result(result_key):
+                    missing[index] = (result_id, result_key)
             
-            # Perform face swapping
-            result_image = self._perform_face_swap(original_image, template_image)
+            encoded: Dict[int, np.ndarray] = {}
+            if missing:
+                # Inline results are never written, so nothing should wait on them
+                pending = [] if inline else [key for _, key in missing.values()]
+                for result_key in pending:
+                    self._inflight[result_key] = asyncio.Event()
+                try:
+                    if progress is not None:
+                        await progress(20, "Swapping face")
+                    
+                    # Decode, swap and encode on the compute executor
+                    encoded = await self._run(
+                        self._swap_face_sync, upload_key, profession, angle,
+                        {index: None if inline else key for index, (_, key) in missing.items()},
+                        detection, blend_mode, output_format
+                    )
+                finally:
+                    for result_key in pending:
+                        self._inflight.pop(result_key).set()
             
-            # Save result
-            result_id = str(uuid.uuid4())
-            result_path = os.path.join(self.results_dir, f"{result_id}.jpg")
-            cv2.imwrite(result_path, result_image)
+            if inline:
+                for entry in results:
+                    if entry["face_index"] in encoded:
+                        entry["content"] = encoded[entry["face_index"]].tobytes()
+                    else:
+                        entry["content"] = await self.storage.aread(
+                            self.result_file_key(entry["result_id"], output_format)
+                        )
             
-            return {
-                "result_url": f"/results/{result_id}.jpg",
-                "result_id": result_id,
-                "profession": profession,
-                "angle": angle
-            }
+            record_swap(profession, angle, "completed", len(missing))
+            record_swap(profession, angle, "cached", len(results) - len(missing))
+            OPERATION_SECONDS.labels(operation="swap").observe(time.perf_counter() - start_time)
+            return {**results[0], "results": results}
             
+        except ComputeBusyError:
+            raise
+        except (UploadNotFoundError, FaceSelectionError):
+            record_swap(profession, angle, "failed")
+            raise
         except Exception as e:
+            record_swap(profession, angle, "failed")
             raise Exception(f"Error in face swapping: {str(e)}")
 
+    async def swap_face_batch(
+        self,
+        image_id: str,
+        targets: List[Dict[str, Any]],
+        output_format: str = "jpeg"
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Swap one upload into many templates, yielding results as they finish
+        
+        The source is decoded and its face detected once; each target then
+        only costs a template lookup, a blend and an encode on the executor.
+        """
+        upload_key = self.upload_key(image_id)
+        if not await self.storage.aexists(upload_key):
+            raise UploadNotFoundError("Original image not found")
+        
+        source: Optional[tuple[np.ndarray, Dict[str, Any]]] = None
+        source_lock = asyncio.Lock()
+        slots = asyncio.Semaphore(self.executor.max_workers)
+        
+        async def load_source() -> tuple[np.ndarray, Dict[str, Any]]:
+            nonlocal source
+            async with source_lock:
+                if source is None:
+                    source = await self._run_with_retry(
+                        self._load_source_sync, upload_key, self.detection_cache.get(image_id)
+                    )
+                    self.detection_cache.put(image_id, source[1])
+                return source
+        
+        async def run_target(index: int, target: Dict[str, Any]) -> Dict[str, Any]:
+            profession = target["profession"]
+            angle = target.get("angle") or "front"
+            blend_mode = target.get("blend_mode") or "feather"
+            face_index = target.get("face_index")
+            if face_index is None:
+                face_index = 0
+            entry = {"index": index, "profession": profession, "angle": angle}
+            try:
+                result_id = self._result_key(
+                    image_id, profession, angle, target.get("color"), target.get("accessories"),
+                    blend_mode, face_index
+                )
+                result_key = self.result_file_key(result_id, output_format)
+                entry.update(self._result_info(result_id, profession, angle, face_index, output_format))
+                
+                outcome = "cached"
+                if not await self._await_existing_result(result_key):
+                    outcome = "completed"
+                    self._inflight[result_key] = asyncio.Event()
+                    try:
+                        image, detection = await load_source()
+                        async with slots:
+                            await self._run_with_retry(
+                                self._render_swap_sync, image, detection, profession, angle,
+                                {face_index: result_key}, blend_mode, output_format
+                            )
+                    finally:
+                        self._inflight.pop(result_key).set()
+                
+                entry["status"] = "completed"
+                record_swap(profession, angle, outcome)
+            except Exception as e:
+                entry["status"] = "failed"
+                entry["error"] = str(e)
+                # HTTP status the target would have got from /swap-face
+                if isinstance(e, ComputeBusyError):
+                    entry["status_code"] = 503
+                    entry["retry_after"] = e.retry_after
+                else:
+                    entry["status_code"] = 400 if isinstance(e, FaceSelectionError) else 500
+                record_swap(profession, angle, "failed")
+            return entry
+        
+        tasks = [asyncio.ensure_future(run_target(i, t)) for i, t in enumerate(targets)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _run(self, func: Callable[..., Any], *args) -> Any:
+        """Run image work on the compute executor
+        
+        Pool processes detect with their own DetectorChain, so with the
+        process executor the detector counters each call adds are sent back
+        with its result and added to this process's chain, which the
+        detector metrics read.
+        """
+        if self.executor.kind != "process":
+            return await self.executor.run(func, *args)
+        result, counters = await self.executor.run(self._run_counted_sync, func, *args)
+        self.detector.add_counters(counters)
+        return result
+
+    def _run_counted_sync(self, func: Callable[..., Any], *args) -> tuple[Any, Dict[str, Any]]:
+        """Run func and take the detector counters it added (runs in a pool process)"""
+        result = func(*args)
+        return result, self.detector.take_counters()
+
+    async def _run_with_retry(self, func: Callable[..., Any], *args) -> Any:
+        """Run on the executor, waiting up to BATCH_BUSY_WAIT seconds for capacity
+        
+        Raises ComputeBusyError once the wait is used up, so a saturated pool
+        still pushes back on batch callers.
+        """
+        deadline = time.monotonic() + config.BATCH_BUSY_WAIT
+        while True:
+            try:
+                return await self._run(func, *args)
+            except ComputeBusyError as e:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise
+                await asyncio.sleep(min(e.retry_after, remaining))
+
+    def _swap_face_sync(
+        self,
+        upload_key: str,
+        profession: str,
+        angle: str,
+        result_keys: Dict[int, Optional[str]],
+        detection: Optional[Dict[str, Any]] = None,
+        blend_mode: str = "feather",
+        output_format: str = "jpeg"
+    ) -> Dict[int, np.ndarray]:
+        """Run the blocking swap pipeline (runs on the executor)"""
+        original_image, detection = self._load_source_sync(upload_key, detection)
+        return self._render_swap_sync(
+            original_image, detection, profession, angle, result_keys, blend_mode, output_format
+        )
+
+    def _load_source_sync(
+        self,
+        upload_key: str,
+        detection: Optional[Dict[str, Any]] = None
+    ) -> tuple[np.ndarray, Dict[str, Any]]:
+        """Get a decoded upload and its face detection (runs on the executor)
+        
+        The array decoded at upload time is reused when this process still
+        holds it; otherwise the stored upload is read and decoded once more.
+        """
+        original_image = self.source_cache.get(upload_key)
+        image_data = None
+        if original_image is None:
+            image_data = self.storage.read(upload_key)
+            with stage_timer("decode"):
+                original_image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+            if original_image is None:
+                raise Exception("Original image could not be decoded")
+            original_image = self.source_cache.put(upload_key, original_image)
+        
+        # Reuse the detection from upload time; only detect for legacy uploads
+        if detection is None:
+            detection = DetectionCache.read_sidecar(self.storage, upload_key)
+        if detection is None:
+            if image_data is None:
+                image_data = self.storage.read(upload_key)
+            detection = self._detect_face(original_image)
+            detection["content_hash"] = DetectionCache.content_hash(image_data)
+            DetectionCache.write_sidecar(self.storage, upload_key, detection)
+        
+        return original_image, detection
+
+    def _render_swap_sync(
+        self,
+        original_image: np.ndarray,
+        detection: Dict[str, Any],
+        profession: str,
+        angle: str,
+        result_keys: Dict[int, Optional[str]],
+        blend_mode: str = "feather",
+        output_format: str = "jpeg"
+    ) -> Dict[int, np.ndarray]:
+        """Blend selected source faces into a template and encode one result per face (runs on the executor)
+        
+        Results are stored under their key; a None key only returns the encoded bytes.
+        """
+        for index in result_keys:
+            self._select_faces(detection, index)
+        faces = self.detection_faces(detection)
+        
+        # Load template image (decoded once and shared read-only)
+        template_image = self._load_template(profession, angle)
+        
+        # Perform face swapping for every selected face in one pass
+        target_landmarks = self._template_face_landmarks(profession, angle, template_image)
+        result_images = self._perform_face_swap(
+            original_image, template_image, [faces[index] for index in result_keys] if faces else [],
+            target_landmarks, blend_mode
+        )
+        
+        encoder: OutputFormat = get_format(output_format)
+        encoded_results = {}
+        for (index, result_key), result_image in zip(result_keys.items(), result_images):
+            encoded = encode_image(result_image, encoder)
+            encoded_results[index] = encoded
+            if result_key is None:
+                continue
+            
+            # Storage writes are atomic, so readers never see a partial result
+            with stage_timer("write"):
+                self.storage.write(result_key, encoded.data)
+        
+        return encoded_results
+
     def _load_template(self, profession: str, angle: str):
-        """Load template image for given profession and angle"""
-        # Placeholder implementation - in real app, load from template directory
-        # For now, create a simple colored background
+        """Load template image for given profession and angle (read-only)"""
+        with stage_timer("template_load"):
+            return self.template_cache.get_or_render(profession, angle, self._render_template)
+
+    @staticmethod
+    def _render_template(profession: str, angle: str):
+        """Render a stand-in template when no template file exists"""
+        # Create a simple colored background
         template = np.ones((512, 512, 3), dtype=np.uint8) * 128
         
         # Add some visual indication of profession
@@ -192,51 +646,106 @@ class FaceService:
         
         return template
 
-    def _perform_face_swap(self, source_image, target_image):
-        """Perform face swapping between source and target images"""
-        # This is a simplified implementation
-        # In a real application, you would use more sophisticated techniques:
-        # 1. Face alignment using landmarks
-        # 2. Seamless cloning
-        # 3. Color correction
-        # 4. Edge blending
+    def _template_face_landmarks(self, profession: str, angle: str, template_image) -> Landmarks:
+        """Get the face landmarks of a template, detected once per template version"""
+        key = (profession, angle, self.template_cache.version(profession, angle))
+        landmarks = self._template_faces.get(key)
+        if landmarks is not None:
+            return landmarks
         
-        # For MVP, we'll do a simple overlay
-        # Resize source to match target
-        target_height, target_width = target_image.shape[:2]
-        source_resized = cv2.resize(source_image, (target_width, target_height))
+        detection = self._detect_face(template_image)
+        if detection["face_detected"]:
+            landmarks = detection["landmarks"]
+        else:
+            # No detectable face (e.g. a rendered placeholder): use a centred portrait box
+            height, width = template_image.shape[:2]
+            landmarks = basic_landmarks((width * 0.3, height * 0.2, width * 0.4, height * 0.5))
         
-        # Simple alpha blending (50% source, 50% target)
-        result = cv2.addWeighted(source_resized, 0.5, target_image, 0.5, 0)
+        if len(self._template_faces) >= 256:
+            self._template_faces.clear()
+        self._template_faces[key] = landmarks
+        return landmarks
+
+    @staticmethod
+    def _landmark_bounds(landmarks: Landmarks, margin: float, shape) -> tuple[int, int, int, int]:
+        """Bounding box (x0, y0, x1, y1) of landmarks plus a relative margin, clipped to shape"""
+        x0, y0, x1, y1 = landmarks.bounds()
+        pad_x = margin * (x1 - x0 + 1)
+        pad_y = margin * (y1 - y0 + 1)
+        height, width = shape[:2]
+        return (
+            int(max(0, x0 - pad_x)),
+            int(max(0, y0 - pad_y)),
+            int(min(width, x1 + pad_x + 1)),
+            int(min(height, y1 + pad_y + 1))
+        )
+
+    def _perform_face_swap(
+        self,
+        source_image,
+        target_image,
+        faces: List[Dict[str, Any]],
+        target_landmarks: Optional[Landmarks] = None,
+        blend_mode: str = "feather"
+    ) -> List[np.ndarray]:
+        """Swap one or more source faces into a template, one result per face
         
-        return result
+        Alignment transforms for all faces are solved in one batched
+        least-squares step on the named alignment landmarks. Warping only
+        samples the template face region, the mask is built once, and every
+        face is composited in a single (F, H, W, 3) blend, so cost scales with
+        face count and size rather than photo size.
+        """
+        if not faces or target_landmarks is None:
+            # No face to place: fall back to a simple 50/50 overlay
+            target_height, target_width = target_image.shape[:2]
+            source_resized = cv2.resize(source_image, (target_width, target_height))
+            return [cv2.addWeighted(source_resized, 0.5, target_image, 0.5, 0)]
+        
+        # Composite only inside the template face region
+        rx0, ry0, rx1, ry1 = self._landmark_bounds(target_landmarks, 0.25, target_image.shape)
+        
+        with stage_timer("align"):
+            # Fit rotation + uniform scale + translation from each source face to the region
+            src = np.stack([face["landmarks"].anchors(ALIGNMENT_NAMES) for face in faces])
+            dst = target_landmarks.anchors(ALIGNMENT_NAMES) - np.float32([rx0, ry0])
+            try:
+                matrices = similarity_transforms(src, dst)
+            except ValueError:
+                raise Exception("Could not align the face to the template")
+            
+            aligned = np.empty((len(faces), ry1 - ry0, rx1 - rx0, 3), dtype=np.uint8)
+            for matrix, face_roi in zip(matrices, aligned):
+                cv2.warpAffine(
+                    source_image, matrix, (rx1 - rx0, ry1 - ry0), dst=face_roi,
+                    flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE
+                )
+        
+        with stage_timer("blend"):
+            mask = ImageUtils.create_face_mask(target_landmarks.outline() - np.float32([rx0, ry0]), aligned.shape[1:])
+            
+            results = np.empty((len(faces),) + target_image.shape, dtype=np.uint8)
+            results[:] = target_image
+            roi = results[:, ry0:ry1, rx0:rx1]
+            ImageUtils.blend_images(aligned, roi, mask, out=roi, mode=blend_mode)
+        return list(results)
 
-    def get_face_angle(self, landmarks: List[Dict[str, Any]]) -> str:
+    def get_face_angle(self, landmarks: Optional[Landmarks]) -> str:
         """Determine the face angle from landmarks"""
-        if not landmarks:
+        if landmarks is None or len(landmarks) == 0:
             return "unknown"
         
         # Simple angle detection based on eye positions
-        left_eye = None
-        right_eye = None
-        
-        for landmark in landmarks:
-            if landmark["name"] == "left_eye":
-                left_eye = landmark
-            elif landmark["name"] == "right_eye":
-                right_eye = landmark
-        
-        if left_eye and right_eye:
-            # Calculate eye distance and position
-            eye_distance = abs(right_eye["x"] - left_eye["x"])
-            eye_center_x = (left_eye["x"] + right_eye["x"]) / 2
-            
-            # Simple heuristics for angle detection
-            if eye_distance < 50:  # Eyes very close - likely side view
-                return "side"
-            elif eye_distance > 100:  # Eyes far apart - likely front view
-                return "front"
-            else:
-                return "three_quarter"
-        
-        return "unknown" 
\ No newline at end of file
+        left_eye = landmarks.point("left_eye")
+        right_eye = landmarks.point("right_eye")
+        
+        # Calculate eye distance
+        eye_distance = abs(float(right_eye[0] - left_eye[0]))
+        
+        # Simple heuristics for angle detection
+        if eye_distance < 50:  # Eyes very close - likely side view
+            return "side"
+        elif eye_distance > 100:  # Eyes far apart - likely front view
+            return "front"
+        else:
+            return "three_quarter"
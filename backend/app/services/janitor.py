@@ -0,0 +1,420 @@
+"""
+Retention for uploads and results: TTLs, size quotas and LRU eviction
+
+Uploads and results are content-addressed, so anything deleted is simply
+recreated by the next upload of the same image or the next identical swap.
+Each sweep, per area,
+
+- deletes objects not used for longer than the area's TTL,
+- if the area is still over its byte quota, deletes the least recently
+  used objects until it is below ``JANITOR_LOW_WATERMARK`` of the quota,
+- removes abandoned upload staging files older than ``JANITOR_TEMP_AGE``.
+
+Sweeps read the storage's ``SessionIndex`` when it has one: expired and
+least recently used objects come from an indexed query and nothing is
+walked. Every ``JANITOR_RECONCILE_INTERVAL`` (and always without an index)
+a sweep instead walks the whole area, which also removes partial writes,
+moves files from the pre-sharding flat layout into their shard
+directories, and brings the index back in line with what is stored.
+
+An upload and its detection sidecar (and the encodings of one result)
+share an ID and are kept or deleted together. "Used" means the latest
+read or write: the index records reads, and walks use file access times,
+which ``LocalStorage`` refreshes on reads. S3 has no access time, so
+objects only indexed elsewhere age from their last write there.
+
+Sweeps run in a thread, either inside the API (started on app startup) or
+from the command line:
+
+    python -m app.services.janitor [--dry-run] [--loop]
+
+A flock on ``JANITOR_LOCK_FILE`` lets one process sweep at a time, and the
+file records when the last sweep and walk ran, so every gunicorn worker
+(and a CLI run from cron) on a host follows one ``JANITOR_INTERVAL``
+schedule. Sessions idle for longer than ``SESSION_TTL`` are dropped from
+the index at the same time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: sweeps are not serialised across processes
+    fcntl = None
+
+from .. import config
+from ..utils.metrics import (
+    JANITOR_RECLAIMED_BYTES, JANITOR_RECLAIMED_FILES, JANITOR_SWEEP_SECONDS, STORED_BYTES, STORED_FILES
+)
+from .session_index import SessionIndex
+from .storage import TEMP_MARKER, Storage, StoredObject, get_storage, object_group
+from .upload_ingest import STAGING_PREFIX
+
+REASONS = ("ttl", "quota", "temp")
+
+
+class RetentionPolicy(NamedTuple):
+    """How long and how much of one storage area to keep"""
+    ttl: float  # seconds since last use; 0 keeps objects forever
+    max_bytes: int  # 0 means no quota
+
+
+class _ObjectGroup:
+    """Objects sharing an ID, e.g. an upload and its detection sidecar"""
+
+    __slots__ = ("objects", "size", "last_used_ns")
+
+    def __init__(self):
+        self.objects: List[StoredObject] = []
+        self.size = 0
+        self.last_used_ns = 0
+
+    @property
+    def keys(self) -> List[str]:
+        return [stored.key for stored in self.objects]
+
+
+class StorageJanitor:
+    """Applies retention policies to storage areas"""
+
+    def __init__(
+        self,
+        storage: Storage,
+        policies: Dict[str, RetentionPolicy],
+        lock_file: str,
+        interval: float = 3600,
+        temp_age: float = 3600,
+        low_watermark: float = 0.9,
+        staging_dir: Optional[str] = None,
+        index: Optional[SessionIndex] = None,
+        reconcile_interval: float = 86400,
+        session_ttl: float = 0,
+    ):
+        self.storage = storage
+        self.policies = policies
+        self.lock_file = lock_file
+        self.interval = interval
+        self.temp_age_ns = int(temp_age * 1e9)
+        self.low_watermark = max(0.0, min(1.0, low_watermark))
+        self.staging_dir = staging_dir
+        self.index = index
+        self.reconcile_interval = reconcile_interval
+        self.session_ttl = session_ttl
+
+        self._listing: Dict[str, List[StoredObject]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = threading.Event()
+
+    def _try_lock(self) -> Optional[int]:
+        """Open and lock the lock file, or None if another process holds it"""
+        directory = os.path.dirname(self.lock_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return None
+        return fd
+
+    def sweep(self, force: bool = False, dry_run: bool = False, walk: bool = False) -> Optional[Dict[str, Any]]:
+        """Sweep every area if a sweep is due (or forced)
+
+        walk forces a full walk of each area even when an index is available.
+        Returns the sweep report, or None when another process is sweeping
+        or the last sweep was less than an interval ago.
+        """
+        fd = self._try_lock()
+        if fd is None:
+            return None
+        try:
+            try:
+                state = json.loads(os.pread(fd, 4096, 0).decode("utf-8"))
+            except ValueError:
+                state = {}
+            now = time.time()
+            if not force and now - state.get("last_sweep", 0) < self.interval:
+                return None
+            walk = walk or self.index is None or now - state.get("last_walk", 0) >= self.reconcile_interval
+
+            start = time.perf_counter()
+            report: Dict[str, Any] = {"started_at": now, "dry_run": dry_run, "walk": walk, "areas": {}}
+            for area, policy in self.policies.items():
+                if self._stopping.is_set():
+                    break
+                reclaimed = {reason: {"files": 0, "bytes": 0} for reason in REASONS}
+                if area == "uploads" and self.staging_dir:
+                    self._clean_staging(dry_run, reclaimed)
+                migrated = self._walk_area(area, dry_run, reclaimed) if walk else 0
+                if self.index is not None and not (walk and dry_run):
+                    area_report = self._apply_indexed(area, policy, dry_run, reclaimed)
+                else:
+                    area_report = self._apply_listed(area, policy, dry_run, reclaimed)
+                report["areas"][area] = {**area_report, "migrated": migrated, "reclaimed": reclaimed}
+            if self.index is not None and self.session_ttl > 0 and not dry_run:
+                report["sessions_pruned"] = self.index.prune_sessions(self.session_ttl)
+            report["duration_s"] = round(time.perf_counter() - start, 3)
+
+            if not dry_run:
+                JANITOR_SWEEP_SECONDS.observe(time.perf_counter() - start)
+                state["last_sweep"] = now
+                if walk:
+                    state["last_walk"] = now
+                os.ftruncate(fd, 0)
+                os.pwrite(fd, json.dumps(state).encode("utf-8"), 0)
+            return report
+        finally:
+            os.close(fd)
+
+    def _walk_area(self, area: str, dry_run: bool, reclaimed: Dict[str, Dict[str, int]]) -> int:
+        """List a whole area: tidy its layout, drop stale partial writes and refresh the index
+
+        Returns how many files were moved out of the flat layout. Without an
+        index (or on a dry run) the listing is kept for _apply_listed.
+        """
+        started_ns = time.time_ns()
+        migrated = 0 if dry_run else self.storage.compact(area)
+        objects: List[StoredObject] = []
+        for stored in self.storage.scan(area):
+            if self._stopping.is_set():
+                return migrated
+            if TEMP_MARKER in stored.key.rsplit("/", 1)[-1]:
+                if stored.mtime_ns < started_ns - self.temp_age_ns:
+                    self._delete(area, "temp", [stored.key], stored.size, dry_run, reclaimed)
+                continue
+            objects.append(stored)
+
+        if self.index is not None and not dry_run:
+            # Upserts keep the later of the index's and the files' last use
+            self.index.reconcile(area, objects, started_ns)
+        else:
+            self._listing[area] = objects
+        return migrated
+
+    def _apply_indexed(
+        self,
+        area: str,
+        policy: RetentionPolicy,
+        dry_run: bool,
+        reclaimed: Dict[str, Dict[str, int]]
+    ) -> Dict[str, int]:
+        """Apply one area's policy to the groups the index knows about"""
+        now_ns = time.time_ns()
+        ttl_cutoff = now_ns - int(policy.ttl * 1e9) if policy.ttl > 0 else 0
+        if ttl_cutoff:
+            for keys, size in self.index.groups_by_last_used(area, before_ns=ttl_cutoff):
+                if self._stopping.is_set():
+                    break
+                self._delete(area, "ttl", keys, size, dry_run, reclaimed)
+
+        files, total_bytes = self.index.usage(area)
+        if dry_run:
+            files -= reclaimed["ttl"]["files"]
+            total_bytes -= reclaimed["ttl"]["bytes"]
+        if policy.max_bytes > 0 and total_bytes > policy.max_bytes:
+            # Evict well below the quota so the next few writes don't trigger another round
+            target_bytes = policy.max_bytes * self.low_watermark
+            for keys, size in self.index.groups_by_last_used(area, since_ns=ttl_cutoff):
+                if total_bytes <= target_bytes or self._stopping.is_set():
+                    break
+                self._delete(area, "quota", keys, size, dry_run, reclaimed)
+                files -= len(keys)
+                total_bytes -= size
+
+        if not dry_run:
+            STORED_FILES.labels(area=area).set(files)
+            STORED_BYTES.labels(area=area).set(total_bytes)
+        return {"files": files, "bytes": total_bytes}
+
+    def _apply_listed(
+        self,
+        area: str,
+        policy: RetentionPolicy,
+        dry_run: bool,
+        reclaimed: Dict[str, Dict[str, int]]
+    ) -> Dict[str, int]:
+        """Apply one area's policy to the listing taken by _walk_area"""
+        now_ns = time.time_ns()
+        groups: Dict[str, _ObjectGroup] = {}
+        for stored in self._listing.pop(area, []):
+            group_id = object_group(stored.key)
+            group = groups.get(group_id)
+            if group is None:
+                group = groups[group_id] = _ObjectGroup()
+            group.objects.append(stored)
+            group.size += stored.size
+            group.last_used_ns = max(group.last_used_ns, stored.atime_ns, stored.mtime_ns)
+
+        kept = []
+        ttl_cutoff = now_ns - int(policy.ttl * 1e9) if policy.ttl > 0 else None
+        for group in groups.values():
+            if ttl_cutoff is not None and group.last_used_ns < ttl_cutoff:
+                self._delete(area, "ttl", group.keys, group.size, dry_run, reclaimed)
+            else:
+                kept.append(group)
+
+        total_bytes = sum(group.size for group in kept)
+        if policy.max_bytes > 0 and total_bytes > policy.max_bytes:
+            target_bytes = policy.max_bytes * self.low_watermark
+            kept.sort(key=lambda group: group.last_used_ns)
+            evicted = 0
+            while evicted < len(kept) and total_bytes > target_bytes and not self._stopping.is_set():
+                group = kept[evicted]
+                self._delete(area, "quota", group.keys, group.size, dry_run, reclaimed)
+                total_bytes -= group.size
+                evicted += 1
+            kept = kept[evicted:]
+
+        files = sum(len(group.objects) for group in kept)
+        if not dry_run:
+            STORED_FILES.labels(area=area).set(files)
+            STORED_BYTES.labels(area=area).set(total_bytes)
+        return {"files": files, "bytes": total_bytes}
+
+    def _clean_staging(self, dry_run: bool, reclaimed: Dict[str, Dict[str, int]]):
+        """Remove upload bodies abandoned mid-request (e.g. by a killed worker)"""
+        if not os.path.isdir(self.staging_dir):
+            return
+        cutoff = time.time_ns() - self.temp_age_ns
+        with os.scandir(self.staging_dir) as entries:
+            stale = []
+            for entry in entries:
+                if not entry.name.startswith(STAGING_PREFIX):
+                    continue
+                try:
+                    stat_result = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                if stat_result.st_mtime_ns < cutoff:
+                    stale.append((entry.path, stat_result.st_size))
+        for path, size in stale:
+            if not dry_run:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                JANITOR_RECLAIMED_FILES.labels(area="uploads", reason="temp").inc()
+                JANITOR_RECLAIMED_BYTES.labels(area="uploads", reason="temp").inc(size)
+            reclaimed["temp"]["files"] += 1
+            reclaimed["temp"]["bytes"] += size
+
+    def _delete(
+        self,
+        area: str,
+        reason: str,
+        keys: List[str],
+        size: int,
+        dry_run: bool,
+        reclaimed: Dict[str, Dict[str, int]]
+    ):
+        """Delete a group of objects and account for the space freed"""
+        if not dry_run:
+            try:
+                for key in keys:
+                    self.storage.delete(key)
+            except Exception as e:
+                print(f"Error deleting {keys[0]}: {str(e)}")
+                return
+            JANITOR_RECLAIMED_FILES.labels(area=area, reason=reason).inc(len(keys))
+            JANITOR_RECLAIMED_BYTES.labels(area=area, reason=reason).inc(size)
+        reclaimed[reason]["files"] += len(keys)
+        reclaimed[reason]["bytes"] += size
+
+    def start(self):
+        """Start sweeping in the background of the running event loop"""
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop background sweeps, cutting short a sweep in progress"""
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        """Check whether a sweep is due about once a minute, forever"""
+        check_interval = max(1.0, min(float(self.interval), 60.0))
+        while True:
+            # Jitter so workers started together don't all contend for the lock
+            await asyncio.sleep(check_interval * random.uniform(0.5, 1.5))
+            try:
+                report = await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                print(f"Error in storage janitor: {str(e)}")
+                continue
+            if report is not None:
+                print(f"Storage janitor: {summarize(report)}")
+
+
+def summarize(report: Dict[str, Any]) -> str:
+    """One-line summary of a sweep report"""
+    parts = []
+    for area, area_report in report["areas"].items():
+        files = sum(entry["files"] for entry in area_report["reclaimed"].values())
+        size = sum(entry["bytes"] for entry in area_report["reclaimed"].values())
+        parts.append(
+            f"{area}: reclaimed {files} files / {size} bytes, "
+            f"kept {area_report['files']} files / {area_report['bytes']} bytes"
+        )
+    return f"{'; '.join(parts)} in {report['duration_s']}s"
+
+
+def create_janitor(storage: Optional[Storage] = None) -> StorageJanitor:
+    """Build a janitor with the retention settings from config"""
+    storage = storage or get_storage()
+    return StorageJanitor(
+        storage,
+        {
+            "uploads": RetentionPolicy(config.UPLOAD_TTL, config.UPLOAD_MAX_BYTES),
+            "results": RetentionPolicy(config.RESULT_TTL, config.RESULT_MAX_BYTES),
+        },
+        lock_file=config.JANITOR_LOCK_FILE,
+        interval=config.JANITOR_INTERVAL,
+        temp_age=config.JANITOR_TEMP_AGE,
+        low_watermark=config.JANITOR_LOW_WATERMARK,
+        staging_dir=config.UPLOAD_DIR,
+        index=storage.index,
+        reconcile_interval=config.JANITOR_RECONCILE_INTERVAL,
+        session_ttl=config.SESSION_TTL,
+    )
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Apply retention policies to uploads and results")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted without deleting")
+    parser.add_argument("--walk", action="store_true", help="Walk every area instead of reading the index")
+    parser.add_argument("--loop", action="store_true", help="Keep sweeping every JANITOR_INTERVAL instead of once")
+    args = parser.parse_args()
+
+    janitor = create_janitor()
+    if not args.loop:
+        report = janitor.sweep(force=True, dry_run=args.dry_run, walk=args.walk)
+        if report is None:
+            raise SystemExit("Another process is sweeping; try again later")
+        print(json.dumps(report, indent=2))
+        return
+
+    while True:
+        report = janitor.sweep(dry_run=args.dry_run)
+        if report is not None:
+            print(json.dumps(report))
+        time.sleep(max(1.0, min(float(janitor.interval), 60.0)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from .. import config
+from ..models.schemas import ProcessingStatus
+from ..utils.executor import ComputeBusyError
+
+TERMINAL_STATES = ("completed", "failed")
+
+# A job body receives a progress callback: await progress(percent, message)
+ProgressCallback = Callable[[int, str], Awaitable[None]]
+JobFunc = Callable[[ProgressCallback], Awaitable[str]]
+
+
+def interrupted_status(job_id: str, error: str) -> ProcessingStatus:
+    """Status recorded for a job whose worker stopped before it finished"""
+    return ProcessingStatus(job_id=job_id, status="failed", message="Job interrupted", error=error)
+
+
+class JobStore(ABC):
+    """Storage interface for background job state
+
+    Implementations only need get/put; any key-value store with the same
+    semantics (e.g. a Redis-compatible server) can replace the local ones.
+    A job that is still pending or processing after ``stale_timeout``
+    seconds without an update belongs to a worker that crashed or was
+    recycled, and is reported as failed so pollers and event streams end.
+    """
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[ProcessingStatus]:
+        """Get the current status of a job"""
+
+    @abstractmethod
+    async def put(self, job_id: str, status: ProcessingStatus):
+        """Create or replace the status of a job"""
+
+    async def wait_for_update(self, job_id: str, since: Optional[ProcessingStatus], timeout: float):
+        """Wait until a job may have changed from `since`, or timeout elapses"""
+        await asyncio.sleep(min(timeout, config.JOB_POLL_INTERVAL))
+
+    async def close(self):
+        """Release store resources"""
+
+
+class InMemoryJobStore(JobStore):
+    """Job store kept in this process; only valid with a single worker"""
+
+    def __init__(self, ttl: int = 3600, stale_timeout: int = 900):
+        self.ttl = ttl
+        self.stale_timeout = stale_timeout
+        self._jobs: Dict[str, ProcessingStatus] = {}
+        self._updated_at: Dict[str, float] = {}
+        self._events: Dict[str, asyncio.Event] = {}
+
+    async def get(self, job_id: str) -> Optional[ProcessingStatus]:
+        """Get the current status of a job"""
+        status = self._jobs.get(job_id)
+        if (
+            status is not None and status.status not in TERMINAL_STATES
+            and self._updated_at[job_id] < time.time() - self.stale_timeout
+        ):
+            status = interrupted_status(job_id, f"No progress for {self.stale_timeout} seconds")
+            await self.put(job_id, status)
+        return status
+
+    async def put(self, job_id: str, status: ProcessingStatus):
+        """Create or replace the status of a job and wake waiters"""
+        if job_id not in self._jobs:
+            self._prune()
+        self._jobs[job_id] = status
+        self._updated_at[job_id] = time.time()
+
+        # Wake everyone waiting on the previous state
+        event = self._events.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def wait_for_update(self, job_id: str, since: Optional[ProcessingStatus], timeout: float):
+        """Wait for the next put() on this job"""
+        if self._jobs.get(job_id) is not since:
+            return
+        event = self._events.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _prune(self):
+        """Drop finished jobs older than the TTL"""
+        cutoff = time.time() - self.ttl
+        expired = [
+            job_id for job_id, status in self._jobs.items()
+            if status.status in TERMINAL_STATES and self._updated_at[job_id] < cutoff
+        ]
+        for job_id in expired:
+            self._jobs.pop(job_id, None)
+            self._updated_at.pop(job_id, None)
+
+
+class SQLiteJobStore(JobStore):
+    """Job store in a local SQLite file, shared by all workers on a host"""
+
+    def __init__(self, path: str = "jobs.db", ttl: int = 3600, stale_timeout: int = 900):
+        self.path = path
+        self.ttl = ttl
+        self.stale_timeout = stale_timeout
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database on first use"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                "status TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _get_sync(self, job_id: str) -> Optional[ProcessingStatus]:
+        """Read a job row, failing it if it went stale (runs in a worker thread)"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT data, status, updated_at FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        data, state, updated_at = row
+        if state not in TERMINAL_STATES and updated_at < time.time() - self.stale_timeout:
+            status = interrupted_status(job_id, f"No progress for {self.stale_timeout} seconds")
+            self._put_sync(job_id, status)
+            return status
+        return ProcessingStatus(**json.loads(data))
+
+    def _put_sync(self, job_id: str, status: ProcessingStatus):
+        """Upsert a job row and prune expired ones (runs in a worker thread)"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, data, status, updated_at) VALUES (?, ?, ?, ?)",
+                (job_id, status.model_dump_json(), status.status, now)
+            )
+            if status.status == "pending":
+                # Stale unfinished rows are never read as failed if nobody polls them
+                conn.execute(
+                    "DELETE FROM jobs WHERE updated_at < ? AND (status IN (?, ?) OR updated_at < ?)",
+                    (now - self.ttl, *TERMINAL_STATES, now - self.ttl - self.stale_timeout)
+                )
+            conn.commit()
+
+    async def get(self, job_id: str) -> Optional[ProcessingStatus]:
+        """Get the current status of a job"""
+        return await asyncio.to_thread(self._get_sync, job_id)
+
+    async def put(self, job_id: str, status: ProcessingStatus):
+        """Create or replace the status of a job"""
+        await asyncio.to_thread(self._put_sync, job_id, status)
+
+    async def close(self):
+        """Close the database connection"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class RedisJobStore(JobStore):
+    """Job store in Redis (or any server speaking the Redis protocol)"""
+
+    def __init__(self, url: str, ttl: int = 3600, prefix: str = "ai-swap:job:", stale_timeout: int = 900):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise Exception("redis package is required for JOB_STORE=redis")
+
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stale_timeout = stale_timeout
+        self._client = redis_asyncio.from_url(url)
+
+    async def get(self, job_id: str) -> Optional[ProcessingStatus]:
+        """Get the current status of a job"""
+        data = await self._client.get(self.prefix + job_id)
+        if data is None:
+            return None
+        return ProcessingStatus(**json.loads(data))
+
+    async def put(self, job_id: str, status: ProcessingStatus):
+        """Create or replace the status of a job, expiring after the TTL
+        
+        Unfinished jobs expire after stale_timeout instead, so a job whose
+        worker died reads as not found rather than running forever.
+        """
+        ttl = self.ttl if status.status in TERMINAL_STATES else self.stale_timeout
+        await self._client.set(self.prefix + job_id, status.model_dump_json(), ex=ttl)
+
+    async def close(self):
+        """Close the Redis connection pool"""
+        await self._client.close()
+
+
+def create_job_store(kind: Optional[str] = None) -> JobStore:
+    """Create the job store selected by JOB_STORE"""
+    kind = kind or config.JOB_STORE
+    if kind == "memory":
+        return InMemoryJobStore(ttl=config.JOB_TTL, stale_timeout=config.JOB_STALE_TIMEOUT)
+    if kind == "sqlite":
+        return SQLiteJobStore(path=config.JOB_SQLITE_PATH, ttl=config.JOB_TTL, stale_timeout=config.JOB_STALE_TIMEOUT)
+    if kind == "redis":
+        return RedisJobStore(url=config.JOB_REDIS_URL, ttl=config.JOB_TTL, stale_timeout=config.JOB_STALE_TIMEOUT)
+    raise ValueError(f"Unknown job store: {kind}")
+
+
+class JobService:
+    """Run swap work in the background and track it as ProcessingStatus"""
+
+    def __init__(self, store: Optional[JobStore] = None, max_pending: Optional[int] = None):
+        self.store = store or create_job_store()
+        self.max_pending = max_pending if max_pending is not None else config.JOB_MAX_PENDING
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs accepted by this worker and not yet finished"""
+        return len(self._tasks)
+
+    async def submit(self, func: JobFunc, retry_after: int = 2) -> str:
+        """Accept a job and start it in the background, returning its ID"""
+        if self.pending >= self.max_pending:
+            raise ComputeBusyError(retry_after)
+
+        job_id = str(uuid.uuid4())
+        await self.store.put(job_id, ProcessingStatus(
+            job_id=job_id,
+            status="pending",
+            progress=0,
+            message="Job queued"
+        ))
+
+        task = asyncio.create_task(self._run(job_id, func))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job_id
+
+    async def get_status(self, job_id: str) -> Optional[ProcessingStatus]:
+        """Get the status of a job"""
+        return await self.store.get(job_id)
+
+    async def _run(self, job_id: str, func: JobFunc):
+        """Execute a job, retrying while the compute executor is saturated"""
+        async def progress(percent: int, message: str):
+            await self.store.put(job_id, ProcessingStatus(
+                job_id=job_id,
+                status="processing",
+                progress=percent,
+                message=message
+            ))
+
+        try:
+            while True:
+                try:
+                    await progress(5, "Processing started")
+                    result_path = await func(progress)
+                    await self.store.put(job_id, ProcessingStatus(
+                        job_id=job_id,
+                        status="completed",
+                        progress=100,
+                        message="Job completed",
+                        result_path=result_path
+                    ))
+                    return
+                except ComputeBusyError as e:
+                    # Stay queued until the executor has room again
+                    await self.store.put(job_id, ProcessingStatus(
+                        job_id=job_id,
+                        status="pending",
+                        progress=0,
+                        message="Waiting for compute capacity"
+                    ))
+                    await asyncio.sleep(e.retry_after)
+                except Exception as e:
+                    await self.store.put(job_id, ProcessingStatus(
+                        job_id=job_id,
+                        status="failed",
+                        message="Job failed",
+                        error=str(e)
+                    ))
+                    return
+        except asyncio.CancelledError:
+            # Worker shutdown: record the failure so pollers stop waiting
+            await self.store.put(job_id, interrupted_status(
+                job_id, "Worker shut down before the job finished"
+            ))
+            raise
+
+    async def stream_events(self, job_id: str, keepalive: float = 15.0):
+        """Yield server-sent events for a job until it finishes"""
+        last_payload = None
+        last_sent = time.monotonic()
+        while True:
+            status = await self.store.get(job_id)
+            if status is None:
+                yield "event: error\ndata: {\"detail\": \"Job not found\"}\n\n"
+                return
+
+            payload = status.model_dump_json()
+            if payload != last_payload:
+                last_payload = payload
+                last_sent = time.monotonic()
+                yield f"event: status\ndata: {payload}\n\n"
+                if status.status in TERMINAL_STATES:
+                    return
+            elif time.monotonic() - last_sent >= keepalive:
+                last_sent = time.monotonic()
+                yield ": keepalive\n\n"
+
+            await self.store.wait_for_update(job_id, status, keepalive)
+
+    async def shutdown(self):
+        """Cancel running jobs, wait for them to record their failure and close the store"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.store.close()
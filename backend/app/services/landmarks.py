@@ -0,0 +1,278 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+from .. import config
+from ..models.schemas import FaceLandmarks, LandmarkPoint
+
+# Columns of a landmark array
+X, Y, VISIBILITY = 0, 1, 2
+
+# Points used to align two faces; every layout defines them
+ALIGNMENT_NAMES = ("left_eye", "right_eye", "nose", "mouth", "chin")
+
+
+class LandmarkLayout:
+    """Fixed point order of a landmark model plus a named-index table
+
+    ``names`` maps a semantic name to the point indices that make it up; a
+    named point is the mean of its indices. Left/right are as seen in the
+    image.
+    """
+
+    def __init__(self, name: str, size: int, names: Dict[str, Tuple[int, ...]], outline: Sequence[int]):
+        self.name = name
+        self.size = size
+        self.names = names
+        self.outline = np.asarray(outline, dtype=np.intp)
+
+
+BASIC_LAYOUT = LandmarkLayout(
+    "basic7",
+    7,
+    {
+        "nose": (0,),
+        "left_eye": (1,),
+        "right_eye": (2,),
+        "left_ear": (3,),
+        "right_ear": (4,),
+        "mouth": (5,),
+        "chin": (6,),
+    },
+    outline=range(7),
+)
+
+# 68-point iBUG layout used by LBF facemark models
+IBUG68_LAYOUT = LandmarkLayout(
+    "ibug68",
+    68,
+    {
+        "nose": (30,),
+        "left_eye": tuple(range(36, 42)),
+        "right_eye": tuple(range(42, 48)),
+        "left_ear": (0,),
+        "right_ear": (16,),
+        "mouth": tuple(range(48, 68)),
+        "chin": (8,),
+    },
+    # Jaw line plus brows encloses the face
+    outline=tuple(range(0, 27)),
+)
+
+LAYOUTS = {layout.name: layout for layout in (BASIC_LAYOUT, IBUG68_LAYOUT)}
+
+# Basic layout as fractions of the face box: (x, y) per point
+_BASIC_OFFSETS = np.array([
+    [0.5, 0.5],         # nose
+    [0.25, 0.25],       # left_eye
+    [0.75, 0.25],       # right_eye
+    [0.0, 0.5],         # left_ear
+    [1.0, 0.5],         # right_ear
+    [0.5, 0.5 + 1 / 3], # mouth
+    [0.5, 1.0],         # chin
+], dtype=np.float32)
+
+
+class Landmarks:
+    """Landmarks of one face as an (N, 3) float32 array of x, y, visibility"""
+
+    __slots__ = ("points", "layout")
+
+    def __init__(self, points: np.ndarray, layout: LandmarkLayout):
+        self.points = points
+        self.layout = layout
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    @property
+    def xy(self) -> np.ndarray:
+        """(N, 2) view of the point coordinates"""
+        return self.points[:, :2]
+
+    def point(self, name: str) -> np.ndarray:
+        """Get a named point as (x, y)"""
+        indices = self.layout.names[name]
+        if len(indices) == 1:
+            return self.points[indices[0], :2]
+        return self.points[list(indices), :2].mean(axis=0)
+
+    def anchors(self, names: Sequence[str] = ALIGNMENT_NAMES) -> np.ndarray:
+        """Get several named points as a (K, 2) float32 array"""
+        return np.stack([self.point(name) for name in names]).astype(np.float32, copy=False)
+
+    def outline(self) -> np.ndarray:
+        """(K, 2) points enclosing the face, for building masks"""
+        return self.points[self.layout.outline, :2]
+
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """Bounding box (x0, y0, x1, y1) of all points"""
+        x0, y0 = self.xy.min(axis=0)
+        x1, y1 = self.xy.max(axis=0)
+        return float(x0), float(y0), float(x1), float(y1)
+
+    def to_json(self) -> Dict[str, Any]:
+        """Compact JSON form for detection sidecars"""
+        return {"layout": self.layout.name, "points": self.points.astype(np.float64).round(2).tolist()}
+
+    @classmethod
+    def from_json(cls, data: Union[Dict[str, Any], List[Dict[str, Any]], None]) -> Optional["Landmarks"]:
+        """Load landmarks from a sidecar, including the older list-of-dicts form"""
+        if not data:
+            return None
+        if isinstance(data, list):
+            # Pre-array sidecars hold one dict per basic landmark
+            by_name = {point["name"]: point for point in data}
+            points = np.ones((BASIC_LAYOUT.size, 3), dtype=np.float32)
+            for name, (index,) in BASIC_LAYOUT.names.items():
+                point = by_name[name]
+                points[index, X], points[index, Y] = point["x"], point["y"]
+                points[index, VISIBILITY] = point.get("visibility", 1.0)
+            return cls(points, BASIC_LAYOUT)
+        layout = LAYOUTS[data["layout"]]
+        return cls(np.asarray(data["points"], dtype=np.float32).reshape(layout.size, 3), layout)
+
+    def to_schema(self) -> FaceLandmarks:
+        """Convert to the API schema (only at the response boundary)"""
+        index_names = {}
+        for name, indices in self.layout.names.items():
+            if len(indices) == 1:
+                index_names[indices[0]] = name
+        return FaceLandmarks(
+            layout=self.layout.name,
+            points=[
+                LandmarkPoint(
+                    name=index_names.get(index, str(index)),
+                    x=float(x),
+                    y=float(y),
+                    visibility=float(visibility)
+                )
+                for index, (x, y, visibility) in enumerate(self.points.tolist())
+            ]
+        )
+
+
+def basic_landmarks(box: Sequence[float]) -> Landmarks:
+    """Place the basic seven landmarks at fixed positions in a face box"""
+    return basic_landmarks_many([box])[0]
+
+
+def basic_landmarks_many(boxes: Sequence[Sequence[float]]) -> List[Landmarks]:
+    """Place the basic landmarks for several face boxes in one array operation"""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    points = np.ones((len(boxes), BASIC_LAYOUT.size, 3), dtype=np.float32)
+    points[:, :, :2] = _BASIC_OFFSETS[None] * boxes[:, None, 2:] + boxes[:, None, :2]
+    return [Landmarks(face_points, BASIC_LAYOUT) for face_points in points]
+
+
+def similarity_transforms(src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """Least-squares rotation + uniform scale + translation for a batch of faces
+
+    ``src`` and ``dst`` are (F, K, 2) point sets (either may be broadcast
+    from (K, 2)). Returns (F, 2, 3) matrices mapping src onto dst, in the
+    form cv2.warpAffine takes.
+    """
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    src, dst = np.broadcast_arrays(src, dst)
+    src = src.reshape(-1, src.shape[-2], 2)
+    dst = dst.reshape(-1, dst.shape[-2], 2)
+
+    src_mean = src.mean(axis=1)
+    dst_mean = dst.mean(axis=1)
+    sc = src - src_mean[:, None]
+    dc = dst - dst_mean[:, None]
+
+    norm = (sc ** 2).sum(axis=(1, 2))
+    if np.any(norm <= 1e-9):
+        raise ValueError("Degenerate landmarks: all points coincide")
+    a = (sc[..., 0] * dc[..., 0] + sc[..., 1] * dc[..., 1]).sum(axis=1) / norm
+    b = (sc[..., 0] * dc[..., 1] - sc[..., 1] * dc[..., 0]).sum(axis=1) / norm
+
+    matrices = np.empty((len(src), 2, 3), dtype=np.float64)
+    matrices[:, 0, 0], matrices[:, 0, 1] = a, -b
+    matrices[:, 1, 0], matrices[:, 1, 1] = b, a
+    matrices[:, :, 2] = dst_mean - np.einsum("fij,fj->fi", matrices[:, :, :2], src_mean)
+    return matrices
+
+
+class BoxLandmarker:
+    """Landmarks placed geometrically from the face box (no model)"""
+
+    name = "box"
+
+    def fit(self, gray: np.ndarray, box: Sequence[int]) -> Landmarks:
+        """Get landmarks for a face box"""
+        return basic_landmarks(box)
+
+    def fit_many(self, gray: np.ndarray, boxes: Sequence[Sequence[int]]) -> List[Landmarks]:
+        """Get landmarks for several face boxes"""
+        return basic_landmarks_many(boxes)
+
+
+class LBFLandmarker:
+    """OpenCV LBF facemark (68 points) loaded from a local model file
+
+    Needs the ``cv2.face`` module from opencv-contrib. Falls back to the box
+    landmarks for a face the model cannot fit.
+    """
+
+    name = "lbf"
+
+    def __init__(self, model_path: str):
+        if not hasattr(cv2, "face"):
+            raise Exception("cv2.face is not available (install opencv-contrib-python-headless)")
+        if not os.path.exists(model_path):
+            raise Exception(f"LBF model not found: {model_path}")
+        self.model_path = model_path
+        # Facemark instances are not safe to share between threads
+        self._local = threading.local()
+
+    def _facemark(self):
+        """Get this thread's facemark instance"""
+        facemark = getattr(self._local, "facemark", None)
+        if facemark is None:
+            facemark = cv2.face.createFacemarkLBF()
+            facemark.loadModel(self.model_path)
+            self._local.facemark = facemark
+        return facemark
+
+    def fit(self, gray: np.ndarray, box: Sequence[int]) -> Landmarks:
+        """Fit 68 landmarks inside a face box"""
+        return self.fit_many(gray, [box])[0]
+
+    def fit_many(self, gray: np.ndarray, boxes: Sequence[Sequence[int]]) -> List[Landmarks]:
+        """Fit 68 landmarks inside several face boxes in one model call"""
+        ok, shapes = self._facemark().fit(gray, np.array(boxes, dtype=np.int32).reshape(-1, 4))
+        if not ok or len(shapes) != len(boxes):
+            return basic_landmarks_many(boxes)
+        points = np.ones((len(boxes), IBUG68_LAYOUT.size, 3), dtype=np.float32)
+        points[:, :, :2] = np.asarray(shapes, dtype=np.float32).reshape(len(boxes), -1, 2)
+        return [Landmarks(face_points, IBUG68_LAYOUT) for face_points in points]
+
+
+def create_landmarker(name: Optional[str] = None):
+    """Create the landmark model selected by LANDMARK_MODEL, falling back to box"""
+    name = name or config.LANDMARK_MODEL
+    if name == "lbf":
+        try:
+            return LBFLandmarker(config.LANDMARK_LBF_MODEL)
+        except Exception as e:
+            print(f"Landmark model 'lbf' unavailable: {str(e)}")
+    elif name != "box":
+        raise ValueError(f"Unknown landmark model: {name}")
+    return BoxLandmarker()
+
+
+_landmarker = None
+
+
+def get_landmarker():
+    """Get the process-wide landmark model"""
+    global _landmarker
+    if _landmarker is None:
+        _landmarker = create_landmarker()
+    return _landmarker
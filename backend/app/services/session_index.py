@@ -0,0 +1,360 @@
+"""
+Embedded SQLite index of sessions and stored uploads/results
+
+Two kinds of rows live in one WAL-mode database shared by every worker on
+a host (``SESSION_INDEX_PATH``):
+
+- ``assets`` mirrors every object in the sharded storage areas: size,
+  mtime and when its group (an upload and its sidecar, or the encodings
+  of one result) was last used. Storage backends keep it current on
+  write, read and delete, so retention can pick expired or least recently
+  used objects with an indexed query, and S3 existence checks for
+  immutable objects can skip a HEAD request.
+- ``sessions`` and ``session_assets`` record which uploads and results
+  each client session produced, so ``GET /sessions/{id}`` can page through
+  them without remembering IDs client-side or scanning directories.
+
+Every statement is a constant SQL string with bound parameters, so
+sqlite3's per-connection statement cache prepares each one once. The
+connection is opened lazily and reopened after a fork.
+"""
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .. import config
+from .storage import ObjectInfo, StoredObject, object_group, split_key
+
+SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS assets ("
+    "key TEXT PRIMARY KEY, area TEXT NOT NULL, group_id TEXT NOT NULL, size INTEGER NOT NULL, "
+    "mtime_ns INTEGER NOT NULL, last_used_ns INTEGER NOT NULL, seen INTEGER NOT NULL DEFAULT 0)",
+    "CREATE INDEX IF NOT EXISTS assets_group ON assets (area, group_id)",
+    "CREATE INDEX IF NOT EXISTS assets_lru ON assets (area, last_used_ns, group_id)",
+    "CREATE TABLE IF NOT EXISTS sessions ("
+    "session_id TEXT PRIMARY KEY, user_id TEXT, created_at REAL NOT NULL, last_activity REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS sessions_activity ON sessions (last_activity)",
+    "CREATE TABLE IF NOT EXISTS session_assets ("
+    "seq INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, kind TEXT NOT NULL, "
+    "asset_id TEXT NOT NULL, key TEXT NOT NULL, url TEXT NOT NULL, meta TEXT, created_at REAL NOT NULL, "
+    "UNIQUE (session_id, key))",
+    "CREATE INDEX IF NOT EXISTS session_assets_page ON session_assets (session_id, seq)",
+    "CREATE INDEX IF NOT EXISTS session_assets_key ON session_assets (key)",
+)
+
+
+class SessionAssetRecord(NamedTuple):
+    """An upload or result to attach to a session"""
+    kind: str  # "upload" or "result"
+    asset_id: str
+    key: str
+    url: str
+    meta: Optional[Dict[str, Any]] = None
+
+
+def is_session_id(session_id: Optional[str]) -> bool:
+    """Whether a client-supplied session ID is well formed"""
+    return session_id is not None and SESSION_ID.match(session_id) is not None
+
+
+def new_session_id() -> str:
+    """Create an unguessable session ID"""
+    return uuid.uuid4().hex
+
+
+def upload_asset(image_id: str, upload_key: str, file_name: Optional[str] = None) -> SessionAssetRecord:
+    """Session record for an upload"""
+    return SessionAssetRecord("upload", image_id, upload_key, upload_key, {"file_name": file_name} if file_name else None)
+
+
+def result_asset(result: Dict[str, Any]) -> SessionAssetRecord:
+    """Session record for a swap result as described by FaceService"""
+    url = result["result_url"]
+    return SessionAssetRecord("result", result["result_id"], "results/" + url.rsplit("/", 1)[-1], url, {
+        field: result[field] for field in ("profession", "angle", "face_index", "format") if field in result
+    })
+
+
+class SessionIndex:
+    """SQLite index of stored assets and the sessions that created them"""
+
+    def __init__(self, path: str = "sessions.db", touch_resolution: float = 3600, max_touched: int = 65536):
+        self.path = path
+        self.touch_resolution_ns = int(touch_resolution * 1e9)
+        self.max_touched = max_touched
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        # group -> last time this process bumped last_used, to bound index writes on hot reads
+        self._touched: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database on first use (and again in a forked child); call with the lock held"""
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """Run one statement in its own transaction and fetch any rows"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                return conn.execute(sql, params).fetchall()
+
+    # Assets
+
+    def record_object(self, key: str, size: int, mtime_ns: int):
+        """Index a stored object as just used, along with the rest of its group"""
+        area, _ = split_key(key)
+        group_id = object_group(key)
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT INTO assets (key, area, group_id, size, mtime_ns, last_used_ns) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, "
+                    "last_used_ns = excluded.last_used_ns",
+                    (key, area, group_id, size, mtime_ns, mtime_ns)
+                )
+                conn.execute(
+                    "UPDATE assets SET last_used_ns = ? WHERE area = ? AND group_id = ? AND last_used_ns < ?",
+                    (mtime_ns, area, group_id, mtime_ns)
+                )
+
+    def lookup(self, key: str) -> Optional[ObjectInfo]:
+        """Size and mtime of an indexed object, or None if it is not indexed"""
+        rows = self._execute("SELECT size, mtime_ns FROM assets WHERE key = ?", (key,))
+        return ObjectInfo(rows[0][0], rows[0][1]) if rows else None
+
+    def touch(self, key: str):
+        """Mark an object's group as used now, at most once per touch_resolution per process"""
+        area, _ = split_key(key)
+        group = (area, object_group(key))
+        now = time.time_ns()
+        with self._lock:
+            last = self._touched.get(group)
+            if last is not None and now - last < self.touch_resolution_ns:
+                return
+            self._touched[group] = now
+            self._touched.move_to_end(group)
+            while len(self._touched) > self.max_touched:
+                self._touched.popitem(last=False)
+        self._execute(
+            "UPDATE assets SET last_used_ns = ? WHERE area = ? AND group_id = ? AND last_used_ns < ?",
+            (now, group[0], group[1], now)
+        )
+
+    def forget(self, key: str):
+        """Drop a deleted object, and any session entries pointing at it"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM assets WHERE key = ?", (key,))
+                conn.execute("DELETE FROM session_assets WHERE key = ?", (key,))
+
+    def usage(self, area: str) -> Tuple[int, int]:
+        """Indexed object count and total bytes of an area"""
+        rows = self._execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM assets WHERE area = ?", (area,))
+        return rows[0][0], rows[0][1]
+
+    def groups_by_last_used(
+        self,
+        area: str,
+        since_ns: int = 0,
+        before_ns: Optional[int] = None,
+        page_size: int = 500
+    ) -> Iterator[Tuple[List[str], int]]:
+        """Yield (keys, total size) per group last used in [since_ns, before_ns), oldest first
+
+        Pages through the (area, last_used_ns, group_id) index, so listing
+        expired groups costs time proportional to how many there are.
+        """
+        last_used, group_id = since_ns - 1, ""
+        limit = before_ns if before_ns is not None else 2 ** 63 - 1
+        while True:
+            page = self._execute(
+                "SELECT DISTINCT last_used_ns, group_id FROM assets "
+                "WHERE area = ? AND last_used_ns < ? AND (last_used_ns > ? OR (last_used_ns = ? AND group_id > ?)) "
+                "ORDER BY last_used_ns, group_id LIMIT ?",
+                (area, limit, last_used, last_used, group_id, page_size)
+            )
+            for last_used, group_id in page:
+                rows = self._execute(
+                    "SELECT key, size FROM assets WHERE area = ? AND group_id = ?", (area, group_id)
+                )
+                if rows:
+                    yield [row[0] for row in rows], sum(row[1] for row in rows)
+            if len(page) < page_size:
+                return
+
+    def reconcile(self, area: str, objects: List[StoredObject], started_ns: int):
+        """Make the index match a full listing of an area taken since started_ns
+
+        Listed objects are upserted; rows for objects missing from the
+        listing are dropped unless they were written after it began.
+        """
+        marker = started_ns
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO assets (key, area, group_id, size, mtime_ns, last_used_ns, seen) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, "
+                    "last_used_ns = MAX(last_used_ns, excluded.last_used_ns), seen = excluded.seen",
+                    [
+                        (stored.key, area, object_group(stored.key), stored.size, stored.mtime_ns,
+                         max(stored.atime_ns, stored.mtime_ns), marker)
+                        for stored in objects
+                    ]
+                )
+                stale = [row[0] for row in conn.execute(
+                    "SELECT key FROM assets WHERE area = ? AND seen != ? AND mtime_ns < ?",
+                    (area, marker, started_ns)
+                )]
+                for key in stale:
+                    conn.execute("DELETE FROM assets WHERE key = ?", (key,))
+                    conn.execute("DELETE FROM session_assets WHERE key = ?", (key,))
+
+    # Sessions
+
+    def record_assets(self, session_id: str, assets: List[SessionAssetRecord]):
+        """Attach uploads/results to a session, creating it on first use"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT INTO sessions (session_id, created_at, last_activity) VALUES (?, ?, ?) "
+                    "ON CONFLICT (session_id) DO UPDATE SET last_activity = excluded.last_activity",
+                    (session_id, now, now)
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO session_assets (session_id, kind, asset_id, key, url, meta, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (session_id, asset.kind, asset.asset_id, asset.key, asset.url,
+                         json.dumps(asset.meta) if asset.meta else None, now)
+                        for asset in assets
+                    ]
+                )
+
+    def get_session(
+        self,
+        session_id: str,
+        kind: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get a session and one page of its assets, newest first"""
+        with self._lock:
+            conn = self._connect()
+            session = conn.execute(
+                "SELECT user_id, created_at, last_activity FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if session is None:
+                return None
+            before = cursor if cursor is not None else 2 ** 63 - 1
+            if kind is None:
+                rows = conn.execute(
+                    "SELECT seq, kind, asset_id, url, meta, created_at FROM session_assets "
+                    "WHERE session_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                    (session_id, before, limit + 1)
+                ).fetchall()
+                total = conn.execute(
+                    "SELECT COUNT(*) FROM session_assets WHERE session_id = ?", (session_id,)
+                ).fetchone()[0]
+            else:
+                rows = conn.execute(
+                    "SELECT seq, kind, asset_id, url, meta, created_at FROM session_assets "
+                    "WHERE session_id = ? AND kind = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                    (session_id, kind, before, limit + 1)
+                ).fetchall()
+                total = conn.execute(
+                    "SELECT COUNT(*) FROM session_assets WHERE session_id = ? AND kind = ?", (session_id, kind)
+                ).fetchone()[0]
+
+        assets = [
+            {
+                "kind": row[1],
+                "asset_id": row[2],
+                "url": row[3],
+                "created_at": row[5],
+                **(json.loads(row[4]) if row[4] else {}),
+            }
+            for row in rows[:limit]
+        ]
+        return {
+            "session_id": session_id,
+            "user_id": session[0],
+            "created_at": session[1],
+            "last_activity": session[2],
+            "assets": assets,
+            "total_assets": total,
+            "next_cursor": rows[limit - 1][0] if len(rows) > limit else None,
+        }
+
+    def prune_sessions(self, max_idle: float) -> int:
+        """Delete sessions idle for longer than max_idle seconds; returns how many"""
+        cutoff = time.time() - max_idle
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "DELETE FROM session_assets WHERE session_id IN "
+                    "(SELECT session_id FROM sessions WHERE last_activity < ?)",
+                    (cutoff,)
+                )
+                return conn.execute("DELETE FROM sessions WHERE last_activity < ?", (cutoff,)).rowcount
+
+    async def arecord_assets(self, session_id: str, assets: List[SessionAssetRecord]):
+        await asyncio.to_thread(self.record_assets, session_id, assets)
+
+    async def aget_session(
+        self,
+        session_id: str,
+        kind: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get_session, session_id, kind, limit, cursor)
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+_index: Optional[SessionIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_session_index() -> SessionIndex:
+    """Get the process-wide session index, configured from environment"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SessionIndex(config.SESSION_INDEX_PATH, touch_resolution=config.STORAGE_ATIME_RESOLUTION)
+    return _index
@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from .. import config
+from ..utils.metrics import SOURCE_CACHE
+
+
+class SourceCache:
+    """Decoded uploads shared between upload, detection and swap
+
+    An upload is decoded once when it arrives; the same BGR array is then
+    used for detection and by every swap of that upload, instead of reading
+    and decoding the stored file again. Upload keys are content-addressed,
+    so an entry never goes stale and needs no revalidation.
+
+    Entries are read-only arrays in a byte-budgeted LRU. The cache is per
+    process: with the process executor each pool worker keeps its own, and
+    a swap landing on a different worker than its upload decodes once there.
+    """
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024):
+        self.max_bytes = max(0, max_bytes)
+
+        # upload key -> decoded image
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hit = SOURCE_CACHE.labels(result="hit")
+        self._miss = SOURCE_CACHE.labels(result="miss")
+
+    @property
+    def size_bytes(self) -> int:
+        """Bytes held by decoded uploads"""
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, upload_key: str) -> Optional[np.ndarray]:
+        """Get a decoded upload, marking it most recently used"""
+        with self._lock:
+            image = self._entries.get(upload_key)
+            if image is not None:
+                self._entries.move_to_end(upload_key)
+        (self._hit if image is not None else self._miss).inc()
+        return image
+
+    def put(self, upload_key: str, image: np.ndarray) -> np.ndarray:
+        """Cache a decoded upload read-only, evicting least recently used entries
+
+        Returns the (now read-only) image; images larger than the whole
+        budget are returned without being cached.
+        """
+        if image.flags.writeable:
+            image.setflags(write=False)
+        if image.nbytes > self.max_bytes:
+            return image
+
+        with self._lock:
+            old = self._entries.pop(upload_key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+
+            self._entries[upload_key] = image
+            self._bytes += image.nbytes
+
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+        return image
+
+
+_source_cache: Optional[SourceCache] = None
+
+
+def get_source_cache() -> SourceCache:
+    """Get the process-wide decoded upload cache"""
+    global _source_cache
+    if _source_cache is None:
+        _source_cache = SourceCache(max_bytes=config.SOURCE_CACHE_BYTES)
+    return _source_cache
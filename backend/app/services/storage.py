@@ -0,0 +1,653 @@
+"""
+Blob storage for uploads, results and templates
+
+Objects are addressed by ``"{area}/{name}"`` keys, e.g. ``uploads/<id>.jpg``,
+``results/<id>.webp`` or ``templates/doctor/front.jpg``. ``LocalStorage``
+maps each area onto its configured directory; uploads and results are
+sharded into subdirectories named after the first two hex characters of
+their content-derived IDs, so no directory grows past a few thousand
+entries. ``S3Storage`` keeps objects in one bucket (AWS, MinIO or any
+S3-compatible endpoint), so several API nodes can share uploads and
+results without a shared volume.
+
+All methods are blocking and safe to call from executor threads; the
+``a*`` variants run them off the event loop. Writes, reads and deletes in
+the sharded areas are mirrored into the attached ``SessionIndex``, if any.
+"""
+import asyncio
+import hashlib
+import io
+import os
+import shutil
+import stat
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple, Union
+
+from .. import config
+
+AREAS = ("uploads", "results", "templates")
+
+# Areas of content-addressed files: sharded on disk and subject to retention
+SHARDED_AREAS = ("uploads", "results")
+
+# Marks a partially written file (see LocalStorage.write)
+TEMP_MARKER = ".tmp-"
+
+
+class ObjectInfo(NamedTuple):
+    """Size and modification time of a stored object"""
+    size: int
+    mtime_ns: int
+
+
+class StoredObject(NamedTuple):
+    """One object found by Storage.scan"""
+    key: str
+    size: int
+    mtime_ns: int
+    atime_ns: int
+
+
+def split_key(key: str) -> Tuple[str, str]:
+    """Split a key into (area, name), rejecting anything outside the known areas"""
+    area, _, name = key.partition("/")
+    if area not in AREAS or not name or name.startswith("/") or ".." in name.split("/"):
+        raise ValueError(f"Invalid storage key: {key}")
+    return area, name
+
+
+def object_group(key: str) -> str:
+    """ID shared by related objects, e.g. an upload and its detection sidecar"""
+    return key.rsplit("/", 1)[-1].split(".", 1)[0]
+
+
+def shard_name(area: str, name: str) -> str:
+    """Relative on-disk path of an object: "ab/abcdef....jpg" in sharded areas"""
+    if area in SHARDED_AREAS and "/" not in name and len(name) > 2:
+        return f"{name[:2]}/{name}"
+    return name
+
+
+class Storage(ABC):
+    """Interface shared by the storage backends"""
+
+    is_local = False
+    # Optional SessionIndex mirroring the sharded areas (see create_storage)
+    index = None
+
+    def _indexed(self, key: str) -> bool:
+        """Whether a key's area is mirrored into the attached index"""
+        return self.index is not None and split_key(key)[0] in SHARDED_AREAS
+
+    def _index_write(self, key: str, size: int):
+        """Record a new object in the index; indexing never fails a write"""
+        if self._indexed(key):
+            try:
+                self.index.record_object(key, size, time.time_ns())
+            except Exception as e:
+                print(f"Error indexing {key}: {str(e)}")
+
+    def _index_read(self, key: str):
+        """Mark an object as just used in the index; indexing never fails a read"""
+        if self._indexed(key):
+            try:
+                self.index.touch(key)
+            except Exception as e:
+                print(f"Error indexing {key}: {str(e)}")
+
+    def _index_delete(self, key: str):
+        """Drop a deleted or vanished object from the index"""
+        if self._indexed(key):
+            try:
+                self.index.forget(key)
+            except Exception as e:
+                print(f"Error indexing {key}: {str(e)}")
+
+    @abstractmethod
+    def stat(self, key: str) -> Optional[ObjectInfo]:
+        """Get an object's size and mtime, or None if it does not exist"""
+
+    def exists(self, key: str) -> bool:
+        """Whether an object exists"""
+        return self.stat(key) is not None
+
+    @abstractmethod
+    def read(self, key: str) -> bytes:
+        """Read a whole object; raises FileNotFoundError if missing"""
+
+    @abstractmethod
+    def write(self, key: str, data: Union[bytes, memoryview]):
+        """Store an object atomically, replacing any previous version"""
+
+    @abstractmethod
+    def put_file(self, key: str, path: str):
+        """Store a local file as an object; the file is consumed"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Delete an object if it exists"""
+
+    @abstractmethod
+    def local_path(self, key: str, version: Optional[int] = None) -> str:
+        """Get a local file holding the object, e.g. for cv2.imread or sendfile
+
+        version is the mtime_ns the caller expects; a cached copy of another
+        version is refetched. Raises FileNotFoundError if missing.
+        """
+
+    @abstractmethod
+    def scan(self, area: str) -> Iterator[StoredObject]:
+        """List every object in an area, including leftover partial writes"""
+
+    def compact(self, area: str) -> int:
+        """Move objects left in an older layout into place; returns how many moved"""
+        return 0
+
+    async def astat(self, key: str) -> Optional[ObjectInfo]:
+        """Get an object's size and mtime off the event loop"""
+        return await asyncio.to_thread(self.stat, key)
+
+    async def aexists(self, key: str) -> bool:
+        """Check whether an object exists off the event loop"""
+        return await asyncio.to_thread(self.exists, key)
+
+    async def aread(self, key: str) -> bytes:
+        """Read a whole object off the event loop"""
+        return await asyncio.to_thread(self.read, key)
+
+    async def awrite(self, key: str, data: Union[bytes, memoryview]):
+        """Store an object off the event loop"""
+        await asyncio.to_thread(self.write, key, data)
+
+    async def alocal_path(self, key: str, version: Optional[int] = None) -> str:
+        """Get a local file holding the object off the event loop"""
+        return await asyncio.to_thread(self.local_path, key, version)
+
+
+class LocalStorage(Storage):
+    """Objects as files under one directory per area
+
+    Reads in sharded areas refresh the file's access time (at most once per
+    ``atime_resolution`` seconds, whatever the mount's atime options), which
+    the janitor uses for least-recently-used eviction.
+    """
+
+    is_local = True
+
+    def __init__(self, directories: Dict[str, str], atime_resolution: float = 3600):
+        self.directories = directories
+        self.atime_resolution_ns = int(atime_resolution * 1e9)
+
+    def path(self, key: str) -> str:
+        """Filesystem path of an object"""
+        area, name = split_key(key)
+        return os.path.join(self.directories[area], shard_name(area, name))
+
+    def _find(self, key: str) -> Tuple[str, os.stat_result]:
+        """Locate an object's file, falling back to the flat pre-sharding layout"""
+        path = self.path(key)
+        try:
+            return path, os.stat(path)
+        except FileNotFoundError:
+            area, name = split_key(key)
+            if area not in SHARDED_AREAS:
+                raise
+            legacy_path = os.path.join(self.directories[area], name)
+            return legacy_path, os.stat(legacy_path)
+
+    def _accessed(self, key: str, path: str, stat_result: os.stat_result):
+        """Refresh the access time of a retained object that was just read"""
+        if split_key(key)[0] not in SHARDED_AREAS:
+            return
+        now = time.time_ns()
+        if now - stat_result.st_atime_ns > self.atime_resolution_ns:
+            try:
+                os.utime(path, ns=(now, stat_result.st_mtime_ns))
+            except OSError:
+                pass
+            self._index_read(key)
+
+    def stat(self, key: str) -> Optional[ObjectInfo]:
+        try:
+            _, stat_result = self._find(key)
+        except OSError:
+            return None
+        return ObjectInfo(stat_result.st_size, stat_result.st_mtime_ns)
+
+    def read(self, key: str) -> bytes:
+        path, stat_result = self._find(key)
+        with open(path, "rb") as f:
+            data = f.read()
+        self._accessed(key, path, stat_result)
+        return data
+
+    def write(self, key: str, data: Union[bytes, memoryview]):
+        # Write beside the target and rename, so readers never see a partial file
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        root, extension = os.path.splitext(path)
+        temp_path = f"{root}{TEMP_MARKER}{uuid.uuid4().hex}{extension}"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._index_write(key, len(data))
+
+    def put_file(self, key: str, path: str):
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        try:
+            os.replace(path, target)
+        except OSError:
+            # Different filesystem: copy, then rename into place
+            temp_path = f"{target}{TEMP_MARKER}{uuid.uuid4().hex}"
+            shutil.copyfile(path, temp_path)
+            os.replace(temp_path, target)
+            os.remove(path)
+        self._index_write(key, os.path.getsize(target))
+
+    def delete(self, key: str):
+        try:
+            path, _ = self._find(key)
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self._index_delete(key)
+
+    def local_path(self, key: str, version: Optional[int] = None) -> str:
+        path, stat_result = self._find(key)
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise FileNotFoundError(key)
+        self._accessed(key, path, stat_result)
+        return path
+
+    def scan(self, area: str) -> Iterator[StoredObject]:
+        directory = self.directories[area]
+        if not os.path.isdir(directory):
+            return
+        pending = [(directory, "")]
+        while pending:
+            current, prefix = pending.pop()
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    # Dotfiles are staging files and locks, not objects
+                    if entry.name.startswith("."):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append((entry.path, f"{prefix}{entry.name}/"))
+                            continue
+                        stat_result = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    # Keys are flat in sharded areas; the shard is implied by the name
+                    name = entry.name if area in SHARDED_AREAS else prefix + entry.name
+                    yield StoredObject(
+                        f"{area}/{name}", stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_atime_ns
+                    )
+
+    def compact(self, area: str) -> int:
+        """Move files written before sharding into their shard directories"""
+        directory = self.directories[area]
+        if area not in SHARDED_AREAS or not os.path.isdir(directory):
+            return 0
+        moved = 0
+        with os.scandir(directory) as entries:
+            legacy = [
+                entry.name for entry in entries
+                if not entry.name.startswith(".") and entry.is_file(follow_symlinks=False)
+            ]
+        for name in legacy:
+            target = os.path.join(directory, shard_name(area, name))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.replace(os.path.join(directory, name), target)
+                moved += 1
+            except FileNotFoundError:
+                pass
+        return moved
+
+
+def _pid_alive(pid: int) -> bool:
+    """Whether a process with this ID exists"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ReadThroughCache:
+    """Byte-budgeted LRU of object copies on local disk
+
+    Entries record the object version (mtime_ns) they were fetched at. Each
+    process keeps its own subdirectory, since the index lives in memory;
+    directories left by processes that have exited are removed on first use.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.root = directory
+        self.directory = os.path.join(directory, str(os.getpid()))
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[str, int, int]]" = OrderedDict()  # key -> (path, size, version)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._ready = False
+        self.hits = 0
+        self.misses = 0
+
+    def _prepare(self):
+        """Create an empty cache directory on first use"""
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    os.makedirs(self.root, exist_ok=True)
+                    for name in os.listdir(self.root):
+                        if name == str(os.getpid()) or not (name.isdigit() and _pid_alive(int(name))):
+                            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                    os.makedirs(self.directory, exist_ok=True)
+                    self._ready = True
+
+    def _file_path(self, key: str) -> str:
+        """Local file for a key; hashed so names never nest or collide"""
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.directory, digest + os.path.splitext(key)[1])
+
+    def get(self, key: str, version: Optional[int] = None) -> Optional[str]:
+        """Get the cached file for key, if present (and at version, when given)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (version is not None and entry[2] != version):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def temp_path(self, key: str) -> str:
+        """A fresh path inside the cache directory to download into"""
+        self._prepare()
+        return f"{self._file_path(key)}.tmp-{uuid.uuid4().hex}"
+
+    def put_file(self, key: str, path: str, version: int) -> str:
+        """Move a local file into the cache, returning its cached path"""
+        self._prepare()
+        target = self._file_path(key)
+        size = os.path.getsize(path)
+        os.replace(path, target)
+        self._index(key, target, size, version)
+        return target
+
+    def put_bytes(self, key: str, data: Union[bytes, memoryview], version: int) -> str:
+        """Cache an object's bytes, returning its cached path"""
+        temp_path = self.temp_path(key)
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        return self.put_file(key, temp_path, version)
+
+    def _index(self, key: str, path: str, size: int, version: int):
+        """Record an entry and evict least recently used files over budget"""
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (path, size, version)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (evicted_path, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                evicted.append(evicted_path)
+        for evicted_path in evicted:
+            try:
+                os.remove(evicted_path)
+            except FileNotFoundError:
+                pass
+
+    def discard(self, key: str):
+        """Drop a cached copy"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+        if entry is not None:
+            try:
+                os.remove(entry[0])
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        """Entry count, bytes held and hit/miss counters"""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+class S3Storage(Storage):
+    """Objects in an S3 bucket (AWS, MinIO or another S3-compatible endpoint)
+
+    One boto3 client with a pooled connection set is shared by every thread.
+    Objects above ``multipart_threshold`` go through the transfer manager
+    as parallel multipart uploads/downloads. Uploads and templates are kept
+    in a local ``ReadThroughCache``: uploads are content-addressed and never
+    change, while cached templates are refetched when their mtime moves.
+    """
+
+    # Objects in these areas are never rewritten under the same key
+    IMMUTABLE_AREAS = ("uploads", "results")
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        region: Optional[str] = None,
+        endpoint_url: Optional[str] = None,
+        max_connections: int = 32,
+        multipart_threshold: int = 8 * 1024 * 1024,
+        multipart_chunksize: int = 8 * 1024 * 1024,
+        cache: Optional[ReadThroughCache] = None,
+        cached_areas: Tuple[str, ...] = ("uploads", "templates"),
+    ):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ImportError:
+            raise Exception("boto3 package is required for STORAGE_BACKEND=s3")
+
+        if not bucket:
+            raise Exception("S3_BUCKET_NAME is required for STORAGE_BACKEND=s3")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.multipart_threshold = multipart_threshold
+        self.cache = cache
+        self.cached_areas = cached_areas
+
+        self._client = boto3.session.Session().client(
+            "s3",
+            region_name=region or None,
+            endpoint_url=endpoint_url or None,
+            config=Config(max_pool_connections=max_connections, retries={"max_attempts": 3, "mode": "standard"}),
+        )
+        self._transfer = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max(1, min(10, max_connections // 2)),
+        )
+
+    def _object_key(self, key: str) -> str:
+        split_key(key)
+        return self.prefix + key
+
+    def _cacheable(self, key: str) -> bool:
+        return self.cache is not None and split_key(key)[0] in self.cached_areas
+
+    @staticmethod
+    def _is_missing(error: Exception) -> bool:
+        response = getattr(error, "response", None) or {}
+        return response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def stat(self, key: str) -> Optional[ObjectInfo]:
+        # Immutable objects already cached here cannot have changed
+        if self._cacheable(key) and split_key(key)[0] in self.IMMUTABLE_AREAS:
+            path = self.cache.get(key)
+            if path is not None:
+                try:
+                    stat_result = os.stat(path)
+                    return ObjectInfo(stat_result.st_size, stat_result.st_mtime_ns)
+                except FileNotFoundError:
+                    # Evicted since the lookup; ask the index or the bucket instead
+                    pass
+        # ...as can immutable objects the index knows about, saving a HEAD request
+        if self._indexed(key) and split_key(key)[0] in self.IMMUTABLE_AREAS:
+            try:
+                info = self.index.lookup(key)
+            except Exception as e:
+                print(f"Error indexing {key}: {str(e)}")
+                info = None
+            if info is not None:
+                return info
+        try:
+            response = self._client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except Exception as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return ObjectInfo(response["ContentLength"], int(response["LastModified"].timestamp() * 1e9))
+
+    def read(self, key: str) -> bytes:
+        if self._cacheable(key):
+            with open(self.local_path(key), "rb") as f:
+                return f.read()
+        try:
+            response = self._client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        except Exception as e:
+            if self._is_missing(e):
+                self._index_delete(key)
+                raise FileNotFoundError(key)
+            raise
+        self._index_read(key)
+        return response["Body"].read()
+
+    def write(self, key: str, data: Union[bytes, memoryview]):
+        object_key = self._object_key(key)
+        if len(data) >= self.multipart_threshold:
+            self._client.upload_fileobj(io.BytesIO(data), self.bucket, object_key, Config=self._transfer)
+        else:
+            self._client.put_object(Bucket=self.bucket, Key=object_key, Body=bytes(data))
+        self._index_write(key, len(data))
+        if self._cacheable(key):
+            # Keep what this node just wrote; it is usually read again soon
+            info = self.stat(key) if split_key(key)[0] not in self.IMMUTABLE_AREAS else None
+            self.cache.put_bytes(key, data, info.mtime_ns if info is not None else 0)
+
+    def put_file(self, key: str, path: str):
+        self._client.upload_file(path, self.bucket, self._object_key(key), Config=self._transfer)
+        self._index_write(key, os.path.getsize(path))
+        if self._cacheable(key):
+            info = self.stat(key) if split_key(key)[0] not in self.IMMUTABLE_AREAS else None
+            self.cache.put_file(key, path, info.mtime_ns if info is not None else 0)
+        else:
+            os.remove(path)
+
+    def delete(self, key: str):
+        self._client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        if self.cache is not None:
+            self.cache.discard(key)
+        self._index_delete(key)
+
+    def local_path(self, key: str, version: Optional[int] = None) -> str:
+        immutable = split_key(key)[0] in self.IMMUTABLE_AREAS
+        if self.cache is None:
+            raise Exception("S3 storage needs a read-through cache for local file access")
+
+        if immutable:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._index_read(key)
+                return cached
+        else:
+            if version is None:
+                info = self.stat(key)
+                if info is None:
+                    raise FileNotFoundError(key)
+                version = info.mtime_ns
+            cached = self.cache.get(key, version)
+            if cached is not None:
+                return cached
+
+        temp_path = self.cache.temp_path(key)
+        try:
+            self._client.download_file(self.bucket, self._object_key(key), temp_path, Config=self._transfer)
+        except Exception as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if self._is_missing(e):
+                self._index_delete(key)
+                raise FileNotFoundError(key)
+            raise
+        self._index_read(key)
+        return self.cache.put_file(key, temp_path, 0 if immutable else version)
+
+    def scan(self, area: str) -> Iterator[StoredObject]:
+        # S3 keeps no access time; LastModified stands in for it
+        paginator = self._client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefix}{area}/"):
+            for item in page.get("Contents", []):
+                mtime_ns = int(item["LastModified"].timestamp() * 1e9)
+                yield StoredObject(item["Key"][len(self.prefix):], item["Size"], mtime_ns, mtime_ns)
+
+
+def create_storage() -> Storage:
+    """Build the storage backend selected by STORAGE_BACKEND, with the session index attached"""
+    from .session_index import get_session_index
+
+    storage = _create_backend()
+    storage.index = get_session_index()
+    return storage
+
+
+def _create_backend() -> Storage:
+    """Build the bare storage backend selected by STORAGE_BACKEND"""
+    if config.STORAGE_BACKEND == "s3":
+        return S3Storage(
+            config.S3_BUCKET_NAME,
+            prefix=config.S3_PREFIX,
+            region=config.AWS_REGION,
+            endpoint_url=config.S3_ENDPOINT_URL,
+            max_connections=config.S3_MAX_CONNECTIONS,
+            multipart_threshold=config.S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=config.S3_MULTIPART_CHUNKSIZE,
+            cache=ReadThroughCache(config.STORAGE_CACHE_DIR, config.STORAGE_CACHE_BYTES),
+        )
+    if config.STORAGE_BACKEND != "local":
+        raise ValueError(f"Unknown storage backend: {config.STORAGE_BACKEND}")
+    return LocalStorage({
+        "uploads": config.UPLOAD_DIR,
+        "results": config.RESULTS_DIR,
+        "templates": config.TEMPLATES_DIR,
+    }, atime_resolution=config.STORAGE_ATIME_RESOLUTION)
+
+
+_storage: Optional[Storage] = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> Storage:
+    """Get the process-wide storage backend, configured from environment"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+    return _storage
@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .. import config
+from .storage import LocalStorage, Storage, get_storage
+from .template_pack import TemplatePack
+
+# mtime used for entries rendered in memory because no template file exists
+PLACEHOLDER_MTIME = -1
+
+
+class TemplateCache:
+    """Decoded template images shared by FaceService and TemplateService
+
+    Each ``templates/{profession}/{angle}.jpg`` is decoded once and kept as a
+    read-only array in a byte-budgeted LRU. Entries are revalidated against
+    the stored object's mtime (at most every ``check_interval`` seconds), so
+    replacing a template is picked up without a restart.
+
+    With a ``TemplatePack`` attached, templates are served as zero-copy views
+    into the shared memory-mapped pack instead of being decoded per worker;
+    those views do not count against the byte budget.
+    """
+
+    def __init__(
+        self,
+        templates_dir: str = "templates",
+        max_bytes: int = 64 * 1024 * 1024,
+        check_interval: float = 1.0,
+        pack: Optional[TemplatePack] = None,
+        storage: Optional[Storage] = None,
+    ):
+        self.templates_dir = templates_dir
+        self.storage = storage or LocalStorage({"templates": templates_dir})
+        self.pack = pack
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+
+        # (profession, angle) -> (mtime_ns, checked_at, image)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[int, float, np.ndarray]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def size_bytes(self) -> int:
+        """Bytes held by decoded templates"""
+        return self._bytes
+
+    @staticmethod
+    def template_key(profession: str, angle: str) -> str:
+        """Get the storage key for a template"""
+        return f"templates/{profession}/{angle}.jpg"
+
+    def _file_mtime(self, profession: str, angle: str) -> Optional[int]:
+        """Get a template file's mtime, or None if it does not exist"""
+        try:
+            info = self.storage.stat(self.template_key(profession, angle))
+        except (OSError, ValueError):
+            return None
+        return info.mtime_ns if info is not None else None
+
+    def _lookup(self, key: Tuple[str, str]) -> Tuple[Optional[np.ndarray], Optional[int]]:
+        """Return a still-valid cached image, revalidating its mtime if due"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None, None
+
+        mtime, checked_at, image = entry
+        now = time.monotonic()
+        if now - checked_at < self.check_interval:
+            return image, mtime
+
+        current = self._file_mtime(*key)
+        if current != mtime and not (current is None and mtime == PLACEHOLDER_MTIME):
+            return None, current
+
+        with self._lock:
+            if key in self._entries:
+                self._entries[key] = (mtime, now, image)
+        return image, mtime
+
+    @staticmethod
+    def _cost(image: np.ndarray) -> int:
+        """Private bytes an entry holds; pack views live in the shared page cache"""
+        return 0 if isinstance(image, np.memmap) else image.nbytes
+
+    def _store(self, key: Tuple[str, str], mtime: int, image: np.ndarray) -> np.ndarray:
+        """Insert a read-only image, evicting least recently used entries"""
+        if image.flags.writeable:
+            image.setflags(write=False)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= self._cost(old[2])
+
+            self._entries[key] = (mtime, time.monotonic(), image)
+            self._bytes += self._cost(image)
+
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= self._cost(evicted)
+        return image
+
+    def _hit(self, key: Tuple[str, str], image: np.ndarray) -> np.ndarray:
+        """Record a cache hit and mark the entry most recently used"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+        return image
+
+    def _load(self, key: Tuple[str, str]) -> Optional[np.ndarray]:
+        """Decode a template file into the cache, or None if it does not exist"""
+        with self._lock:
+            self.misses += 1
+        mtime = self._file_mtime(*key)
+        if mtime is None:
+            return None
+
+        # Prefer the shared pack when it was built from this file version
+        if self.pack is not None:
+            image = self.pack.get(key[0], key[1], mtime)
+            if image is not None:
+                return self._store(key, mtime, image)
+
+        try:
+            image = cv2.imread(self.storage.local_path(self.template_key(*key), mtime))
+        except FileNotFoundError:
+            return None
+        if image is None:
+            return None
+        return self._store(key, mtime, image)
+
+    def get(self, profession: str, angle: str) -> Optional[np.ndarray]:
+        """Get a decoded template, or None if its file does not exist"""
+        key = (profession, angle)
+        image, mtime = self._lookup(key)
+        if image is not None and mtime != PLACEHOLDER_MTIME:
+            return self._hit(key, image)
+        return self._load(key)
+
+    def get_or_render(
+        self,
+        profession: str,
+        angle: str,
+        render: Callable[[str, str], np.ndarray],
+    ) -> np.ndarray:
+        """Get a decoded template, rendering (and caching) a placeholder if missing"""
+        key = (profession, angle)
+        image, _ = self._lookup(key)
+        if image is not None:
+            return self._hit(key, image)
+
+        image = self._load(key)
+        if image is None:
+            image = self._store(key, PLACEHOLDER_MTIME, render(profession, angle))
+        return image
+
+    def put(self, profession: str, angle: str, image: np.ndarray):
+        """Cache an image just written to a template file, skipping a decode"""
+        mtime = self._file_mtime(profession, angle)
+        if mtime is not None:
+            self._store((profession, angle), mtime, image.copy())
+
+    def version(self, profession: str, angle: str) -> int:
+        """Get a template's version (file mtime, or PLACEHOLDER_MTIME if rendered)"""
+        mtime = self._file_mtime(profession, angle)
+        return PLACEHOLDER_MTIME if mtime is None else mtime
+
+    def contains(self, profession: str, angle: str) -> bool:
+        """Check whether a decoded template file is cached and still valid"""
+        image, mtime = self._lookup((profession, angle))
+        return image is not None and mtime != PLACEHOLDER_MTIME
+
+    def preload(self, templates: Iterable[Tuple[str, str]]) -> int:
+        """Decode every existing template up front, returning how many loaded"""
+        loaded = 0
+        for profession, angle in templates:
+            if self.get(profession, angle) is not None:
+                loaded += 1
+        return loaded
+
+    def invalidate(self, profession: Optional[str] = None, angle: Optional[str] = None):
+        """Drop cached templates, optionally only for one profession/angle"""
+        with self._lock:
+            for key in list(self._entries):
+                if profession is not None and key[0] != profession:
+                    continue
+                if angle is not None and key[1] != angle:
+                    continue
+                self._bytes -= self._cost(self._entries.pop(key)[2])
+
+
+_template_cache: Optional[TemplateCache] = None
+
+
+def get_template_cache() -> TemplateCache:
+    """Get the process-wide template cache"""
+    global _template_cache
+    if _template_cache is None:
+        _template_cache = TemplateCache(
+            templates_dir=config.TEMPLATES_DIR,
+            max_bytes=config.TEMPLATE_CACHE_BYTES,
+            pack=TemplatePack(config.TEMPLATE_PACK_DIR) if config.TEMPLATE_PACK else None,
+            storage=get_storage(),
+        )
+    return _template_cache
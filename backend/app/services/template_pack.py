@@ -0,0 +1,185 @@
+"""
+Memory-mapped template pack shared by all gunicorn workers
+
+The pack is a single ``.npy`` file holding every decoded template back to
+back, plus a JSON index of offsets, shapes and source mtimes. It is built
+once (in the gunicorn master or from the command line) and every worker
+maps it read-only, so decoded templates live in the page cache once per
+host instead of once per worker.
+
+Usage:
+    python -m app.services.template_pack build
+    python -m app.services.template_pack measure --workers 4
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .. import config
+
+PACK_DATA_FILE = "templates.npy"
+PACK_INDEX_FILE = "templates.index.json"
+
+
+def build_template_pack(templates_dir: str, pack_dir: str) -> Dict[str, Any]:
+    """Decode every template file into a pack, returning its index"""
+    entries: List[Tuple[str, np.ndarray, int]] = []
+    for path in sorted(glob.glob(os.path.join(templates_dir, "*", "*.jpg"))):
+        image = cv2.imread(path)
+        if image is None:
+            print(f"Skipping undecodable template: {path}")
+            continue
+        profession = os.path.basename(os.path.dirname(path))
+        angle = os.path.splitext(os.path.basename(path))[0]
+        entries.append((f"{profession}/{angle}", image, os.stat(path).st_mtime_ns))
+
+    index: Dict[str, Any] = {}
+    offset = 0
+    for key, image, mtime in entries:
+        index[key] = {"offset": offset, "shape": list(image.shape), "mtime_ns": mtime}
+        offset += image.nbytes
+
+    data = np.empty(offset, dtype=np.uint8)
+    for key, image, _ in entries:
+        start = index[key]["offset"]
+        data[start:start + image.nbytes] = image.reshape(-1)
+
+    # Write both files atomically so running workers never see a torn pack
+    os.makedirs(pack_dir, exist_ok=True)
+    data_path = os.path.join(pack_dir, PACK_DATA_FILE)
+    index_path = os.path.join(pack_dir, PACK_INDEX_FILE)
+    np.save(data_path + ".tmp.npy", data)
+    os.replace(data_path + ".tmp.npy", data_path)
+    with open(index_path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(index_path + ".tmp", index_path)
+
+    return index
+
+
+class TemplatePack:
+    """Read-only, zero-copy view of a built template pack"""
+
+    def __init__(self, pack_dir: str):
+        self.pack_dir = pack_dir
+        self._data: Optional[np.ndarray] = None
+        self._index: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self):
+        """Map the pack on first use; a missing pack behaves as empty"""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                with open(os.path.join(self.pack_dir, PACK_INDEX_FILE), "r") as f:
+                    self._index = json.load(f)
+                self._data = np.load(os.path.join(self.pack_dir, PACK_DATA_FILE), mmap_mode="r")
+            except (OSError, ValueError) as e:
+                print(f"Template pack unavailable: {str(e)}")
+                self._index = {}
+                self._data = None
+
+    def get(self, profession: str, angle: str, mtime_ns: int) -> Optional[np.ndarray]:
+        """Get a read-only view of a template, if packed from the same file version"""
+        self._load()
+        entry = self._index.get(f"{profession}/{angle}")
+        if entry is None or self._data is None or entry["mtime_ns"] != mtime_ns:
+            return None
+
+        shape = tuple(entry["shape"])
+        start = entry["offset"]
+        return self._data[start:start + int(np.prod(shape))].reshape(shape)
+
+    def __len__(self) -> int:
+        """Number of templates in the pack"""
+        self._load()
+        return len(self._index)
+
+
+def _memory_usage() -> Dict[str, int]:
+    """Read this process's memory breakdown from /proc (Linux only)"""
+    usage = {}
+    with open("/proc/self/smaps_rollup", "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[2] == "kB":
+                usage[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {
+        "rss": usage.get("Rss", 0),
+        "pss": usage.get("Pss", 0),
+        "private": usage.get("Private_Clean", 0) + usage.get("Private_Dirty", 0),
+        "shared": usage.get("Shared_Clean", 0) + usage.get("Shared_Dirty", 0),
+    }
+
+
+def _measure_worker(args: Tuple[str, str, str]) -> Dict[str, int]:
+    """Load every template the way a worker would and report memory growth"""
+    mode, templates_dir, pack_dir = args
+    before = _memory_usage()
+
+    images = []
+    pack = TemplatePack(pack_dir)
+    for path in sorted(glob.glob(os.path.join(templates_dir, "*", "*.jpg"))):
+        profession = os.path.basename(os.path.dirname(path))
+        angle = os.path.splitext(os.path.basename(path))[0]
+        if mode == "pack":
+            image = pack.get(profession, angle, os.stat(path).st_mtime_ns)
+        else:
+            image = cv2.imread(path)
+        if image is not None:
+            # Touch every page, as a swap would
+            int(image.sum())
+            images.append(image)
+
+    after = _memory_usage()
+    return {key: after[key] - before[key] for key in after}
+
+
+def measure_worker_memory(templates_dir: str, pack_dir: str, workers: int) -> Dict[str, Any]:
+    """Compare per-worker memory for private decoding vs the shared pack"""
+    context = multiprocessing.get_context("fork")
+    report: Dict[str, Any] = {"workers": workers}
+    for mode in ("decode", "pack"):
+        with context.Pool(workers) as pool:
+            samples = pool.map(
+                _measure_worker,
+                [(mode, templates_dir, pack_dir)] * workers,
+                chunksize=1
+            )
+        report[mode] = {
+            key: sum(sample[key] for sample in samples) // workers
+            for key in samples[0]
+        }
+    return report
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Build or measure the shared template pack")
+    parser.add_argument("command", choices=["build", "measure"])
+    parser.add_argument("--templates-dir", default=config.TEMPLATES_DIR)
+    parser.add_argument("--pack-dir", default=config.TEMPLATE_PACK_DIR)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = build_template_pack(args.templates_dir, args.pack_dir)
+        print(json.dumps({"templates": len(index), "pack_dir": args.pack_dir}))
+    else:
+        build_template_pack(args.templates_dir, args.pack_dir)
+        report = measure_worker_memory(args.templates_dir, args.pack_dir, args.workers)
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,170 +1,261 @@
 import os
 import json
-from typing import List, Dict, Any, Optional
-from ..models.schemas import Template
+import asyncio
+import hashlib
+import time
+from email.utils import formatdate
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
+from .. import config
+from ..utils.executor import ComputeExecutor, get_compute_executor
+from .template_cache import TemplateCache, get_template_cache
+
+class CachedPayload(NamedTuple):
+    """Pre-serialized JSON response body with its validators"""
+    body: bytes
+    etag: str
+    last_modified: str
+
+
+def _make_payload(data: Any, mtime: float) -> CachedPayload:
+    """Serialize a response once and derive its ETag"""
+    body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    return CachedPayload(body, etag, formatdate(mtime, usegmt=True))
+
+
+# Professions served when no templates_metadata.json exists; never written to disk
+DEFAULT_TEMPLATES: Dict[str, Dict[str, Any]] = {
+    "doctor": {
+        "name": "Doctor",
+        "description": "Medical professional",
+        "angles": ["front", "side", "three_quarter", "back"],
+        "colors": ["white", "blue"],
+        "accessories": ["stethoscope", "lab_coat"]
+    },
+    "professor": {
+        "name": "Professor",
+        "description": "Academic educator",
+        "angles": ["front", "side", "three_quarter", "back"],
+        "colors": ["black", "brown"],
+        "accessories": ["glasses", "tie", "blazer"]
+    },
+    "engineer": {
+        "name": "Engineer",
+        "description": "Technical professional",
+        "angles": ["front", "side", "three_quarter", "back"],
+        "colors": ["blue", "gray"],
+        "accessories": ["hard_hat", "safety_vest"]
+    },
+    "lawyer": {
+        "name": "Lawyer",
+        "description": "Legal professional",
+        "angles": ["front", "side", "three_quarter", "back"],
+        "colors": ["black", "navy"],
+        "accessories": ["suit", "tie", "briefcase"]
+    },
+    "business": {
+        "name": "Business Executive",
+        "description": "Corporate professional",
+        "angles": ["front", "side", "three_quarter", "back"],
+        "colors": ["black", "gray", "navy"],
+        "accessories": ["suit", "tie", "watch"]
+    },
+    "artist": {
+        "name": "Artist",
+        "description": "Creative professional",
+        "angles": ["front", "side", "three_quarter", "back"],
+        "colors": ["vibrant", "creative"],
+        "accessories": ["beret", "paint_brush", "palette"]
+    }
+}
+
+# Last-Modified of the built-in metadata, stable across workers
+DEFAULT_TEMPLATES_MTIME = os.path.getmtime(__file__)
+
+
+class MetadataIndex:
+    """In-memory view of templates_metadata.json with precomputed responses"""
+
+    def __init__(self, signature: Optional[Tuple[int, int, int]], metadata: Dict[str, Any]):
+        self.signature = signature
+        self.metadata = metadata
+        self.professions: List[Dict[str, Any]] = []
+        self.templates: Dict[str, List[Dict[str, Any]]] = {}
+        self.professions_payload: Optional[CachedPayload] = None
+        self.templates_payloads: Dict[str, CachedPayload] = {}
+
 
 class TemplateService:
-    def __init__(self):
+    def __init__(
+        self,
+        executor: Optional[ComputeExecutor] = None,
+        template_cache: Optional[TemplateCache] = None
+    ):
         """Initialize template service"""
-        self.templates_dir = "templates"
+        self.templates_dir = config.TEMPLATES_DIR
         self.templates_metadata_file = "templates_metadata.json"
         
-        # Create templates directory if it doesn't exist
-        os.makedirs(self.templates_dir, exist_ok=True)
+        # Template preloading runs on the compute executor
+        self.executor = executor or get_compute_executor()
         
-        # Initialize default templates metadata
-        self._initialize_default_templates()
-
-    def _initialize_default_templates(self):
-        """Initialize default templates metadata"""
-        default_templates = {
-            "doctor": {
-                "name": "Doctor",
-                "description": "Medical professional",
-                "angles": ["front", "side", "three_quarter", "back"],
-                "colors": ["white", "blue"],
-                "accessories": ["stethoscope", "lab_coat"]
-            },
-            "professor": {
-                "name": "Professor",
-                "description": "Academic educator",
-                "angles": ["front", "side", "three_quarter", "back"],
-                "colors": ["black", "brown"],
-                "accessories": ["glasses", "tie", "blazer"]
-            },
-            "engineer": {
-                "name": "Engineer",
-                "description": "Technical professional",
-                "angles": ["front", "side", "three_quarter", "back"],
-                "colors": ["blue", "gray"],
-                "accessories": ["hard_hat", "safety_vest"]
-            },
-            "lawyer": {
-                "name": "Lawyer",
-                "description": "Legal professional",
-                "angles": ["front", "side", "three_quarter", "back"],
-                "colors": ["black", "navy"],
-                "accessories": ["suit", "tie", "briefcase"]
-            },
-            "business": {
-                "name": "Business Executive",
-                "description": "Corporate professional",
-                "angles": ["front", "side", "three_quarter", "back"],
-                "colors": ["black", "gray", "navy"],
-                "accessories": ["suit", "tie", "watch"]
-            },
-            "artist": {
-                "name": "Artist",
-                "description": "Creative professional",
-                "angles": ["front", "side", "three_quarter", "back"],
-                "colors": ["vibrant", "creative"],
-                "accessories": ["beret", "paint_brush", "palette"]
-            }
-        }
+        # Decoded templates are shared with FaceService; images live in its storage
+        self.template_cache = template_cache or get_template_cache()
+        self.storage = self.template_cache.storage
         
-        # Save metadata if it doesn't exist
-        metadata_path = os.path.join(self.templates_dir, self.templates_metadata_file)
-        if not os.path.exists(metadata_path):
-            with open(metadata_path, 'w') as f:
-                json.dump(default_templates, f, indent=2)
+        # Parsed metadata, refreshed when the file's mtime/inode/size changes
+        self._index: Optional[MetadataIndex] = None
+        self._index_checked_at = 0.0
+        self._index_check_interval = 1.0
+        self._index_lock = asyncio.Lock()
 
-    async def get_templates(self, profession: str) -> List[Dict[str, Any]]:
-        """Get available templates for a specific profession"""
+    def __getstate__(self):
+        """Drop process-local handles when shipped to a process pool worker"""
+        state = self.__dict__.copy()
+        state["executor"] = None
+        state["template_cache"] = None
+        state["storage"] = None
+        state["_index"] = None
+        state["_index_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        """Reattach process-local handles in a process pool worker"""
+        self.__dict__.update(state)
+        self.template_cache = get_template_cache()
+        self.storage = self.template_cache.storage
+
+    def _metadata_signature(self) -> Optional[Tuple[int, int, int]]:
+        """Get the metadata file's (mtime, inode, size), or None if missing"""
         try:
+            stat = os.stat(os.path.join(self.templates_dir, self.templates_metadata_file))
+            return stat.st_mtime_ns, stat.st_ino, stat.st_size
+        except OSError:
+            return None
+
+    async def _get_index(self, force: bool = False) -> MetadataIndex:
+        """Get the metadata index, rebuilding it if the file changed"""
+        now = time.monotonic()
+        if not force and self._index is not None and now - self._index_checked_at < self._index_check_interval:
+            return self._index
+        
+        async with self._index_lock:
+            signature = self._metadata_signature()
+            self._index_checked_at = time.monotonic()
+            if force or self._index is None or self._index.signature != signature:
+                self._index = await self._build_index(signature)
+            return self._index
+
+    async def _build_index(self, signature: Optional[Tuple[int, int, int]]) -> MetadataIndex:
+        """Parse metadata, check template availability once and pre-serialize responses"""
+        if signature is None:
+            # No metadata file: serve the built-in professions
+            metadata = DEFAULT_TEMPLATES
+            mtime = DEFAULT_TEMPLATES_MTIME
+        else:
             metadata_path = os.path.join(self.templates_dir, self.templates_metadata_file)
-            
-            if not os.path.exists(metadata_path):
-                return []
-            
             with open(metadata_path, 'r') as f:
                 metadata = json.load(f)
+            mtime = signature[0] / 1e9
+        
+        index = MetadataIndex(signature, metadata)
+        
+        for prof_id, prof_data in metadata.items():
+            index.professions.append({
+                "id": prof_id,
+                "name": prof_data["name"],
+                "description": prof_data["description"],
+                "angles": prof_data.get("angles", []),
+                "colors": prof_data.get("colors", []),
+                "accessories": prof_data.get("accessories", [])
+            })
             
-            if profession not in metadata:
-                return []
-            
-            profession_data = metadata[profession]
             templates = []
-            
-            for angle in profession_data.get("angles", []):
-                template_path = os.path.join(self.templates_dir, profession, f"{angle}.jpg")
+            for angle in prof_data.get("angles", []):
+                template_key = self.template_cache.template_key(prof_id, angle)
                 
-                # Check if template file exists, otherwise create placeholder
-                if not os.path.exists(template_path):
-                    await self._create_placeholder_template(profession, angle)
+                # Missing templates are rendered in memory at swap time; never written from here
+                available = await self.storage.aexists(template_key)
                 
                 templates.append({
-                    "id": f"{profession}_{angle}",
-                    "profession": profession,
+                    "id": f"{prof_id}_{angle}",
+                    "profession": prof_id,
                     "angle": angle,
-                    "image_url": f"/templates/{profession}/{angle}.jpg",
-                    "description": f"{profession_data['name']} - {angle.replace('_', ' ').title()} view",
-                    "available": os.path.exists(template_path)
+                    "image_url": f"/templates/{prof_id}/{angle}.jpg",
+                    "description": f"{prof_data['name']} - {angle.replace('_', ' ').title()} view",
+                    "available": available
                 })
             
-            return templates
+            index.templates[prof_id] = templates
+            index.templates_payloads[prof_id] = _make_payload(
+                {"profession": prof_id, "templates": templates}, mtime
+            )
+        
+        index.professions_payload = _make_payload({"professions": index.professions}, mtime)
+        return index
+
+    async def reload(self) -> int:
+        """Force a metadata reload and drop decoded templates, returning the profession count"""
+        self.template_cache.invalidate()
+        index = await self._get_index(force=True)
+        return len(index.professions)
+
+    async def get_templates(self, profession: str) -> List[Dict[str, Any]]:
+        """Get available templates for a specific profession"""
+        try:
+            index = await self._get_index()
+            return index.templates.get(profession, [])
             
         except Exception as e:
             print(f"Error getting templates: {str(e)}")
             return []
 
-    async def _create_placeholder_template(self, profession: str, angle: str):
-        """Create a placeholder template image"""
-        import cv2
-        import numpy as np
-        
-        # Create profession directory
-        profession_dir = os.path.join(self.templates_dir, profession)
-        os.makedirs(profession_dir, exist_ok=True)
-        
-        # Create placeholder image
-        template = np.ones((512, 512, 3), dtype=np.uint8) * 128
-        
-        # Add profession and angle text
-        cv2.putText(template, profession.title(), (50, 150), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
-        cv2.putText(template, f"Angle: {angle.replace('_', ' ').title()}", (50, 250), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-        cv2.putText(template, "Template Placeholder", (50, 350), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 1, (200, 200, 200), 2)
-        
-        # Save template
-        template_path = os.path.join(profession_dir, f"{angle}.jpg")
-        cv2.imwrite(template_path, template)
+    async def get_templates_payload(self, profession: str) -> Optional[CachedPayload]:
+        """Get the pre-serialized templates response for a profession"""
+        index = await self._get_index()
+        return index.templates_payloads.get(profession)
+
+    async def get_professions_payload(self) -> CachedPayload:
+        """Get the pre-serialized professions response"""
+        index = await self._get_index()
+        return index.professions_payload
+
+    async def has_template(self, profession: str, angle: str) -> bool:
+        """Check that a profession/angle pair is listed in the template metadata"""
+        index = await self._get_index()
+        return angle in index.metadata.get(profession, {}).get("angles", [])
 
     async def get_template_path(self, profession: str, angle: str) -> Optional[str]:
-        """Get the file path for a specific template"""
-        template_path = os.path.join(self.templates_dir, profession, f"{angle}.jpg")
-        
-        if os.path.exists(template_path):
-            return template_path
-        
-        # Create placeholder if it doesn't exist
-        await self._create_placeholder_template(profession, angle)
-        return template_path if os.path.exists(template_path) else None
+        """Get a local file path for a specific template, or None if it has no file"""
+        template_key = self.template_cache.template_key(profession, angle)
+        try:
+            return await self.storage.alocal_path(template_key)
+        except FileNotFoundError:
+            return None
+
+    async def preload_templates(self) -> int:
+        """Decode every known template into the shared cache"""
+        try:
+            index = await self._get_index()
+            templates = [
+                (profession, angle)
+                for profession, profession_data in index.metadata.items()
+                for angle in profession_data.get("angles", [])
+            ]
+            return await self.executor.run(self._preload_sync, templates)
+            
+        except Exception as e:
+            print(f"Error preloading templates: {str(e)}")
+            return 0
+
+    def _preload_sync(self, templates: List[Tuple[str, str]]) -> int:
+        """Decode templates into this process's cache (runs on the executor)"""
+        return self.template_cache.preload(templates)
 
     async def get_all_professions(self) -> List[Dict[str, Any]]:
         """Get all available professions with their metadata"""
         try:
-            metadata_path = os.path.join(self.templates_dir, self.templates_metadata_file)
-            
-            if not os.path.exists(metadata_path):
-                return []
-            
-            with open(metadata_path, 'r') as f:
-                metadata = json.load(f)
-            
-            professions = []
-            for prof_id, prof_data in metadata.items():
-                professions.append({
-                    "id": prof_id,
-                    "name": prof_data["name"],
-                    "description": prof_data["description"],
-                    "angles": prof_data.get("angles", []),
-                    "colors": prof_data.get("colors", []),
-                    "accessories": prof_data.get("accessories", [])
-                })
-            
-            return professions
+            index = await self._get_index()
+            return index.professions
             
         except Exception as e:
             print(f"Error getting professions: {str(e)}")
@@ -173,14 +264,13 @@ class TemplateService:
     async def add_template(self, profession: str, angle: str, image_path: str) -> bool:
         """Add a new template for a profession and angle"""
         try:
-            # Create profession directory
-            profession_dir = os.path.join(self.templates_dir, profession)
-            os.makedirs(profession_dir, exist_ok=True)
+            # Copy image into template storage
+            with open(image_path, "rb") as f:
+                image_data = f.read()
+            await self.storage.awrite(self.template_cache.template_key(profession, angle), image_data)
             
-            # Copy image to template directory
-            import shutil
-            template_path = os.path.join(profession_dir, f"{angle}.jpg")
-            shutil.copy2(image_path, template_path)
+            # Availability flags are precomputed, so rebuild them on next use
+            self._index = None
             
             return True
             
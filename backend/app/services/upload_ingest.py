@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+from ..utils.image_utils import ImageUtils
+
+# Request bodies are staged in the uploads directory under this prefix
+STAGING_PREFIX = ".incoming-"
+
+
+class UploadRejectedError(Exception):
+    """Raised when an upload is rejected before it is fully read"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class IngestedUpload:
+    """An upload streamed to a temporary file in the uploads directory"""
+
+    def __init__(self, temp_path: str, content_hash: str, size: int, filename: Optional[str], info: Dict[str, Any]):
+        self.temp_path = temp_path
+        self.content_hash = content_hash
+        self.size = size
+        self.filename = filename
+        self.format = info["format"]
+        self.width = info["width"]
+        self.height = info["height"]
+
+    def discard(self):
+        """Remove the temporary file if it is still there"""
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+
+class _UploadSink:
+    """Sniffs, hashes, size-checks and writes one file's bytes as they arrive"""
+
+    def __init__(self, temp_path: str, max_size: int, sniff_limit: int):
+        self.temp_path = temp_path
+        self.max_size = max_size
+        self.sniff_limit = sniff_limit
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.info: Optional[Dict[str, Any]] = None
+        self._head = bytearray()
+        self._file = None
+
+    async def write(self, data: bytes):
+        """Accept the next chunk of the file"""
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise UploadRejectedError(413, f"File size must be less than {self.max_size // (1024 * 1024)}MB")
+        self.hasher.update(data)
+
+        if self.info is None:
+            # Hold only the header in memory until format and dimensions are known
+            self._head.extend(data)
+            valid, message, info = ImageUtils.sniff_image_header(bytes(self._head))
+            if valid is False:
+                raise UploadRejectedError(400, message)
+            if valid is None:
+                if len(self._head) >= self.sniff_limit:
+                    raise UploadRejectedError(400, "Could not read image header")
+                return
+            self.info = info
+            data, self._head = bytes(self._head), bytearray()
+
+        if self._file is None:
+            self._file = await asyncio.to_thread(open, self.temp_path, "wb")
+        await asyncio.to_thread(self._file.write, data)
+
+    async def finish(self) -> Dict[str, Any]:
+        """Flush the file and return the sniffed image info"""
+        if self.info is None:
+            valid, message, info = ImageUtils.sniff_image_header(bytes(self._head))
+            if not valid:
+                raise UploadRejectedError(400, message if valid is False else "Could not read image header")
+            self.info = info
+            self._file = await asyncio.to_thread(open, self.temp_path, "wb")
+            await asyncio.to_thread(self._file.write, bytes(self._head))
+        await self.close()
+        return self.info
+
+    async def close(self):
+        """Close the temporary file"""
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+            self._file = None
+
+
+class UploadIngestor:
+    """Stream an upload request body straight to disk
+
+    Accepts a multipart form with a ``file`` field, or a raw ``image/*`` body.
+    The image header is sniffed from the first bytes so unsupported formats
+    and out-of-range dimensions are rejected before the rest of the body is
+    read, and reading stops as soon as the size limit is exceeded. Peak
+    memory per upload is bounded by the chunk size, not the file size.
+    """
+
+    def __init__(self, uploads_dir: str, max_size: int = 10 * 1024 * 1024, sniff_limit: int = 256 * 1024):
+        self.uploads_dir = uploads_dir
+        self.max_size = max_size
+        self.sniff_limit = sniff_limit
+
+    async def ingest(self, request: Request, field_name: str = "file") -> IngestedUpload:
+        """Read the request body into a temporary upload file"""
+        content_length = request.headers.get("content-length")
+        if content_length is not None and content_length.isdigit():
+            # Allow some room for multipart framing
+            if int(content_length) > self.max_size + 64 * 1024:
+                raise UploadRejectedError(413, f"File size must be less than {self.max_size // (1024 * 1024)}MB")
+
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        temp_path = os.path.join(self.uploads_dir, f"{STAGING_PREFIX}{uuid.uuid4()}")
+        sink = _UploadSink(temp_path, self.max_size, self.sniff_limit)
+
+        try:
+            content_type, params = parse_options_header(request.headers.get("content-type", ""))
+            if content_type == b"multipart/form-data":
+                filename = await self._ingest_multipart(request, params.get(b"boundary"), field_name, sink)
+            elif content_type.startswith(b"image/"):
+                async for chunk in request.stream():
+                    await sink.write(chunk)
+                filename = None
+            else:
+                raise UploadRejectedError(400, "File must be an image")
+
+            info = await sink.finish()
+            return IngestedUpload(temp_path, sink.hasher.hexdigest(), sink.size, filename, info)
+
+        except BaseException:
+            await sink.close()
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    async def _ingest_multipart(
+        self,
+        request: Request,
+        boundary: Optional[bytes],
+        field_name: str,
+        sink: _UploadSink
+    ) -> Optional[str]:
+        """Feed the file part of a multipart body into the sink, returning its filename"""
+        if not boundary:
+            raise UploadRejectedError(400, "Missing multipart boundary")
+
+        # Parser callbacks are synchronous, so queue events and drain them per chunk
+        events: List[Tuple[str, bytes]] = []
+        header_field = bytearray()
+        header_value = bytearray()
+
+        def on_header_field(data: bytes, start: int, end: int):
+            header_field.extend(data[start:end])
+
+        def on_header_value(data: bytes, start: int, end: int):
+            header_value.extend(data[start:end])
+
+        def on_header_end():
+            events.append(("header", bytes(header_field).lower() + b"\0" + bytes(header_value)))
+            header_field.clear()
+            header_value.clear()
+
+        callbacks = {
+            "on_part_begin": lambda: events.append(("begin", b"")),
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+            "on_part_end": lambda: events.append(("end", b"")),
+        }
+        parser = MultipartParser(boundary, callbacks)
+
+        in_file = False
+        found = False
+        filename = None
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, payload in events:
+                if kind == "begin":
+                    in_file = False
+                elif kind == "header":
+                    name, _, value = payload.partition(b"\0")
+                    if name == b"content-disposition":
+                        _, options = parse_options_header(value)
+                        if options.get(b"name", b"").decode("latin-1") == field_name and not found:
+                            in_file = found = True
+                            raw_name = options.get(b"filename")
+                            filename = raw_name.decode("utf-8", "replace") if raw_name else None
+                elif kind == "data" and in_file:
+                    await sink.write(payload)
+                elif kind == "end":
+                    in_file = False
+            events.clear()
+        parser.finalize()
+
+        if not found:
+            raise UploadRejectedError(400, f"Missing form field: {field_name}")
+        return filename
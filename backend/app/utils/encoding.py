@@ -0,0 +1,116 @@
+"""
+Result image encoding with Accept-header format negotiation
+
+Every result goes through ``encode_image``: OpenCV's native encoder on the
+BGR array as-is (no colour conversion or PIL round trip), with per-format
+quality from config. Encode time and output size are recorded per format.
+"""
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from .. import config
+from .metrics import ENCODE_SECONDS, ENCODED_BYTES, STAGE_SECONDS
+
+
+class OutputFormat(NamedTuple):
+    """An encodable result format"""
+    name: str
+    extension: str
+    media_type: str
+    params: List[int]
+
+
+FORMATS: Dict[str, OutputFormat] = {
+    "avif": OutputFormat("avif", ".avif", "image/avif", [getattr(cv2, "IMWRITE_AVIF_QUALITY", 512), config.RESULT_AVIF_QUALITY]),
+    "webp": OutputFormat("webp", ".webp", "image/webp", [cv2.IMWRITE_WEBP_QUALITY, config.RESULT_WEBP_QUALITY]),
+    "jpeg": OutputFormat("jpeg", ".jpg", "image/jpeg", [cv2.IMWRITE_JPEG_QUALITY, config.RESULT_JPEG_QUALITY]),
+}
+
+# Server preference when the client accepts several formats equally: smallest first
+PREFERENCE = ("avif", "webp", "jpeg")
+
+_available: Optional[Dict[str, bool]] = None
+_encode_timer = STAGE_SECONDS.labels(stage="encode")
+
+
+def available_formats() -> List[str]:
+    """Formats this OpenCV build can encode, in preference order"""
+    global _available
+    if _available is None:
+        _available = {name: bool(cv2.haveImageWriter(f"probe{FORMATS[name].extension}")) for name in PREFERENCE}
+    return [name for name in PREFERENCE if _available[name]]
+
+
+def get_format(name: str) -> OutputFormat:
+    """Look up an available format by name"""
+    if name not in available_formats():
+        raise ValueError(f"Unsupported output format: {name}")
+    return FORMATS[name]
+
+
+def format_for_extension(extension: str) -> OutputFormat:
+    """Format used to write a file with the given extension"""
+    extension = extension.lower()
+    if extension == ".jpeg":
+        extension = ".jpg"
+    for output_format in FORMATS.values():
+        if output_format.extension == extension:
+            return output_format
+    # Other formats OpenCV can write (png, bmp, ...) use its default settings
+    if extension and cv2.haveImageWriter(f"probe{extension}"):
+        return OutputFormat(extension.lstrip("."), extension, "", [])
+    raise ValueError(f"Unsupported output extension: {extension}")
+
+
+def negotiate(accept: Optional[str], default: Optional[str] = None) -> OutputFormat:
+    """Pick the result format from an Accept header
+
+    Only image types the client names explicitly can upgrade the format;
+    ``*/*``, ``image/*`` or no header get the configured default. Among
+    explicitly accepted formats the highest q wins, ties going to the
+    smallest encoding.
+    """
+    default = default or config.RESULT_FORMAT
+    available = available_formats()
+    if default not in available:
+        default = "jpeg"
+    if not accept:
+        return FORMATS[default]
+
+    by_media_type = {FORMATS[name].media_type: name for name in available}
+    quality: Dict[str, float] = {}
+    for part in accept.split(","):
+        fields = [field.strip() for field in part.split(";")]
+        media_type = fields[0].lower()
+        q = 1.0
+        for field in fields[1:]:
+            if field.startswith("q="):
+                try:
+                    q = float(field[2:])
+                except ValueError:
+                    q = 0.0
+        name = by_media_type.get("image/jpeg" if media_type == "image/jpg" else media_type)
+        if name is not None:
+            quality[name] = max(q, quality.get(name, 0.0))
+
+    accepted = [name for name in available if quality.get(name, 0.0) > 0]
+    if not accepted:
+        return FORMATS[default]
+    return FORMATS[max(accepted, key=lambda name: (quality[name], -PREFERENCE.index(name)))]
+
+
+def encode_image(image: np.ndarray, output_format: OutputFormat) -> np.ndarray:
+    """Encode a BGR image, recording encode time and size for its format"""
+    start = time.perf_counter()
+    ok, encoded = cv2.imencode(output_format.extension, image, output_format.params)
+    elapsed = time.perf_counter() - start
+    if not ok:
+        raise Exception(f"Result image could not be encoded as {output_format.name}")
+
+    _encode_timer.observe(elapsed)
+    ENCODE_SECONDS.labels(format=output_format.name).observe(elapsed)
+    ENCODED_BYTES.labels(format=output_format.name).observe(encoded.nbytes)
+    return encoded
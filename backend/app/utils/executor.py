@@ -0,0 +1,126 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from .. import config
+
+
+class ComputeBusyError(Exception):
+    """Raised when the compute executor queue is full"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Compute executor is busy, retry later")
+        self.retry_after = retry_after
+
+
+class ComputeExecutor:
+    """Bounded executor for CPU-bound image work
+
+    OpenCV/NumPy calls must never run on the event loop, otherwise a single
+    swap stalls every other request on the worker (including /health).
+    Work is submitted with ``await executor.run(func, *args)``; once
+    ``max_workers + max_queue`` calls are in flight further submissions are
+    rejected with ``ComputeBusyError`` instead of queueing without bound.
+    """
+
+    def __init__(
+        self,
+        kind: str = "thread",
+        max_workers: int = 4,
+        max_queue: int = 16,
+        retry_after: int = 2,
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+
+        self._executor: Optional[Executor] = None
+        self._in_flight = 0
+        # Slots are released from pool threads by future callbacks
+        self._lock = threading.Lock()
+        # Optional wrapper applied to every call (the request profiler sets it)
+        self.call_hook: Optional[Callable[[Callable[[], Any]], Callable[[], Any]]] = None
+
+    @property
+    def in_flight(self) -> int:
+        """Number of calls currently running or waiting for a worker"""
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of calls waiting for a free worker"""
+        return max(0, self._in_flight - self.max_workers)
+
+    @property
+    def capacity(self) -> int:
+        """Maximum number of calls accepted at once"""
+        return self.max_workers + self.max_queue
+
+    def _get_executor(self) -> Executor:
+        """Create the underlying pool on first use"""
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="ai-swap-compute",
+                )
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) on the pool and await its result
+
+        A call counts as in flight until the pool finishes it, not until the
+        caller stops waiting: a cancelled caller does not stop a call that is
+        already running, so its slot is released by the future's done
+        callback rather than by the awaiting coroutine.
+        """
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                raise ComputeBusyError(self.retry_after)
+            self._in_flight += 1
+
+        call = functools.partial(func, *args, **kwargs)
+        if self.call_hook is not None:
+            call = self.call_hook(call)
+        try:
+            future = self._get_executor().submit(call)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future: Optional[Future] = None):
+        """Free the slot of a finished, failed or cancelled call"""
+        with self._lock:
+            self._in_flight -= 1
+
+    def shutdown(self, wait: bool = True):
+        """Shut down the underlying pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+_compute_executor: Optional[ComputeExecutor] = None
+
+
+def get_compute_executor() -> ComputeExecutor:
+    """Get the process-wide compute executor, configured from environment"""
+    global _compute_executor
+    if _compute_executor is None:
+        _compute_executor = ComputeExecutor(
+            kind=config.COMPUTE_EXECUTOR,
+            max_workers=config.COMPUTE_MAX_WORKERS,
+            max_queue=config.COMPUTE_MAX_QUEUE,
+            retry_after=config.COMPUTE_RETRY_AFTER,
+        )
+    return _compute_executor
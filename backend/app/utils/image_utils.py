@@ -2,12 +2,37 @@ import cv2
 import numpy as np
 from PIL import Image
 import io
+import threading
 from typing import Tuple, Optional, List
 import os
 
+from .encoding import encode_image, format_for_extension
+
+# Per-thread scratch buffers reused across blends of the same size
+_scratch = threading.local()
+
+
+def _scratch_buffer(slot: str, shape: Tuple[int, ...], dtype) -> np.ndarray:
+    """Get a reusable scratch array for the calling thread"""
+    buffers = getattr(_scratch, "buffers", None)
+    if buffers is None:
+        buffers = _scratch.buffers = {}
+    buffer = buffers.get(slot)
+    if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+        buffer = buffers[slot] = np.empty(shape, dtype=dtype)
+    return buffer
+
+
 class ImageUtils:
     """Utility class for image processing operations"""
     
+    SUPPORTED_FORMATS = ('JPEG', 'PNG', 'WEBP')
+    MIN_DIMENSION = 256
+    MAX_DIMENSION = 4096
+    
+    # Leading bytes of each supported format
+    _MAGIC_PREFIXES = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n')
+    
     @staticmethod
     def validate_image(file_content: bytes, max_size: int = 10 * 1024 * 1024) -> Tuple[bool, str]:
         """Validate uploaded image file"""
@@ -19,23 +44,51 @@ class ImageUtils:
             # Try to open image
             image = Image.open(io.BytesIO(file_content))
             
-            # Check image format
-            if image.format not in ['JPEG', 'JPG', 'PNG', 'WEBP']:
-                return False, "Unsupported image format. Use JPEG, PNG, or WebP"
-            
-            # Check image dimensions
-            width, height = image.size
-            if width < 256 or height < 256:
-                return False, "Image too small. Minimum size is 256x256 pixels"
-            
-            if width > 4096 or height > 4096:
-                return False, "Image too large. Maximum size is 4096x4096 pixels"
-            
-            return True, "Image validation passed"
+            return ImageUtils.check_image_properties(image.format, *image.size)
             
         except Exception as e:
             return False, f"Image validation failed: {str(e)}"
     
+    @staticmethod
+    def check_image_properties(image_format: Optional[str], width: int, height: int) -> Tuple[bool, str]:
+        """Check an image's format and dimensions against upload rules"""
+        # Check image format
+        if image_format not in ImageUtils.SUPPORTED_FORMATS:
+            return False, "Unsupported image format. Use JPEG, PNG, or WebP"
+        
+        # Check image dimensions
+        if width < ImageUtils.MIN_DIMENSION or height < ImageUtils.MIN_DIMENSION:
+            return False, "Image too small. Minimum size is 256x256 pixels"
+        
+        if width > ImageUtils.MAX_DIMENSION or height > ImageUtils.MAX_DIMENSION:
+            return False, "Image too large. Maximum size is 4096x4096 pixels"
+        
+        return True, "Image validation passed"
+    
+    @staticmethod
+    def sniff_image_header(head: bytes) -> Tuple[Optional[bool], str, Optional[dict]]:
+        """Validate an image from its first bytes without decoding pixels
+        
+        Returns (None, reason, None) when the header is plausible but more
+        bytes are needed to read the dimensions.
+        """
+        is_webp = len(head) >= 12 and head[:4] == b'RIFF' and head[8:12] == b'WEBP'
+        if not is_webp and not head.startswith(ImageUtils._MAGIC_PREFIXES):
+            if len(head) < 12:
+                return None, "Need more data", None
+            return False, "Unsupported image format. Use JPEG, PNG, or WebP", None
+        
+        try:
+            # Image.open only parses the header; pixel data is not decoded
+            image = Image.open(io.BytesIO(head))
+            image_format, (width, height) = image.format, image.size
+        except Exception:
+            return None, "Need more data", None
+        
+        valid, message = ImageUtils.check_image_properties(image_format, width, height)
+        info = {"format": image_format, "width": width, "height": height}
+        return valid, message, info if valid else None
+    
     @staticmethod
     def resize_image(image: np.ndarray, target_size: Tuple[int, int]) -> np.ndarray:
         """Resize image to target size while maintaining aspect ratio"""
@@ -90,25 +143,16 @@ class ImageUtils:
         return sharpened
     
     @staticmethod
-    def create_face_mask(landmarks: List[dict], image_shape: Tuple[int, int]) -> np.ndarray:
-        """Create a mask for the face region based on landmarks"""
+    def create_face_mask(landmarks: np.ndarray, image_shape: Tuple[int, int]) -> np.ndarray:
+        """Create a mask for the face region from an (N, 2+) array of landmark points"""
         height, width = image_shape[:2]
         mask = np.zeros((height, width), dtype=np.uint8)
         
-        if not landmarks:
-            return mask
-        
-        # Extract face boundary points
-        face_points = []
-        for landmark in landmarks:
-            x, y = int(landmark['x']), int(landmark['y'])
-            face_points.append([x, y])
-        
-        if len(face_points) < 3:
+        if landmarks is None or len(landmarks) < 3:
             return mask
         
         # Create convex hull for face region
-        face_points = np.array(face_points, dtype=np.int32)
+        face_points = np.asarray(landmarks)[:, :2].round().astype(np.int32)
         hull = cv2.convexHull(face_points)
         
         # Fill the face region
@@ -119,32 +163,150 @@ class ImageUtils:
         
         return mask
     
+    BLEND_MODES = ('feather', 'seamless', 'multiband')
+    
     @staticmethod
-    def blend_images(source: np.ndarray, target: np.ndarray, mask: np.ndarray) -> np.ndarray:
-        """Blend source image into target image using mask"""
-        # Normalize mask to 0-1 range
-        mask_norm = mask.astype(np.float32) / 255.0
-        mask_norm = np.stack([mask_norm] * 3, axis=2)
+    def blend_images(
+        source: np.ndarray,
+        target: np.ndarray,
+        mask: np.ndarray,
+        out: Optional[np.ndarray] = None,
+        mode: str = 'feather'
+    ) -> np.ndarray:
+        """Blend source image into target image using mask
+        
+        Only the bounding box of the non-zero mask is touched. Pass ``out``
+        (which may be ``target`` itself) to write into a preallocated buffer;
+        otherwise a copy of target is returned. Source and target may carry a
+        leading batch axis (F, H, W, 3) that shares one (H, W) mask.
+        """
+        if mode not in ImageUtils.BLEND_MODES:
+            raise ValueError(f"Unknown blend mode: {mode}")
         
         # Ensure images have same size
-        if source.shape != target.shape:
+        if source.ndim == 3 and source.shape != target.shape:
             source = cv2.resize(source, (target.shape[1], target.shape[0]))
+        if mask.dtype != np.uint8:
+            mask = np.clip(mask, 0, 255).astype(np.uint8)
+        
+        if out is None:
+            out = target.copy()
+        elif out is not target:
+            np.copyto(out, target)
+        
+        x, y, w, h = cv2.boundingRect(mask)
+        if w == 0 or h == 0:
+            return out
+        
+        if out.ndim == 4 and mode != 'feather':
+            # OpenCV kernels take one image at a time
+            for index in range(len(out)):
+                ImageUtils.blend_images(source[index], out[index], mask, out=out[index], mode=mode)
+            return out
+        
+        if mode == 'seamless':
+            return ImageUtils._blend_seamless(source, mask, out, (x, y, w, h))
+        
+        roi = (Ellipsis, slice(y, y + h), slice(x, x + w), slice(None))
+        mask_roi = mask[y:y + h, x:x + w]
+        if mode == 'multiband':
+            out[roi] = ImageUtils._blend_multiband(source[roi], out[roi], mask_roi)
+        else:
+            ImageUtils._blend_feather(source[roi], out[roi], mask_roi, out[roi])
+        return out
+    
+    @staticmethod
+    def _blend_feather(source: np.ndarray, target: np.ndarray, mask: np.ndarray, out: np.ndarray):
+        """Fixed-point alpha blend: out = (source*a + target*(255-a)) / 255"""
+        shape = source.shape
+        alpha = mask[..., None]
+        
+        # uint16 accumulators; the mask broadcasts over channels without a copy
+        acc = _scratch_buffer('acc', shape, np.uint16)
+        tmp = _scratch_buffer('tmp', shape, np.uint16)
+        inv = _scratch_buffer('inv', mask.shape, np.uint8)
+        np.subtract(255, mask, out=inv)
+        np.multiply(source, alpha, out=acc, dtype=np.uint16)
+        np.multiply(target, inv[..., None], out=tmp, dtype=np.uint16)
+        acc += tmp
+        
+        # Exact rounded division by 255: (v + 128 + ((v + 128) >> 8)) >> 8
+        acc += 128
+        np.right_shift(acc, 8, out=tmp)
+        acc += tmp
+        acc >>= 8
+        np.copyto(out, acc, casting='unsafe')
+    
+    @staticmethod
+    def _blend_seamless(
+        source: np.ndarray,
+        mask: np.ndarray,
+        out: np.ndarray,
+        bbox: Tuple[int, int, int, int]
+    ) -> np.ndarray:
+        """Poisson (gradient-domain) blend via cv2.seamlessClone"""
+        x, y, w, h = bbox
+        height, width = mask.shape[:2]
+        
+        # seamlessClone needs the mask to stay clear of the image border
+        binary = cv2.threshold(mask, 0, 255, cv2.THRESH_BINARY)[1]
+        binary[:1, :] = 0
+        binary[-1:, :] = 0
+        binary[:, :1] = 0
+        binary[:, -1:] = 0
+        x, y, w, h = cv2.boundingRect(binary)
+        if w < 3 or h < 3 or width < 3 or height < 3:
+            return out
+        
+        center = (x + w // 2, y + h // 2)
+        out[...] = cv2.seamlessClone(source, out, binary, center, cv2.NORMAL_CLONE)
+        return out
+    
+    @staticmethod
+    def _blend_multiband(
+        source: np.ndarray,
+        target: np.ndarray,
+        mask: np.ndarray,
+        levels: int = 4
+    ) -> np.ndarray:
+        """Laplacian pyramid blend, mixing low frequencies over wider areas"""
+        levels = max(1, min(levels, int(np.log2(max(1, min(mask.shape[:2])))) - 2))
+        
+        src = source.astype(np.float32)
+        tgt = target.astype(np.float32)
+        alpha = mask.astype(np.float32) / 255.0
+        
+        gaussian_src, gaussian_tgt, gaussian_alpha = [src], [tgt], [alpha]
+        for _ in range(levels):
+            gaussian_src.append(cv2.pyrDown(gaussian_src[-1]))
+            gaussian_tgt.append(cv2.pyrDown(gaussian_tgt[-1]))
+            gaussian_alpha.append(cv2.pyrDown(gaussian_alpha[-1]))
         
-        # Blend images
-        blended = source * mask_norm + target * (1 - mask_norm)
+        # Start from the coarsest level and add back blended detail bands
+        blended = (
+            gaussian_src[-1] * gaussian_alpha[-1][..., None]
+            + gaussian_tgt[-1] * (1.0 - gaussian_alpha[-1][..., None])
+        )
+        for level in range(levels - 1, -1, -1):
+            size = (gaussian_src[level].shape[1], gaussian_src[level].shape[0])
+            band_src = gaussian_src[level] - cv2.pyrUp(gaussian_src[level + 1], dstsize=size)
+            band_tgt = gaussian_tgt[level] - cv2.pyrUp(gaussian_tgt[level + 1], dstsize=size)
+            a = gaussian_alpha[level][..., None]
+            blended = cv2.pyrUp(blended, dstsize=size) + band_src * a + band_tgt * (1.0 - a)
         
-        return blended.astype(np.uint8)
+        return np.clip(blended, 0, 255).astype(np.uint8)
     
     @staticmethod
-    def save_image(image: np.ndarray, filepath: str, quality: int = 95) -> bool:
-        """Save image to file with specified quality"""
+    def save_image(image: np.ndarray, filepath: str, quality: Optional[int] = None) -> bool:
+        """Save image to file, encoding by its extension with OpenCV"""
         try:
-            # Convert BGR to RGB for PIL
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(rgb_image)
+            output_format = format_for_extension(os.path.splitext(filepath)[1])
+            if quality is not None and output_format.params:
+                output_format = output_format._replace(params=[output_format.params[0], quality])
             
-            # Save with quality setting
-            pil_image.save(filepath, quality=quality, optimize=True)
+            encoded = encode_image(image, output_format)
+            with open(filepath, "wb") as f:
+                f.write(encoded)
             return True
             
         except Exception as e:
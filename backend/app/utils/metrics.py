@@ -0,0 +1,243 @@
+"""
+Prometheus metrics for the upload and swap pipeline
+
+Everything lives in one in-process ``REGISTRY`` that backs both ``/metrics``
+(Prometheus text format) and ``/analytics``. Stage timers are pre-bound
+histogram children, so timing a stage costs a dict lookup and two
+``perf_counter`` calls. Metrics are per worker process; with several
+gunicorn workers, scrape each worker or aggregate downstream.
+"""
+import threading
+from typing import Any, Dict, List
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily
+
+# Starlette appends the charset to text/* media types
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+REGISTRY = CollectorRegistry(auto_describe=True)
+
+STAGES = ("decode", "detect", "template_load", "align", "blend", "encode", "write")
+
+STAGE_SECONDS = Histogram(
+    "ai_swap_stage_seconds",
+    "Time spent in each image pipeline stage",
+    ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+    registry=REGISTRY,
+)
+OPERATION_SECONDS = Histogram(
+    "ai_swap_operation_seconds",
+    "End-to-end time of uploads and swaps, including queueing",
+    ["operation"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+    registry=REGISTRY,
+)
+ENCODE_SECONDS = Histogram(
+    "ai_swap_encode_seconds",
+    "Result encode time by output format",
+    ["format"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+    registry=REGISTRY,
+)
+ENCODED_BYTES = Histogram(
+    "ai_swap_encoded_bytes",
+    "Encoded result size by output format",
+    ["format"],
+    buckets=(16e3, 32e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6),
+    registry=REGISTRY,
+)
+UPLOADS = Counter(
+    "ai_swap_uploads",
+    "Uploads by outcome (new, duplicate, rejected, failed)",
+    ["outcome"],
+    registry=REGISTRY,
+)
+SWAPS = Counter(
+    "ai_swap_swaps",
+    "Swap results by profession, angle and outcome (completed, cached, failed)",
+    ["profession", "angle", "outcome"],
+    registry=REGISTRY,
+)
+DEDUPE = Counter(
+    "ai_swap_dedupe",
+    "Content-addressed reuse of uploads and swap results",
+    ["kind", "result"],
+    registry=REGISTRY,
+)
+SOURCE_CACHE = Counter(
+    "ai_swap_source_cache",
+    "Decoded upload lookups served from memory (hit) or storage (miss)",
+    ["result"],
+    registry=REGISTRY,
+)
+JANITOR_RECLAIMED_FILES = Counter(
+    "ai_swap_janitor_reclaimed_files",
+    "Files deleted by the storage janitor, by area and reason (ttl, quota, temp)",
+    ["area", "reason"],
+    registry=REGISTRY,
+)
+JANITOR_RECLAIMED_BYTES = Counter(
+    "ai_swap_janitor_reclaimed_bytes",
+    "Bytes freed by the storage janitor, by area and reason (ttl, quota, temp)",
+    ["area", "reason"],
+    registry=REGISTRY,
+)
+JANITOR_SWEEP_SECONDS = Histogram(
+    "ai_swap_janitor_sweep_seconds",
+    "Duration of storage janitor sweeps",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0),
+    registry=REGISTRY,
+)
+STORED_FILES = Gauge(
+    "ai_swap_stored_files",
+    "Files kept per storage area after the last janitor sweep",
+    ["area"],
+    registry=REGISTRY,
+)
+STORED_BYTES = Gauge(
+    "ai_swap_stored_bytes",
+    "Bytes kept per storage area after the last janitor sweep",
+    ["area"],
+    registry=REGISTRY,
+)
+
+_stage_timers = {stage: STAGE_SECONDS.labels(stage=stage) for stage in STAGES}
+
+# Professions and angles come from requests; cap label values to bound cardinality
+MAX_LABEL_VALUES = 64
+_label_values: Dict[str, set] = {"profession": set(), "angle": set()}
+_label_lock = threading.Lock()
+
+
+def stage_timer(stage: str):
+    """Context manager timing one pipeline stage"""
+    return _stage_timers[stage].time()
+
+
+def _bounded_label(kind: str, value: str) -> str:
+    """Pass a label value through, or "other" once too many distinct values were seen"""
+    seen = _label_values[kind]
+    if value in seen:
+        return value
+    with _label_lock:
+        if len(seen) < MAX_LABEL_VALUES:
+            seen.add(value)
+            return value
+    return "other"
+
+
+def record_swap(profession: str, angle: str, outcome: str, count: int = 1):
+    """Count swap results for a profession/angle"""
+    SWAPS.labels(
+        profession=_bounded_label("profession", profession),
+        angle=_bounded_label("angle", angle),
+        outcome=outcome,
+    ).inc(count)
+
+
+def record_dedupe(kind: str, hit: bool):
+    """Count an upload or swap that was (or was not) served from existing work"""
+    DEDUPE.labels(kind=kind, result="hit" if hit else "miss").inc()
+
+
+def _sample_values(metric, suffix: str = "_total") -> List[Any]:
+    """Get (labels, value) pairs for one metric's samples with the given suffix"""
+    return [
+        (sample.labels, sample.value)
+        for family in metric.collect()
+        for sample in family.samples
+        if sample.name.endswith(suffix)
+    ]
+
+
+def dedupe_stats() -> Dict[str, Any]:
+    """Dedupe hit/miss counters and hit rates"""
+    stats = {f"{kind}_{result}": 0 for kind in ("upload", "swap") for result in ("hits", "misses")}
+    for labels, value in _sample_values(DEDUPE):
+        result = "hits" if labels["result"] == "hit" else "misses"
+        stats[f"{labels['kind']}_{result}"] = int(value)
+    for kind in ("upload", "swap"):
+        total = stats[f"{kind}_hits"] + stats[f"{kind}_misses"]
+        stats[f"{kind}_hit_rate"] = stats[f"{kind}_hits"] / total if total else 0.0
+    return stats
+
+
+def analytics() -> Dict[str, Any]:
+    """Summarise the registry in the shape of the AnalyticsData schema"""
+    total_uploads = sum(
+        value for labels, value in _sample_values(UPLOADS)
+        if labels["outcome"] in ("new", "duplicate")
+    )
+
+    by_profession: Dict[str, int] = {}
+    total_swaps = 0
+    succeeded = 0
+    for labels, value in _sample_values(SWAPS):
+        total_swaps += value
+        if labels["outcome"] != "failed":
+            succeeded += value
+            by_profession[labels["profession"]] = by_profession.get(labels["profession"], 0) + int(value)
+
+    swap_sum = swap_count = 0.0
+    for labels, value in _sample_values(OPERATION_SECONDS, "_sum"):
+        if labels["operation"] == "swap":
+            swap_sum = value
+    for labels, value in _sample_values(OPERATION_SECONDS, "_count"):
+        if labels["operation"] == "swap":
+            swap_count = value
+
+    popular = sorted(by_profession.items(), key=lambda item: item[1], reverse=True)[:10]
+    return {
+        "total_uploads": int(total_uploads),
+        "total_swaps": int(total_swaps),
+        "popular_professions": [{"profession": name, "count": count} for name, count in popular],
+        "average_processing_time": swap_sum / swap_count if swap_count else 0.0,
+        "success_rate": succeeded / total_swaps if total_swaps else 1.0,
+    }
+
+
+class DetectorCollector:
+    """Expose a DetectorChain's per-backend counters"""
+
+    def __init__(self, chain):
+        self.chain = chain
+
+    def collect(self):
+        """Yield counter families for every backend in the chain"""
+        stats = self.chain.stats()
+        calls = CounterMetricFamily("ai_swap_detector_calls", "Face detector backend calls", labels=["backend"])
+        hits = CounterMetricFamily("ai_swap_detector_hits", "Face detector calls that found a face", labels=["backend"])
+        seconds = CounterMetricFamily("ai_swap_detector_seconds", "Time spent in each face detector backend", labels=["backend"])
+        for backend, backend_stats in stats["backends"].items():
+            calls.add_metric([backend], backend_stats["calls"])
+            hits.add_metric([backend], backend_stats["hits"])
+            seconds.add_metric([backend], backend_stats["mean_ms"] * backend_stats["calls"] / 1000)
+        yield calls
+        yield hits
+        yield seconds
+
+
+def register_runtime_gauges(executor, job_service, template_cache, detector=None, source_cache=None):
+    """Register gauges read from live service state at scrape time"""
+    gauges = (
+        ("ai_swap_executor_in_flight", "Compute calls running or queued", lambda: executor.in_flight),
+        ("ai_swap_executor_queue_depth", "Compute calls waiting for a worker", lambda: executor.queue_depth),
+        ("ai_swap_executor_capacity", "Compute calls accepted before returning 503", lambda: executor.capacity),
+        ("ai_swap_jobs_pending", "Background jobs accepted and not yet finished", lambda: job_service.pending),
+        ("ai_swap_template_cache_bytes", "Bytes of decoded templates held by this worker", lambda: template_cache.size_bytes),
+    )
+    if source_cache is not None:
+        gauges += (
+            ("ai_swap_source_cache_bytes", "Bytes of decoded uploads held by this worker", lambda: source_cache.size_bytes),
+        )
+    for name, documentation, func in gauges:
+        Gauge(name, documentation, registry=REGISTRY).set_function(func)
+    if detector is not None:
+        REGISTRY.register(DetectorCollector(detector))
+
+
+def render() -> bytes:
+    """Render every metric in Prometheus text format"""
+    return generate_latest(REGISTRY)
@@ -0,0 +1,275 @@
+"""
+Opt-in sampling profiler for slow or randomly sampled requests
+
+When ``PROFILER_ENABLED`` is set, ``install`` adds an ASGI middleware and a
+compute executor hook. A sampled request carries a ``RequestProfile`` in a
+context variable; every executor call made on its behalf (FaceService and
+ImageUtils work) registers its worker thread with that profile, and one
+daemon thread snapshots the registered threads' stacks every
+``PROFILER_INTERVAL_MS``. Kept profiles are written in collapsed-stack form
+(``frame;frame;frame count``, as read by flamegraph.pl, speedscope and
+inferno) to a ring directory holding at most ``PROFILER_MAX_FILES`` files.
+
+When disabled nothing is installed: no middleware, no executor hook and no
+sampler thread. Only thread executors get the hook; with
+``COMPUTE_EXECUTOR=process`` the work runs in other processes (and the hook
+could not be pickled), so only the submitting side of a request is profiled.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from .. import config
+
+PROFILE_SUFFIX = ".collapsed"
+PROFILE_NAME = re.compile(r"^(\d+)-(\d+)ms-([A-Z]+)-([A-Za-z0-9_.-]*)\.collapsed$")
+
+_current_profile: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar(
+    "ai_swap_profile", default=None
+)
+
+
+class RequestProfile:
+    """Stack samples collected for one request"""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started = time.time()
+        self.duration_ms = 0.0
+        self.samples: Counter = Counter()
+        self.finished = False
+
+    @property
+    def sample_count(self) -> int:
+        """Number of stack samples taken"""
+        return sum(self.samples.values())
+
+    def file_name(self) -> str:
+        """Ring file name: start time, duration, method and path"""
+        slug = re.sub(r"[^A-Za-z0-9_.]+", "-", self.path).strip("-") or "root"
+        return f"{int(self.started * 1000)}-{int(self.duration_ms)}ms-{self.method}-{slug[:80]}{PROFILE_SUFFIX}"
+
+    def collapsed(self) -> str:
+        """Render samples as collapsed stacks, heaviest first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def _frame_label(frame) -> str:
+    """module:Qualified.name for one frame"""
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _run_profiled(profiler: "SamplingProfiler", profile: RequestProfile, call: Callable[[], Any]) -> Any:
+    """Run call on an executor thread while it is sampled into profile"""
+    profiler.attach(profile)
+    try:
+        return call()
+    finally:
+        profiler.detach()
+
+
+_RUN_PROFILED_CODE = _run_profiled.__code__
+
+
+class SamplingProfiler:
+    """Samples the stacks of executor threads working for profiled requests"""
+
+    def __init__(
+        self,
+        directory: str,
+        sample_rate: float = 0.01,
+        slow_ms: float = 0.0,
+        interval_ms: float = 5.0,
+        max_files: int = 100,
+        exclude_paths: tuple = ("/admin/", "/metrics", "/health"),
+    ):
+        self.directory = directory
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.slow_ms = max(0.0, slow_ms)
+        self.interval = max(0.001, interval_ms / 1000)
+        self.max_files = max(1, max_files)
+        self.exclude_paths = exclude_paths
+
+        self._threads: Dict[int, RequestProfile] = {}
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+
+    def should_profile(self, path: str) -> bool:
+        """Decide up front whether a request is profiled
+
+        With a slow-request threshold every request is profiled and only
+        slow (or randomly sampled) ones are kept, since latency is not
+        known until the response is sent.
+        """
+        if path.startswith(self.exclude_paths):
+            return False
+        return self.slow_ms > 0 or random.random() < self.sample_rate
+
+    def should_keep(self, profile: RequestProfile, sampled: bool) -> bool:
+        """Keep a finished profile if it was sampled or slow, and has samples"""
+        if not profile.samples:
+            return False
+        return sampled or (self.slow_ms > 0 and profile.duration_ms >= self.slow_ms)
+
+    def wrap_call(self, call: Callable[[], Any]) -> Callable[[], Any]:
+        """Executor hook: attribute call's worker thread to the current profile"""
+        profile = _current_profile.get()
+        if profile is None or profile.finished:
+            return call
+        self._ensure_sampler()
+        return functools.partial(_run_profiled, self, profile, call)
+
+    def attach(self, profile: RequestProfile):
+        """Sample the calling thread into profile until detach"""
+        with self._lock:
+            self._threads[threading.get_ident()] = profile
+
+    def detach(self):
+        """Stop sampling the calling thread"""
+        with self._lock:
+            self._threads.pop(threading.get_ident(), None)
+
+    def _ensure_sampler(self):
+        """Start the sampler thread on first use"""
+        if self._sampler is None:
+            with self._lock:
+                if self._sampler is None:
+                    self._sampler = threading.Thread(target=self._sample_loop, name="ai-swap-profiler", daemon=True)
+                    self._sampler.start()
+
+    def _sample_loop(self):
+        """Snapshot registered threads' stacks forever"""
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._threads:
+                    continue
+                threads = dict(self._threads)
+            frames = sys._current_frames()
+            for ident, profile in threads.items():
+                frame = frames.get(ident)
+                stack = []
+                # Stop at the hook so pool internals don't pad every stack
+                while frame is not None and frame.f_code is not _RUN_PROFILED_CODE:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    profile.samples[";".join(reversed(stack))] += 1
+
+    def save(self, profile: RequestProfile) -> str:
+        """Write a profile to the ring directory and evict the oldest beyond max_files"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, profile.file_name())
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(profile.collapsed())
+        os.replace(temp_path, path)
+
+        names = sorted(name for name in os.listdir(self.directory) if PROFILE_NAME.match(name))
+        for name in names[:max(0, len(names) - self.max_files)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        return path
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """Describe stored profiles, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in os.listdir(self.directory):
+            match = PROFILE_NAME.match(name)
+            if not match:
+                continue
+            try:
+                size = os.path.getsize(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            started_ms, duration_ms, method, slug = match.groups()
+            profiles.append({
+                "name": name,
+                "started_at": int(started_ms) / 1000,
+                "duration_ms": int(duration_ms),
+                "method": method,
+                "path_slug": slug,
+                "size_bytes": size,
+                "download_url": f"/admin/profiles/{name}",
+            })
+        profiles.sort(key=lambda entry: entry["name"], reverse=True)
+        return profiles
+
+    def profile_path(self, name: str) -> Optional[str]:
+        """Path of a stored profile, or None if the name is invalid or missing"""
+        if not PROFILE_NAME.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles sampled requests end to end"""
+
+    def __init__(self, app, profiler: SamplingProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.should_profile(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        sampled = self.profiler.slow_ms <= 0 or random.random() < self.profiler.sample_rate
+        profile = RequestProfile(scope["method"], scope["path"])
+        token = _current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_profile.reset(token)
+            profile.finished = True
+            profile.duration_ms = (time.perf_counter() - start) * 1000
+            if self.profiler.should_keep(profile, sampled):
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, self.profiler.save, profile)
+                except Exception as e:
+                    print(f"Error saving profile: {str(e)}")
+
+
+_profiler: Optional[SamplingProfiler] = None
+
+
+def get_profiler() -> Optional[SamplingProfiler]:
+    """Get the process-wide profiler, or None when profiling is disabled"""
+    return _profiler
+
+
+def install(app, executor) -> Optional[SamplingProfiler]:
+    """Attach the profiler to an app and compute executor if PROFILER_ENABLED is set"""
+    global _profiler
+    if not config.PROFILER_ENABLED:
+        return None
+    if _profiler is None:
+        _profiler = SamplingProfiler(
+            config.PROFILER_DIR,
+            sample_rate=config.PROFILER_SAMPLE_RATE,
+            slow_ms=config.PROFILER_SLOW_MS,
+            interval_ms=config.PROFILER_INTERVAL_MS,
+            max_files=config.PROFILER_MAX_FILES,
+        )
+    app.add_middleware(ProfilingMiddleware, profiler=_profiler)
+    # The wrapped call holds the profiler, which cannot be shipped to a process pool
+    if executor.kind == "thread":
+        executor.call_hook = _profiler.wrap_call
+    return _profiler
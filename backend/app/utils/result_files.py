@@ -0,0 +1,156 @@
+"""
+Serving stored result images: name validation, content ETags and byte ranges
+
+Result files are written once under a key derived from every swap input
+and never modified, so they are served with strong content-hash ETags and
+immutable caching. Behind nginx, ``RESULTS_ACCEL_REDIRECT`` hands the body
+to nginx's sendfile path; otherwise ``RangeFileResponse`` streams the file
+(or one byte range of it) from the worker.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import anyio
+from fastapi.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+from .encoding import FORMATS
+
+# result_id (32 hex chars) plus a known result extension; nothing else is servable
+RESULT_NAME = re.compile(
+    r"^[0-9a-f]{32}(" + "|".join(re.escape(f.extension) for f in FORMATS.values()) + r")$"
+)
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a Range header lies entirely outside the file"""
+
+
+def is_result_name(filename: str) -> bool:
+    """Whether filename is a well-formed result file name (no paths)"""
+    return RESULT_NAME.match(filename) is not None
+
+
+def media_type(filename: str) -> str:
+    """Content-Type of a result file from its extension"""
+    extension = os.path.splitext(filename)[1]
+    for output_format in FORMATS.values():
+        if output_format.extension == extension:
+            return output_format.media_type
+    return "application/octet-stream"
+
+
+class ContentHashCache:
+    """Strong ETags from file content, hashed once per (path, mtime, size)"""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def etag(self, path: str, stat_result: os.stat_result) -> str:
+        """Get the quoted ETag for a file, hashing it on first use"""
+        key = (path, stat_result.st_mtime_ns, stat_result.st_size)
+        with self._lock:
+            etag = self._entries.get(key)
+            if etag is not None:
+                self._entries.move_to_end(key)
+                return etag
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        etag = f'"{digest.hexdigest()[:32]}"'
+
+        with self._lock:
+            self._entries[key] = etag
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches etag"""
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in tags or f"W/{etag}" in tags or "*" in tags
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range Range header into an inclusive (start, end)
+
+    Returns None when the whole file should be sent: no header, another
+    unit, a malformed value or several ranges (which RFC 9110 allows a
+    server to ignore).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[6:].strip().partition("-")
+    try:
+        if start_text == "":
+            # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+class RangeFileResponse(FileResponse):
+    """FileResponse that can send one byte range as 206 Partial Content
+
+    Uses the ASGI zero-copy send extension when the server offers it.
+    """
+
+    def __init__(self, path: str, stat_result: os.stat_result, byte_range: Optional[Tuple[int, int]] = None, **kwargs):
+        size = stat_result.st_size
+        self.offset, end = byte_range if byte_range is not None else (0, size - 1)
+        self.count = max(0, end - self.offset + 1)
+        super().__init__(path, stat_result=stat_result, status_code=206 if byte_range is not None else 200, **kwargs)
+        self.headers["content-length"] = str(self.count)
+        if byte_range is not None:
+            self.headers["content-range"] = f"bytes {self.offset}-{end}/{size}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only or self.count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": self.offset,
+                    "count": self.count,
+                    "more_body": False,
+                })
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.offset)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
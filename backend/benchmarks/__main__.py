@@ -0,0 +1,51 @@
+"""
+Run the stage micro-benchmarks and the load test, writing one JSON report
+
+Usage (from backend/):
+    python -m benchmarks --sizes 256 1024 --repeat 5 --requests 50 --output bench.json
+"""
+import argparse
+import asyncio
+import os
+import shutil
+
+from . import load, stages
+from .common import write_report
+from .synthetic import SIZES
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Run the AI-Swap benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint in the load test")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--size", type=int, default=1024, help="Edge length of uploaded images")
+    parser.add_argument("--unique-images", type=int, default=16)
+    parser.add_argument("--templates-dir", default="templates")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    stage_results = stages.run(args.sizes, args.repeat)
+
+    cwd = os.getcwd()
+    workdir = load.prepare_workdir(args.templates_dir)
+    try:
+        load_results = asyncio.run(load.run(
+            list(load.ENDPOINTS), args.requests, args.concurrency, args.size, args.unique_images
+        ))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    write_report({
+        "benchmark": "suite",
+        "stages": {"repeat": args.repeat, "results": stage_results},
+        "load": {"requests_per_endpoint": args.requests, "image_size": args.size, "results": load_results},
+    }, output)
+
+
+if __name__ == "__main__":
+    main()
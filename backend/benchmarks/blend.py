@@ -0,0 +1,122 @@
+"""
+Blend kernel benchmark: time and peak resident memory per blend mode
+
+Memory is the growth in resident set size (VmHWM over VmRSS) during one
+cold call in a forked child, so OpenCV's native allocations are counted
+and one case's freed buffers cannot mask the next. Linux only (reads
+/proc/self/status and resets the peak through /proc/self/clear_refs).
+
+Usage (from backend/):
+    python -m benchmarks.blend --sizes 512 1024 2048 --repeat 5
+"""
+import argparse
+import json
+import multiprocessing
+import time
+from typing import Any, Callable, Dict, List
+
+import cv2
+import numpy as np
+
+from app.utils.image_utils import ImageUtils
+
+
+def legacy_blend(source: np.ndarray, target: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """The original float blend, kept as a baseline"""
+    mask_norm = mask.astype(np.float32) / 255.0
+    mask_norm = np.stack([mask_norm] * 3, axis=2)
+    blended = source * mask_norm + target * (1 - mask_norm)
+    return blended.astype(np.uint8)
+
+
+def make_inputs(size: int):
+    """Synthetic source/target pair with a feathered elliptical face mask"""
+    rng = np.random.default_rng(size)
+    source = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+    target = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+    mask = np.zeros((size, size), dtype=np.uint8)
+    cv2.ellipse(mask, (size // 2, size // 2), (size // 5, size // 4), 0, 0, 360, 255, -1)
+    mask = cv2.GaussianBlur(mask, (0, 0), size / 100)
+    return source, target, mask
+
+
+def _resident_bytes() -> Dict[str, int]:
+    """Current (VmRSS) and peak (VmHWM) resident set size of this process"""
+    usage = {}
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "VmHWM:")):
+                name, value, _ = line.split()
+                usage[name.rstrip(":")] = int(value) * 1024
+    return usage
+
+
+def _peak_rss_growth(func: Callable[[], Any]) -> int:
+    """Resident memory a call adds at its peak"""
+    before = _resident_bytes()["VmRSS"]
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")  # reset VmHWM to the current RSS
+    func()
+    return _resident_bytes()["VmHWM"] - before
+
+
+def measure_peak_rss(func: Callable[[], Any]) -> int:
+    """Peak RSS growth of one cold call, run in a forked child"""
+    context = multiprocessing.get_context("fork")
+    reader, writer = context.Pipe(duplex=False)
+    child = context.Process(target=lambda: writer.send(_peak_rss_growth(func)))
+    child.start()
+    writer.close()
+    try:
+        return reader.recv()
+    finally:
+        child.join()
+
+
+def measure_time(func: Callable[[], Any], repeat: int) -> float:
+    """Median wall time of a callable in milliseconds"""
+    func()  # warm up scratch buffers and OpenCV
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+
+def run(sizes: List[int], repeat: int) -> List[Dict[str, Any]]:
+    """Benchmark every blend mode at every size"""
+    results = []
+    for size in sizes:
+        source, target, mask = make_inputs(size)
+        out = np.empty_like(target)
+        cases = {
+            "legacy_float": lambda: legacy_blend(source, target, mask),
+            "feather": lambda: ImageUtils.blend_images(source, target, mask, mode="feather"),
+            "feather_out": lambda: ImageUtils.blend_images(source, target, mask, out=out, mode="feather"),
+            "seamless": lambda: ImageUtils.blend_images(source, target, mask, out=out, mode="seamless"),
+            "multiband": lambda: ImageUtils.blend_images(source, target, mask, out=out, mode="multiband"),
+        }
+        # Every child forks before the parent has run any case at this size
+        peaks = {name: measure_peak_rss(func) for name, func in cases.items()}
+        for name, func in cases.items():
+            results.append({
+                "size": size,
+                "mode": name,
+                "median_ms": measure_time(func, repeat),
+                "peak_rss_bytes": peaks[name],
+            })
+    return results
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark ImageUtils.blend_images modes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Shared helpers for benchmark timing and JSON reports
+"""
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+def summarize(samples: List[float], elapsed: Optional[float] = None) -> Dict[str, Any]:
+    """Latency percentiles (ms) and throughput for a list of durations in seconds"""
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    total = elapsed if elapsed is not None else float(np.sum(samples))
+    return {
+        "count": len(samples),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(values.mean()), 3),
+        "max_ms": round(float(values.max()), 3),
+        "throughput_per_s": round(len(samples) / total, 2) if total > 0 else None,
+    }
+
+
+def time_calls(func: Callable[[], Any], repeat: int, warmup: int = 1) -> List[float]:
+    """Call func repeatedly, returning each call's duration in seconds"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def environment() -> Dict[str, Any]:
+    """Describe the machine so runs can be compared fairly"""
+    import cv2
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "opencv_threads": cv2.getNumThreads(),
+    }
+
+
+def write_report(report: Dict[str, Any], output: Optional[str] = None):
+    """Print a report as JSON, or write it to a file"""
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": environment(),
+        **report,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
@@ -0,0 +1,154 @@
+"""
+End-to-end latency of the upload -> swap -> result flow
+
+Each flow uploads a fresh image, swaps it into a profession template and
+downloads the result, all through the in-process app (see load.py). Besides
+per-step and whole-flow latency, the report checks from the metrics registry
+that the flow took the fast path: every upload is decoded exactly once and
+swaps reuse that decoded image instead of reading the upload back from
+storage. The process exits non-zero when a request fails or a swap had to
+decode its source again. With COMPUTE_EXECUTOR=process the pipeline metrics
+stay in the pool workers, so only latency is reported.
+
+Usage (from backend/):
+    python -m benchmarks.e2e --flows 50 --concurrency 4 --output e2e.json
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import shutil
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+import httpx
+
+from .common import summarize, write_report
+from .load import prepare_workdir
+from .synthetic import make_jpeg
+
+STEPS = ("upload", "swap", "result")
+
+
+def _sample(name: str, labels: Dict[str, str]) -> float:
+    """Read one sample from the app's metrics registry"""
+    from app.utils.metrics import REGISTRY
+
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def _pipeline_counters() -> Dict[str, float]:
+    """Decode stage and decoded upload cache counters"""
+    return {
+        "decodes": _sample("ai_swap_stage_seconds_count", {"stage": "decode"}),
+        "source_hits": _sample("ai_swap_source_cache_total", {"result": "hit"}),
+        "source_misses": _sample("ai_swap_source_cache_total", {"result": "miss"}),
+    }
+
+
+async def run(flows: int, concurrency: int, size: int) -> Dict[str, Any]:
+    """Run `flows` upload -> swap -> result flows from `concurrency` workers"""
+    from app.main import app, face_service
+
+    latencies: Dict[str, List[float]] = {step: [] for step in STEPS + ("flow",)}
+    statuses: Counter = Counter()
+    counter = itertools.count()
+
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            professions = [p["id"] for p in (await client.get("/professions")).json()["professions"]]
+            # Seeds start past load.py's so a shared workdir never dedupes these uploads
+            images = [make_jpeg(size, 10000 + seed) for seed in range(flows)]
+            before = _pipeline_counters()
+
+            async def step(name: str, send) -> httpx.Response:
+                start = time.perf_counter()
+                response = await send()
+                latencies[name].append(time.perf_counter() - start)
+                statuses[f"{name} {response.status_code}"] += 1
+                response.raise_for_status()
+                return response
+
+            async def flow(index: int):
+                start = time.perf_counter()
+                upload = await step("upload", lambda: client.post(
+                    "/upload", files={"file": (f"e2e-{index}.jpg", images[index], "image/jpeg")}
+                ))
+                swap = await step("swap", lambda: client.post("/swap-face", json={
+                    "image_path": upload.json()["file_path"],
+                    "profession": professions[index % len(professions)],
+                }))
+                await step("result", lambda: client.get(swap.json()["result_path"]))
+                latencies["flow"].append(time.perf_counter() - start)
+
+            async def worker():
+                while True:
+                    index = next(counter)
+                    if index >= flows:
+                        return
+                    try:
+                        await flow(index)
+                    except Exception as e:
+                        statuses[type(e).__name__] += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+            after = _pipeline_counters()
+    finally:
+        await app.router.shutdown()
+
+    counters = {name: int(after[name] - before[name]) for name in after}
+    completed = len(latencies["flow"])
+    fast_path: Dict[str, Any] = {"executor": face_service.executor.kind}
+    if face_service.executor.kind == "thread":
+        fast_path.update(
+            counters,
+            # Decodes beyond one per upload mean a swap re-read its source from storage
+            swap_decodes=counters["decodes"] - completed,
+            ok=counters["decodes"] == completed and counters["source_misses"] == 0,
+        )
+    return {
+        "flows": flows,
+        "completed": completed,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        "status_codes": dict(statuses),
+        "steps": {name: summarize(samples) for name, samples in latencies.items() if name != "flow"},
+        "flow": summarize(latencies["flow"], elapsed),
+        "fast_path": fast_path,
+    }
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="End-to-end latency of upload, swap and result download")
+    parser.add_argument("--flows", type=int, default=50, help="Upload -> swap -> result flows to run")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--size", type=int, default=1024, help="Edge length of uploaded images")
+    parser.add_argument("--templates-dir", default="templates")
+    parser.add_argument("--keep-workdir", action="store_true")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    cwd = os.getcwd()
+    workdir = prepare_workdir(args.templates_dir)
+    try:
+        results = asyncio.run(run(args.flows, args.concurrency, args.size))
+    finally:
+        os.chdir(cwd)
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    write_report({"benchmark": "e2e", "image_size": args.size, **results}, output)
+    if results["completed"] < results["flows"] or results["fast_path"].get("ok") is False:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
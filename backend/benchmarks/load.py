@@ -0,0 +1,172 @@
+"""
+In-process load test for /professions, /upload and /swap-face
+
+The FastAPI app is driven through httpx's ASGI transport, so no server or
+network is needed. It runs in a scratch working directory (templates are
+copied in) so uploads, results, the job database and placeholder templates
+never touch the real ones.
+
+Usage (from backend/):
+    python -m benchmarks.load --requests 200 --concurrency 8 --output load.json
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List
+
+import httpx
+
+from .common import summarize, write_report
+from .synthetic import make_jpeg
+
+ENDPOINTS = ("professions", "upload", "swap")
+
+
+def make_workdir(templates_dir: str) -> str:
+    """Create a scratch directory laid out like backend/, with a copy of the templates
+
+    The app renders placeholders for missing templates into the templates
+    area, so the templates are copied rather than linked to keep benchmark
+    runs out of the source tree.
+    """
+    workdir = tempfile.mkdtemp(prefix="ai-swap-bench-")
+    if os.path.isdir(templates_dir):
+        shutil.copytree(
+            templates_dir, os.path.join(workdir, "templates"), ignore=shutil.ignore_patterns(".pack")
+        )
+    os.makedirs(os.path.join(workdir, "frontend", "static"), exist_ok=True)
+    return workdir
+
+
+def prepare_workdir(templates_dir: str) -> str:
+    """Create a scratch directory laid out like backend/ and chdir into it"""
+    workdir = make_workdir(templates_dir)
+    os.chdir(workdir)
+    return workdir
+
+
+async def run_phase(
+    name: str,
+    send: Callable[[int], Awaitable[httpx.Response]],
+    requests: int,
+    concurrency: int
+) -> Dict[str, Any]:
+    """Issue `requests` calls from `concurrency` workers and summarise latency"""
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    counter = itertools.count()
+
+    async def worker():
+        while True:
+            index = next(counter)
+            if index >= requests:
+                return
+            start = time.perf_counter()
+            try:
+                response = await send(index)
+                statuses[str(response.status_code)] += 1
+            except Exception as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "endpoint": name,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        "errors": errors,
+        "status_codes": dict(statuses),
+        **summarize(latencies, elapsed),
+    }
+
+
+async def run(endpoints: List[str], requests: int, concurrency: int, size: int, unique_images: int) -> List[Dict[str, Any]]:
+    """Load-test each endpoint in turn against an in-process app"""
+    from app.main import app
+
+    images = [make_jpeg(size, seed) for seed in range(max(1, unique_images))]
+    phases = []
+
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            professions = [p["id"] for p in (await client.get("/professions")).json()["professions"]]
+
+            async def upload(index: int) -> httpx.Response:
+                image = images[index % len(images)]
+                return await client.post("/upload", files={"file": (f"bench-{index}.jpg", image, "image/jpeg")})
+
+            if "professions" in endpoints:
+                phases.append(await run_phase(
+                    "professions", lambda index: client.get("/professions"), requests, concurrency
+                ))
+
+            if "upload" in endpoints:
+                phases.append(await run_phase("upload", upload, requests, concurrency))
+
+            if "swap" in endpoints:
+                # Swap across uploads x professions so early requests miss the result cache
+                paths = []
+                for index in range(len(images)):
+                    response = await upload(index)
+                    response.raise_for_status()
+                    paths.append(response.json()["file_path"])
+                combos = list(itertools.product(paths, professions))
+
+                async def swap(index: int) -> httpx.Response:
+                    image_path, profession = combos[index % len(combos)]
+                    return await client.post("/swap-face", json={
+                        "image_path": image_path, "profession": profession, "angle": "front"
+                    })
+
+                phase = await run_phase("swap", swap, requests, concurrency)
+                phase["distinct_swaps"] = min(requests, len(combos))
+                phases.append(phase)
+    finally:
+        await app.router.shutdown()
+    return phases
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="In-process load test of the AI-Swap API")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--size", type=int, default=1024, help="Edge length of uploaded images")
+    parser.add_argument("--unique-images", type=int, default=16, help="Distinct images cycled through uploads")
+    parser.add_argument("--templates-dir", default="templates")
+    parser.add_argument("--keep-workdir", action="store_true")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    cwd = os.getcwd()
+    workdir = prepare_workdir(args.templates_dir)
+    try:
+        phases = asyncio.run(run(args.endpoints, args.requests, args.concurrency, args.size, args.unique_images))
+    finally:
+        os.chdir(cwd)
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    write_report({
+        "benchmark": "load",
+        "requests_per_endpoint": args.requests,
+        "image_size": args.size,
+        "results": phases,
+    }, output)
+
+
+if __name__ == "__main__":
+    main()
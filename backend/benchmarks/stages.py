@@ -0,0 +1,85 @@
+"""
+Pipeline stage micro-benchmarks on synthetic portraits
+
+Usage (from backend/):
+    python -m benchmarks.stages --sizes 256 1024 4096 --repeat 10 --output stages.json
+"""
+import argparse
+from typing import Any, Dict, List
+
+import cv2
+import numpy as np
+
+from app.services.face_service import FaceService
+from app.services.landmarks import basic_landmarks
+from app.utils.encoding import FORMATS, available_formats, encode_image
+from app.utils.image_utils import ImageUtils
+
+from .common import summarize, time_calls, write_report
+from .synthetic import SIZES, face_box, make_face_image
+
+
+def _source_faces(service: FaceService, image: np.ndarray) -> List[Dict[str, Any]]:
+    """Detected faces, or the drawn face box if the detector misses"""
+    detection = service._detect_face(image)
+    faces = service.detection_faces(detection)
+    if faces:
+        return faces[:1]
+    box = face_box(image.shape[0])
+    return [{"face_box": list(box), "landmarks": basic_landmarks(box), "confidence": 0.0}]
+
+
+def run(sizes: List[int], repeat: int, profession: str = "doctor", angle: str = "front") -> List[Dict[str, Any]]:
+    """Time each pipeline stage at each image size"""
+    service = FaceService()
+    template = service._load_template(profession, angle)
+    template_landmarks = service._template_face_landmarks(profession, angle, template)
+
+    results = []
+    for size in sizes:
+        image = make_face_image(size)
+        faces = _source_faces(service, image)
+        mask = np.zeros(image.shape[:2], dtype=np.uint8)
+        cv2.ellipse(mask, (size // 2, size // 2), (size // 5, size // 4), 0, 0, 360, 255, -1)
+        mask = cv2.GaussianBlur(mask, (0, 0), size / 100)
+        target = make_face_image(size, seed=1)
+        out = np.empty_like(target)
+
+        detected, _, _ = service._detect_face_and_landmarks(image)
+        cases = {
+            "detect_face_and_landmarks": lambda: service._detect_face_and_landmarks(image),
+            "perform_face_swap": lambda: service._perform_face_swap(image, template, faces, template_landmarks),
+            "blend_images": lambda: ImageUtils.blend_images(image, target, mask, out=out),
+            "enhance_image": lambda: ImageUtils.enhance_image(image),
+            "resize_image": lambda: ImageUtils.resize_image(image, (512, 512)),
+        }
+        for stage, func in cases.items():
+            results.append({
+                "stage": stage,
+                "size": size,
+                **({"face_detected": bool(detected)} if stage == "detect_face_and_landmarks" else {}),
+                **summarize(time_calls(func, repeat)),
+            })
+        for name in available_formats():
+            output_format = FORMATS[name]
+            results.append({
+                "stage": f"encode_{name}",
+                "size": size,
+                "output_bytes": int(encode_image(image, output_format).nbytes),
+                **summarize(time_calls(lambda: encode_image(image, output_format), repeat)),
+            })
+    return results
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Micro-benchmark FaceService and ImageUtils stages")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    write_report({"benchmark": "stages", "repeat": args.repeat, "results": run(args.sizes, args.repeat)}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Cold start to first healthy response, with and without a preloaded master
+
+Each phase runs real server processes in scratch directories (see load.py)
+and times how long it takes until GET /health answers 200:
+
+- import: a fresh interpreter importing app.main; also lists any files the
+  import wrote into its working directory (there should be none)
+- cold_start: a fresh uvicorn process, which is what every gunicorn worker
+  paid on start and on each max_requests recycle without preload_app
+- worker_restart: a single-worker gunicorn using gunicorn.conf.py; its
+  worker is killed and the time until the replacement answers is measured,
+  once with GUNICORN_PRELOAD=0 (the worker imports the app itself) and once
+  with GUNICORN_PRELOAD=1 (the worker forks from the preloaded master)
+
+Linux only (worker PIDs are read from /proc).
+
+Usage (from backend/):
+    python -m benchmarks.startup --repeat 5 --output startup.json
+"""
+import argparse
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Set
+
+import httpx
+
+from .common import summarize, write_report
+from .load import make_workdir
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SCRIPT = (
+    "import time; start = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def _free_port() -> int:
+    """Pick an unused local TCP port"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _environ(**overrides: str) -> Dict[str, str]:
+    """Child environment with backend/ importable"""
+    env = dict(os.environ, **overrides)
+    env["PYTHONPATH"] = BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def _snapshot(workdir: str) -> Set[str]:
+    """Every path under a directory"""
+    paths = set()
+    for root, dirs, files in os.walk(workdir):
+        for name in dirs + files:
+            paths.add(os.path.relpath(os.path.join(root, name), workdir))
+    return paths
+
+
+def _wait_healthy(port: int, deadline: float, proc: Optional[subprocess.Popen] = None) -> float:
+    """Poll /health until it answers 200, returning the time it did"""
+    url = f"http://127.0.0.1:{port}/health"
+    while time.perf_counter() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise Exception(f"Server exited with code {proc.returncode} before becoming healthy")
+        try:
+            if httpx.get(url, timeout=deadline - time.perf_counter()).status_code == 200:
+                return time.perf_counter()
+        except httpx.TransportError:
+            time.sleep(0.01)
+    raise Exception("Server did not become healthy in time")
+
+
+def _stop(proc: subprocess.Popen):
+    """Stop a server process and wait for it"""
+    if proc.poll() is None:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def _children(pid: int) -> List[int]:
+    """Direct child PIDs of a process"""
+    with open(f"/proc/{pid}/task/{pid}/children", "r") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def measure_import(templates_dir: str, repeat: int) -> Dict[str, Any]:
+    """Time importing app.main in fresh interpreters and list files it wrote"""
+    samples = []
+    written: Set[str] = set()
+    for _ in range(repeat):
+        workdir = make_workdir(templates_dir)
+        try:
+            before = _snapshot(workdir)
+            output = subprocess.run(
+                [sys.executable, "-c", IMPORT_SCRIPT], cwd=workdir, env=_environ(),
+                capture_output=True, text=True, check=True
+            ).stdout
+            samples.append(float(output.strip().splitlines()[-1]))
+            written |= _snapshot(workdir) - before
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {**summarize(samples), "files_written": sorted(written)}
+
+
+def measure_cold_start(templates_dir: str, repeat: int, timeout: float) -> Dict[str, Any]:
+    """Time fresh uvicorn processes from spawn to their first healthy response"""
+    samples = []
+    for _ in range(repeat):
+        workdir = make_workdir(templates_dir)
+        port = _free_port()
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(port), "--log-level", "warning"],
+            cwd=workdir, env=_environ(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            samples.append(_wait_healthy(port, start + timeout, proc) - start)
+        finally:
+            _stop(proc)
+            shutil.rmtree(workdir, ignore_errors=True)
+    return summarize(samples)
+
+
+def measure_worker_restart(templates_dir: str, repeat: int, timeout: float, preload: bool) -> Dict[str, Any]:
+    """Time how long a killed gunicorn worker takes to be replaced and answer"""
+    workdir = make_workdir(templates_dir)
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--config", os.path.join(BACKEND_DIR, "gunicorn.conf.py"),
+         "--workers", "1", "--bind", f"127.0.0.1:{port}", "--pid", os.path.join(workdir, "gunicorn.pid"),
+         "app.main:app"],
+        cwd=workdir, env=_environ(GUNICORN_PRELOAD="1" if preload else "0"),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    samples = []
+    try:
+        _wait_healthy(port, time.perf_counter() + timeout, proc)
+        for _ in range(repeat):
+            workers = _children(proc.pid)
+            start = time.perf_counter()
+            for worker in workers:
+                os.kill(worker, signal.SIGKILL)
+            # The master keeps the listening socket, so this request waits for the new worker
+            samples.append(_wait_healthy(port, start + timeout, proc) - start)
+    finally:
+        _stop(proc)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return summarize(samples)
+
+
+def run(templates_dir: str, repeat: int, timeout: float) -> Dict[str, Any]:
+    """Run every startup phase"""
+    results: Dict[str, Any] = {
+        "import": measure_import(templates_dir, repeat),
+        "cold_start": measure_cold_start(templates_dir, repeat, timeout),
+    }
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        results["worker_restart"] = {"skipped": "gunicorn is not installed"}
+        return results
+
+    results["worker_restart"] = {
+        "no_preload": measure_worker_restart(templates_dir, repeat, timeout, preload=False),
+        "preload": measure_worker_restart(templates_dir, repeat, timeout, preload=True),
+    }
+    return results
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Startup time of the AI-Swap API to its first healthy response")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for each server to become healthy")
+    parser.add_argument("--templates-dir", default="templates")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    write_report({
+        "benchmark": "startup",
+        "repeat": args.repeat,
+        **run(args.templates_dir, args.repeat, args.timeout),
+    }, output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Synthetic face-like test images, generated offline and deterministically
+
+The face is drawn in the proportions the Haar cascade expects (dark eye
+band, lighter nose bridge, dark mouth), so detection normally succeeds;
+``face_box`` reports where it was drawn either way, so swap stages can be
+benchmarked without depending on the detector.
+"""
+from typing import Dict, Tuple
+
+import cv2
+import numpy as np
+
+SIZES = (256, 512, 1024, 2048, 4096)
+
+
+def face_box(size: int) -> Tuple[int, int, int, int]:
+    """Where make_face_image draws the face, as (x, y, w, h)"""
+    w = int(size * 0.36)
+    h = int(w * 1.25)
+    return (size - w) // 2, int(size * 0.22), w, h
+
+
+def make_face_image(size: int, seed: int = 0) -> np.ndarray:
+    """Draw a size x size BGR portrait with one face-like pattern"""
+    rng = np.random.default_rng(seed + size)
+
+    # Soft vertical gradient background
+    column = np.linspace(70, 170, size, dtype=np.float32)[:, None]
+    image = np.repeat(np.repeat(column, size, axis=1)[..., None], 3, axis=2)
+    image[..., 0] *= 0.9
+
+    x, y, w, h = face_box(size)
+    cx, cy = x + w // 2, y + h // 2
+
+    def pt(fx: float, fy: float) -> Tuple[int, int]:
+        return int(x + fx * w), int(y + fy * h)
+
+    def ax(fx: float, fy: float) -> Tuple[int, int]:
+        return max(1, int(fx * w)), max(1, int(fy * h))
+
+    # Head, hair, then features in typical proportions
+    cv2.ellipse(image, (cx, cy), ax(0.5, 0.5), 0, 0, 360, (120, 160, 215), -1)
+    cv2.ellipse(image, pt(0.5, 0.08), ax(0.52, 0.16), 0, 180, 360, (40, 45, 60), -1)
+    for side in (0.3, 0.7):
+        cv2.ellipse(image, pt(side, 0.28), ax(0.13, 0.03), 0, 0, 360, (50, 60, 80), -1)
+        cv2.ellipse(image, pt(side, 0.37), ax(0.11, 0.05), 0, 0, 360, (235, 235, 240), -1)
+        cv2.circle(image, pt(side, 0.37), max(1, int(0.045 * w)), (40, 35, 30), -1)
+    cv2.ellipse(image, pt(0.5, 0.55), ax(0.07, 0.12), 0, 0, 360, (105, 140, 195), -1)
+    cv2.ellipse(image, pt(0.5, 0.75), ax(0.17, 0.05), 0, 0, 360, (70, 70, 150), -1)
+
+    image = cv2.GaussianBlur(image, (0, 0), max(0.8, size / 400))
+    image += rng.normal(0, 4, image.shape).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def make_jpeg(size: int, seed: int = 0, quality: int = 90) -> bytes:
+    """Encode a synthetic portrait as JPEG bytes"""
+    ok, encoded = cv2.imencode(".jpg", make_face_image(size, seed), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise Exception("Synthetic image could not be encoded")
+    return encoded.tobytes()
+
+
+def make_images(sizes=SIZES) -> Dict[int, np.ndarray]:
+    """Synthetic portraits keyed by edge length"""
+    return {size: make_face_image(size) for size in sizes}
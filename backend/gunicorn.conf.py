@@ -1,7 +1,12 @@
 """
 Gunicorn configuration for AI-Swap backend
 """
+import gc
 import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # Server socket
 bind = "0.0.0.0:8000"
@@ -20,6 +25,13 @@ keepalive = 2
 max_requests = 1000
 max_requests_jitter = 50
 
+# Import the app (FastAPI, cv2, numpy, detector models) once in the master.
+# Workers, including the ones max_requests recycles, fork from it and share
+# those pages copy-on-write instead of importing everything again. Importing
+# the app writes no files and starts no threads or connections, so it is
+# safe to fork. Code changes then need a full restart, not a HUP.
+preload_app = bool(int(os.getenv("GUNICORN_PRELOAD", "1")))
+
 # Logging
 accesslog = "-"
 errorlog = "-"
@@ -36,6 +48,21 @@ user = None
 group = None
 tmp_upload_dir = None
 
+# Server hooks
+def on_starting(server):
+    """Build the shared template pack once, before any worker forks"""
+    from app import config
+    if not config.TEMPLATE_PACK:
+        return
+    
+    from app.services.template_pack import build_template_pack
+    index = build_template_pack(config.TEMPLATES_DIR, config.TEMPLATE_PACK_DIR)
+    server.log.info("Built template pack with %d templates in %s", len(index), config.TEMPLATE_PACK_DIR)
+
+def pre_fork(server, worker):
+    """Move the preloaded app's objects out of the GC, so collections in workers do not copy their pages"""
+    gc.freeze()
+
 # SSL (if needed)
 # keyfile = "/path/to/keyfile"
 # certfile = "/path/to/certfile" 
\ No newline at end of file
@@ -0,0 +1,41 @@
+import os
+
+import httpx
+import pytest
+
+# Config is read at import, so pin it before anything imports the app
+os.environ.update(
+    COMPUTE_EXECUTOR="thread",
+    JOB_STORE="memory",
+    JANITOR_ENABLED="0",
+    TEMPLATE_PRELOAD="0",
+    PROFILER_ENABLED="0",
+    ADMIN_TOKEN="",
+)
+
+
+@pytest.fixture(scope="session")
+def workdir(tmp_path_factory):
+    """Scratch directory laid out like backend/, used as the app's working directory"""
+    path = tmp_path_factory.mktemp("app")
+    (path / "frontend" / "static").mkdir(parents=True)
+    cwd = os.getcwd()
+    os.chdir(path)
+    yield path
+    os.chdir(cwd)
+
+
+@pytest.fixture(scope="session")
+def main(workdir):
+    """The app.main module, imported inside the scratch working directory"""
+    from app import main
+
+    return main
+
+
+@pytest.fixture
+async def client(main):
+    """HTTP client bound to the in-process app"""
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
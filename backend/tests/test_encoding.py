@@ -0,0 +1,37 @@
+import pytest
+
+from app.utils import encoding
+from app.utils.encoding import negotiate
+
+
+@pytest.fixture
+def formats(monkeypatch):
+    """Pretend every format can be encoded, so negotiation does not depend on the OpenCV build"""
+    monkeypatch.setattr(encoding, "_available", {name: True for name in encoding.PREFERENCE})
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, "jpeg"),
+    ("", "jpeg"),
+    ("*/*", "jpeg"),
+    ("image/*", "jpeg"),
+    ("image/png", "jpeg"),
+    ("image/webp", "webp"),
+    ("image/webp,image/avif,*/*", "avif"),
+    ("image/avif;q=0.5, image/webp", "webp"),
+    ("image/webp;q=0, image/jpeg", "jpeg"),
+    ("image/jpg", "jpeg"),
+    ("image/webp;q=bogus", "jpeg"),
+])
+def test_negotiate(formats, accept, expected):
+    assert negotiate(accept, default="jpeg").name == expected
+
+
+def test_negotiate_uses_configured_default(formats):
+    assert negotiate("*/*", default="webp").name == "webp"
+
+
+def test_negotiate_skips_formats_the_build_cannot_encode(monkeypatch):
+    monkeypatch.setattr(encoding, "_available", {"avif": False, "webp": True, "jpeg": True})
+    assert negotiate("image/avif,image/webp;q=0.9", default="jpeg").name == "webp"
+    assert negotiate(None, default="avif").name == "jpeg"
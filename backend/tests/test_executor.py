@@ -0,0 +1,80 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.utils.executor import ComputeBusyError, ComputeExecutor
+from benchmarks.synthetic import make_jpeg
+
+
+async def _wait_for(predicate, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+async def test_full_executor_rejects_calls():
+    executor = ComputeExecutor(max_workers=1, max_queue=0, retry_after=3)
+    release = threading.Event()
+    try:
+        running = asyncio.ensure_future(executor.run(release.wait))
+        await _wait_for(lambda: executor.in_flight == 1)
+        with pytest.raises(ComputeBusyError) as busy:
+            await executor.run(lambda: None)
+        assert busy.value.retry_after == 3
+
+        release.set()
+        assert await running is True
+        assert executor.in_flight == 0
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+async def test_cancelled_caller_keeps_slot_until_call_finishes():
+    executor = ComputeExecutor(max_workers=1, max_queue=0)
+    started, release = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        release.wait()
+
+    try:
+        task = asyncio.ensure_future(executor.run(work))
+        await _wait_for(started.is_set)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # The call is still running on the pool, so it still holds capacity
+        assert executor.in_flight == 1
+        with pytest.raises(ComputeBusyError):
+            await executor.run(lambda: None)
+
+        release.set()
+        await _wait_for(lambda: executor.in_flight == 0)
+        assert await executor.run(lambda: 42) == 42
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+async def test_failed_call_releases_its_slot():
+    executor = ComputeExecutor(max_workers=1, max_queue=0)
+    try:
+        with pytest.raises(ZeroDivisionError):
+            await executor.run(lambda: 1 / 0)
+        await _wait_for(lambda: executor.in_flight == 0)
+    finally:
+        executor.shutdown()
+
+
+async def test_saturated_executor_answers_503_with_retry_after(client, main, monkeypatch):
+    executor = main.face_service.executor
+    monkeypatch.setattr(executor, "_in_flight", executor.capacity)
+    monkeypatch.setattr(executor, "retry_after", 5)
+
+    response = await client.post("/upload", files={"file": ("face.jpg", make_jpeg(256, 900), "image/jpeg")})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
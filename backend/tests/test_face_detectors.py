@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import pytest
+
+from app import config
+from app.services.face_detectors import FaceDetector, HaarDetector, create_detector_chain, default_chain_spec
+from app.utils.executor import ComputeExecutor
+from benchmarks.synthetic import make_face_image, make_jpeg
+
+
+def test_default_chain_adds_yunet_only_when_its_model_exists(tmp_path, monkeypatch):
+    model = tmp_path / "yunet.onnx"
+    monkeypatch.setattr(config, "DETECTION_CHAIN", "")
+    monkeypatch.setattr(config, "DETECTION_YUNET_MODEL", str(model))
+    assert default_chain_spec() == "haar"
+    assert create_detector_chain().name == "haar"
+
+    model.write_bytes(b"")
+    assert default_chain_spec() == "haar,yunet"
+
+
+def test_detector_backends_must_implement_detect():
+    with pytest.raises(TypeError):
+        FaceDetector()
+
+
+def test_haar_detector_is_safe_across_threads():
+    detector = HaarDetector(max_edge=0)
+    images = [make_face_image(size, seed) for size in (256, 320, 384, 448) for seed in range(2)]
+    grays = [cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) for image in images]
+    expected = [detector.detect(image, gray) for image, gray in zip(images, grays)]
+
+    def detect_repeatedly(i):
+        return [detector.detect(images[i], grays[i]) == expected[i] for _ in range(10)]
+
+    with ThreadPoolExecutor(max_workers=len(images)) as pool:
+        results = list(pool.map(detect_repeatedly, range(len(images))))
+    assert all(all(matches) for matches in results)
+
+
+async def test_detector_metrics_include_process_pool_detections(client, main, monkeypatch):
+    executor = ComputeExecutor(kind="process", max_workers=1)
+    monkeypatch.setattr(main.face_service, "executor", executor)
+    try:
+        before = (await client.get("/metrics/detectors")).json()
+        for seed in range(3):
+            response = await client.post(
+                "/upload", files={"file": (f"face-{seed}.jpg", make_jpeg(256, 700 + seed), "image/jpeg")}
+            )
+            assert response.status_code == 200
+        after = (await client.get("/metrics/detectors")).json()
+    finally:
+        executor.shutdown()
+
+    assert after["calls"] - before["calls"] == 3
+    assert after["backends"]["haar"]["calls"] - before["backends"]["haar"]["calls"] == 3
@@ -0,0 +1,75 @@
+import os
+import time
+
+import pytest
+
+from app.services.janitor import RetentionPolicy, StorageJanitor
+from app.services.session_index import SessionIndex
+from app.services.storage import LocalStorage
+
+HOUR = 3600
+
+
+def result_key(i: int) -> str:
+    return f"results/{i:02d}{'a' * 30}.jpg"
+
+
+@pytest.fixture(params=["listed", "indexed"])
+def storage(request, tmp_path):
+    """A LocalStorage with results last used 1..10 hours ago, optionally indexed"""
+    storage = LocalStorage(
+        {area: str(tmp_path / area) for area in ("uploads", "results", "templates")}, atime_resolution=0
+    )
+    now = time.time()
+    for i in range(10):
+        storage.write(result_key(i), b"z" * 1000)
+        used = now - HOUR * (i + 1)
+        os.utime(storage.path(result_key(i)), (used, used))
+
+    if request.param == "indexed":
+        # Attached after the writes, so the first (walking) sweep indexes the file times
+        storage.index = SessionIndex(str(tmp_path / "sessions.db"))
+    yield storage
+    if storage.index is not None:
+        storage.index.close()
+
+
+def make_janitor(storage: LocalStorage, tmp_path, policy: RetentionPolicy) -> StorageJanitor:
+    return StorageJanitor(
+        storage,
+        {"results": policy},
+        lock_file=str(tmp_path / ".janitor.lock"),
+        low_watermark=0.5,
+        index=storage.index,
+    )
+
+
+def kept(storage: LocalStorage):
+    return [i for i in range(10) if os.path.exists(storage.path(result_key(i)))]
+
+
+def test_ttl_deletes_objects_unused_for_longer(storage, tmp_path):
+    janitor = make_janitor(storage, tmp_path, RetentionPolicy(ttl=5.5 * HOUR, max_bytes=0))
+    report = janitor.sweep(force=True, walk=True)
+
+    assert kept(storage) == [0, 1, 2, 3, 4]
+    assert report["areas"]["results"]["reclaimed"]["ttl"] == {"files": 5, "bytes": 5000}
+    assert report["areas"]["results"]["bytes"] == 5000
+
+
+def test_quota_evicts_least_recently_used_to_the_low_watermark(storage, tmp_path):
+    janitor = make_janitor(storage, tmp_path, RetentionPolicy(ttl=0, max_bytes=8000))
+    report = janitor.sweep(force=True, walk=True)
+
+    # 10000 bytes over an 8000 quota: evict the oldest until at most half the quota is left
+    assert kept(storage) == [0, 1, 2, 3]
+    assert report["areas"]["results"]["reclaimed"]["quota"] == {"files": 6, "bytes": 6000}
+
+
+def test_dry_run_deletes_nothing(storage, tmp_path):
+    janitor = make_janitor(storage, tmp_path, RetentionPolicy(ttl=5.5 * HOUR, max_bytes=2000))
+    report = janitor.sweep(force=True, dry_run=True, walk=True)
+
+    assert kept(storage) == list(range(10))
+    reclaimed = report["areas"]["results"]["reclaimed"]
+    assert reclaimed["ttl"]["files"] + reclaimed["quota"]["files"] == 9
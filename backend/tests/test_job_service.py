@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from app.models.schemas import ProcessingStatus
+from app.services.job_service import InMemoryJobStore, JobService, JobStore, SQLiteJobStore
+
+
+async def _block_forever(progress):
+    await progress(20, "Swapping face")
+    await asyncio.Event().wait()
+
+
+def test_job_store_is_abstract():
+    with pytest.raises(TypeError):
+        JobStore()
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+async def test_shutdown_marks_running_jobs_failed(tmp_path, kind):
+    path = str(tmp_path / "jobs.db")
+    store = InMemoryJobStore() if kind == "memory" else SQLiteJobStore(path)
+    service = JobService(store=store)
+
+    job_id = await service.submit(_block_forever)
+    for _ in range(100):
+        status = await service.get_status(job_id)
+        if status.progress == 20:
+            break
+        await asyncio.sleep(0.01)
+
+    await service.shutdown()
+    assert service.pending == 0
+
+    if kind == "sqlite":
+        store = SQLiteJobStore(path)
+    status = await store.get(job_id)
+    assert status.status == "failed"
+    assert status.message == "Job interrupted"
+    await store.close()
+
+
+async def test_cancel_while_waiting_for_capacity_marks_job_failed():
+    from app.utils.executor import ComputeBusyError
+
+    async def busy(progress):
+        raise ComputeBusyError(60)
+
+    store = InMemoryJobStore()
+    service = JobService(store=store)
+    job_id = await service.submit(busy)
+    await asyncio.sleep(0.05)
+    assert (await store.get(job_id)).status == "pending"
+
+    await service.shutdown()
+    assert (await store.get(job_id)).status == "failed"
+
+
+async def test_stale_sqlite_job_is_reported_failed(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"), stale_timeout=60)
+    await store.put("job", ProcessingStatus(job_id="job", status="processing", progress=50))
+    assert (await store.get("job")).status == "processing"
+
+    # Simulate a worker that died a while ago
+    store._connect().execute("UPDATE jobs SET updated_at = updated_at - 120")
+    status = await store.get("job")
+    assert status.status == "failed"
+    assert "No progress" in status.error
+    # The failure is persisted, not just reported
+    assert (await store.get("job")).status == "failed"
+    await store.close()
+
+
+async def test_stale_memory_job_is_reported_failed():
+    store = InMemoryJobStore(stale_timeout=60)
+    await store.put("job", ProcessingStatus(job_id="job", status="pending"))
+    store._updated_at["job"] -= 120
+    assert (await store.get("job")).status == "failed"
+
+
+async def test_sqlite_prune_drops_abandoned_rows(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"), ttl=10, stale_timeout=10)
+    await store.put("old", ProcessingStatus(job_id="old", status="processing"))
+    store._connect().execute("UPDATE jobs SET updated_at = updated_at - 100")
+    await store.put("new", ProcessingStatus(job_id="new", status="pending"))
+    assert await store.get("old") is None
+    assert (await store.get("new")).status == "pending"
+    await store.close()
@@ -0,0 +1,61 @@
+import pytest
+
+from app.utils.result_files import RangeNotSatisfiable, parse_range
+
+RESULT_NAME = "0123456789abcdef0123456789abcdef.jpg"
+BODY = bytes(range(256)) * 4
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("items=0-10", None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 1023)),
+    ("bytes=1000-5000", (1000, 1023)),
+    ("bytes=-24", (1000, 1023)),
+    ("bytes=-5000", (0, 1023)),
+    ("bytes=0-1,5-6", None),
+    ("bytes=abc-def", None),
+    ("bytes=10-5", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1024) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=5000-6000", "bytes=-0"])
+def test_parse_range_not_satisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 1024)
+
+
+@pytest.fixture
+def stored_result(main):
+    key = f"results/{RESULT_NAME}"
+    main.face_service.storage.write(key, BODY)
+    yield f"/results/{RESULT_NAME}"
+    main.face_service.storage.delete(key)
+
+
+async def test_result_range_is_partial_content(client, stored_result):
+    response = await client.get(stored_result, headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 10-19/{len(BODY)}"
+    assert response.content == BODY[10:20]
+
+    response = await client.get(stored_result)
+    assert response.status_code == 200
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.content == BODY
+
+
+async def test_result_range_past_the_end_is_not_satisfiable(client, stored_result):
+    response = await client.get(stored_result, headers={"Range": f"bytes={len(BODY)}-"})
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"bytes */{len(BODY)}"
+
+
+async def test_result_range_ignored_for_stale_if_range(client, stored_result):
+    response = await client.get(stored_result, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == BODY
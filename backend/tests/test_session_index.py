@@ -0,0 +1,36 @@
+from app.services.session_index import SessionIndex, upload_asset
+
+
+def test_session_pages_follow_cursors(tmp_path):
+    index = SessionIndex(str(tmp_path / "sessions.db"))
+    try:
+        index.record_assets("session-a", [upload_asset(f"image{i}", f"uploads/image{i}.jpg") for i in range(5)])
+        index.record_assets("session-b", [upload_asset("other", "uploads/other.jpg")])
+
+        pages, cursor = [], None
+        while True:
+            page = index.get_session("session-a", limit=2, cursor=cursor)
+            assert page["total_assets"] == 5
+            pages.append([asset["asset_id"] for asset in page["assets"]])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        assert pages == [["image4", "image3"], ["image2", "image1"], ["image0"]]
+    finally:
+        index.close()
+
+
+def test_session_page_filters_by_kind(tmp_path):
+    index = SessionIndex(str(tmp_path / "sessions.db"))
+    try:
+        index.record_assets("session-a", [upload_asset("image0", "uploads/image0.jpg")])
+        page = index.get_session("session-a", kind="result")
+        assert page["assets"] == [] and page["total_assets"] == 0 and page["next_cursor"] is None
+
+        page = index.get_session("session-a", kind="upload", limit=1)
+        assert [asset["asset_id"] for asset in page["assets"]] == ["image0"]
+        assert page["next_cursor"] is None
+        assert index.get_session("unknown") is None
+    finally:
+        index.close()
@@ -0,0 +1,144 @@
+import io
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from botocore.exceptions import ClientError
+
+from app.services.storage import ReadThroughCache, S3Storage, Storage
+
+UPLOAD = "uploads/0123456789abcdef0123456789abcdef.jpg"
+RESULT = "results/0123456789abcdef0123456789abcdef.webp"
+TEMPLATE = "templates/doctor/front.jpg"
+
+
+class StubS3Client:
+    """In-memory stand-in for the boto3 S3 client calls S3Storage makes"""
+
+    def __init__(self):
+        self.objects = {}
+        self.calls = Counter()
+        self._clock = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def _store(self, key, data):
+        self._clock += timedelta(seconds=1)
+        self.objects[key] = (bytes(data), self._clock)
+
+    def _get(self, key, operation):
+        self.calls[operation] += 1
+        if key not in self.objects:
+            raise ClientError({"Error": {"Code": "404" if operation == "head_object" else "NoSuchKey"}}, operation)
+        return self.objects[key]
+
+    def head_object(self, Bucket, Key):
+        data, modified = self._get(Key, "head_object")
+        return {"ContentLength": len(data), "LastModified": modified}
+
+    def get_object(self, Bucket, Key):
+        data, _ = self._get(Key, "get_object")
+        return {"Body": io.BytesIO(data)}
+
+    def download_file(self, bucket, key, path, Config=None):
+        data, _ = self._get(key, "download_file")
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def put_object(self, Bucket, Key, Body):
+        self.calls["put_object"] += 1
+        self._store(Key, Body)
+
+    def upload_fileobj(self, fileobj, bucket, key, Config=None):
+        self.calls["upload_fileobj"] += 1
+        self._store(key, fileobj.read())
+
+    def upload_file(self, path, bucket, key, Config=None):
+        self.calls["upload_file"] += 1
+        with open(path, "rb") as f:
+            self._store(key, f.read())
+
+    def delete_object(self, Bucket, Key):
+        self.calls["delete_object"] += 1
+        self.objects.pop(Key, None)
+
+
+@pytest.fixture
+def client():
+    return StubS3Client()
+
+
+@pytest.fixture
+def storage(tmp_path, client):
+    storage = S3Storage("bucket", prefix="app", region="us-east-1",
+                        cache=ReadThroughCache(str(tmp_path / "cache"), 1024 * 1024))
+    storage._client = client
+    return storage
+
+
+def test_storage_interface_is_abstract():
+    with pytest.raises(TypeError):
+        Storage()
+
+
+def test_uploads_are_read_through_the_local_cache(storage, client):
+    # Written by another node, so this one has no cached copy yet
+    client.put_object(Bucket="bucket", Key=f"app/{UPLOAD}", Body=b"upload")
+
+    assert storage.read(UPLOAD) == b"upload"
+    assert storage.read(UPLOAD) == b"upload"
+    with open(storage.local_path(UPLOAD), "rb") as f:
+        assert f.read() == b"upload"
+    assert client.calls["download_file"] == 1
+    assert client.calls["get_object"] == 0
+
+
+def test_results_are_read_from_the_bucket(storage, client):
+    storage.write(RESULT, b"result")
+
+    assert storage.read(RESULT) == b"result"
+    assert storage.read(RESULT) == b"result"
+    assert client.calls["get_object"] == 2
+
+
+def test_changed_templates_are_fetched_again(storage, client):
+    client.put_object(Bucket="bucket", Key=f"app/{TEMPLATE}", Body=b"v1")
+    assert storage.read(TEMPLATE) == b"v1"
+    assert storage.read(TEMPLATE) == b"v1"
+    assert client.calls["download_file"] == 1
+
+    client.put_object(Bucket="bucket", Key=f"app/{TEMPLATE}", Body=b"version 2")
+    assert storage.read(TEMPLATE) == b"version 2"
+    assert client.calls["download_file"] == 2
+
+
+def test_stat(storage, client):
+    assert storage.stat(RESULT) is None
+    storage.write(RESULT, b"result")
+    assert storage.stat(RESULT).size == 6
+
+    # A cached immutable upload is answered locally, without a HEAD request
+    storage.write(UPLOAD, b"upload")
+    heads = client.calls["head_object"]
+    assert storage.stat(UPLOAD).size == 6
+    assert client.calls["head_object"] == heads
+
+
+def test_delete_removes_the_object_and_its_cached_copy(storage, client):
+    storage.write(UPLOAD, b"upload")
+    cached = storage.local_path(UPLOAD)
+
+    storage.delete(UPLOAD)
+    assert f"app/{UPLOAD}" not in client.objects
+    assert not os.path.exists(cached)
+    assert storage.stat(UPLOAD) is None
+    with pytest.raises(FileNotFoundError):
+        storage.read(UPLOAD)
+    storage.delete(UPLOAD)
+
+
+def test_stat_falls_back_to_the_bucket_when_the_cached_copy_vanishes(storage, client):
+    storage.write(UPLOAD, b"upload")
+    os.remove(storage.local_path(UPLOAD))
+
+    assert storage.stat(UPLOAD).size == 6
+    assert client.calls["head_object"] == 1
@@ -0,0 +1,122 @@
+import json
+
+import pytest
+
+from app import config
+from app.utils.executor import ComputeBusyError
+from app.utils.metrics import REGISTRY
+from benchmarks.synthetic import make_jpeg
+
+
+@pytest.mark.parametrize("profession, angle", [
+    ("astronaut", "front"),
+    ("doctor", "top"),
+    ("../uploads", "front"),
+    ("doctor", "../../etc/passwd"),
+])
+async def test_swap_rejects_unknown_templates(client, main, monkeypatch, profession, angle):
+    def fail(*args, **kwargs):
+        raise AssertionError("template cache touched for an unknown template")
+
+    monkeypatch.setattr(main.face_service.template_cache, "get_or_render", fail)
+    body = {"image_path": "/uploads/missing.jpg", "profession": profession, "angle": angle}
+    response = await client.post("/swap-face", json=body)
+    assert response.status_code == 400
+    assert response.json()["detail"] == f"Unknown template: {profession}/{angle}"
+
+    response = await client.post("/swap-face?async=1", json=body)
+    assert response.status_code == 400
+
+
+async def test_batch_rejects_unknown_templates_before_reading_the_upload(client):
+    response = await client.post("/swap-face/batch", json={
+        "image_path": "/uploads/missing.jpg",
+        "targets": [{"profession": "doctor"}, {"profession": "doctor", "angle": "top"}],
+    })
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unknown template: doctor/top"
+
+
+async def test_swap_of_missing_upload_is_not_found(client):
+    response = await client.post("/swap-face", json={"image_path": "/uploads/missing.jpg", "profession": "doctor"})
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Original image not found"
+
+
+async def test_swap_when_compute_is_busy_is_retryable(client, main, monkeypatch):
+    async def busy(*args, **kwargs):
+        raise ComputeBusyError(retry_after=7)
+
+    monkeypatch.setattr(main.face_service, "swap_face", busy)
+    response = await client.post("/swap-face", json={"image_path": "/uploads/any.jpg", "profession": "doctor"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
+
+
+async def test_swaps_reuse_the_decoded_upload(client, main):
+    assert main.face_service.executor.kind == "thread"
+
+    def sample(name, labels):
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    def counters():
+        return (
+            sample("ai_swap_stage_seconds_count", {"stage": "decode"}),
+            sample("ai_swap_source_cache_total", {"result": "miss"}),
+        )
+
+    decodes_before, misses_before = counters()
+    uploads = 3
+    for seed in range(uploads):
+        response = await client.post(
+            "/upload", files={"file": (f"face-{seed}.jpg", make_jpeg(256, 500 + seed), "image/jpeg")}
+        )
+        assert response.status_code == 200
+        file_path = response.json()["file_path"]
+        for profession in ("doctor", "artist"):
+            response = await client.post("/swap-face", json={"image_path": file_path, "profession": profession})
+            assert response.status_code == 200
+    decodes_after, misses_after = counters()
+
+    assert decodes_after - decodes_before == uploads
+    assert misses_after - misses_before == 0
+
+
+async def test_out_of_range_face_index_is_a_client_error(client):
+    response = await client.post("/upload", files={"file": ("face.jpg", make_jpeg(256, 600), "image/jpeg")})
+    assert response.status_code == 200
+    file_path = response.json()["file_path"]
+
+    response = await client.post("/swap-face", json={"image_path": file_path, "profession": "doctor", "face_index": 5})
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Face index 5 out of range")
+
+    response = await client.post("/swap-face/batch", json={
+        "image_path": file_path,
+        "targets": [{"profession": "doctor"}, {"profession": "artist", "face_index": 5}],
+    })
+    assert response.status_code == 200
+    entries = {entry["index"]: entry for entry in map(json.loads, response.text.splitlines())}
+    assert entries[0]["status"] == "completed"
+    assert entries[1]["status"] == "failed"
+    assert entries[1]["status_code"] == 400
+    assert entries[1]["error"].startswith("Face index 5 out of range")
+
+
+async def test_batch_target_reports_503_when_compute_stays_busy(client, main, monkeypatch):
+    response = await client.post("/upload", files={"file": ("face.jpg", make_jpeg(256, 610), "image/jpeg")})
+    file_path = response.json()["file_path"]
+
+    executor = main.face_service.executor
+    monkeypatch.setattr(executor, "_in_flight", executor.capacity)
+    monkeypatch.setattr(executor, "retry_after", 1)
+    monkeypatch.setattr(config, "BATCH_BUSY_WAIT", 0.2)
+    response = await client.post("/swap-face/batch", json={
+        "image_path": file_path, "targets": [{"profession": "lawyer", "angle": "side"}],
+    })
+
+    assert response.status_code == 200
+    [entry] = map(json.loads, response.text.splitlines())
+    assert entry["status"] == "failed"
+    assert entry["status_code"] == 503
+    assert entry["retry_after"] == 1
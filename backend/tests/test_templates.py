@@ -0,0 +1,31 @@
+import os
+
+from app import config
+
+
+async def test_metadata_endpoints_never_write_templates(client, workdir):
+    response = await client.get("/professions")
+    assert response.status_code == 200
+    assert any(p["id"] == "doctor" for p in response.json()["professions"])
+
+    response = await client.get("/templates/doctor")
+    assert response.status_code == 200
+    assert not any(t["available"] for t in response.json()["templates"])
+
+    written = [name for _, _, files in os.walk(workdir / "templates") for name in files]
+    assert written == []
+
+
+async def test_template_reload_requires_admin_token(client, monkeypatch):
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "")
+    assert (await client.post("/templates/reload")).status_code == 403
+
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "secret")
+    assert (await client.post("/templates/reload", headers={"X-Admin-Token": "wrong"})).status_code == 403
+    response = await client.post("/templates/reload", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+
+
+async def test_admin_routes_refused_without_token(client, monkeypatch):
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "")
+    assert (await client.get("/admin/profiles")).status_code == 403